@@ -0,0 +1,7 @@
+import os
+# 接続プールをASGI用の設定にする（アプリの読み込み前に設定する）
+os.environ.setdefault('DB_PROCESS_TYPE', 'asgi')
+from src.asgi import create_asgi_app
+
+# uvicorn asgi:app で起動する（/status・/video・/download・JSONの /process 以外はFlaskのアプリで処理する）
+app = create_asgi_app()
@@ -0,0 +1,240 @@
+"""ダウンロードエンジンのベンチマーク（ローカルのHLS/DASHフィクスチャ）
+
+合成動画からHLS・DASHのフィクスチャを生成し、ローカルのHTTPサーバーから配信して
+src.download_engine でダウンロードする。YouTubeへの接続は不要。
+
+サーバーはリクエストごとに遅延（--latency）を加えてネットワークの待ち時間を再現し、
+--fail-every N を指定するとN個ごとのセグメントで最初のリクエストだけ503を返す
+（ファイル全体ではなくフラグメント単位で再試行されることを確認する）。
+フラグメントの並列数ごとに実時間・転送量・リクエスト数・失敗させたリクエスト数をJSONで出力する。
+--bandwidth-limit を指定した場合はRedisのトークンバケットによる帯域の制限も計測する（Redisが必要）。
+
+使い方:
+    python benchmarks/download_fixtures.py --duration 120 --latency 0.05 --fragments 1 4 8
+    python benchmarks/download_fixtures.py --fail-every 5 --bandwidth-limit 2000000 --output download.json
+"""
+import argparse
+import functools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.run_benchmarks import generate_media, git_revision  # noqa: E402
+
+
+def generate_fixtures(source_path: str, fixture_dir: str, segment_seconds: float) -> dict:
+    """
+    合成動画からHLSとDASHのフィクスチャを生成する（既にあれば再利用）
+
+    Returns:
+        形式 -> フィクスチャのディレクトリからのマニフェストの相対パス
+    """
+    manifests = {'hls': 'hls/index.m3u8', 'dash': 'dash/manifest.mpd'}
+    # セグメントの長さごとにキーフレームを入れるため、映像は再エンコードする
+    encode = ['-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+              '-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds})', '-c:a', 'copy']
+    commands = {
+        'hls': [*encode, '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+                '-hls_segment_type', 'fmp4',
+                '-hls_segment_filename', os.path.join(fixture_dir, 'hls', 'segment_%05d.m4s')],
+        'dash': [*encode, '-f', 'dash', '-seg_duration', str(segment_seconds),
+                 '-use_template', '1', '-use_timeline', '1'],
+    }
+    for name, manifest in manifests.items():
+        manifest_path = os.path.join(fixture_dir, manifest)
+        if os.path.exists(manifest_path):
+            continue
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        command = ['ffmpeg', '-nostdin', '-v', 'error', '-y', '-i', source_path, *commands[name], manifest_path]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise Exception(f"{name}のフィクスチャの生成に失敗しました: {result.stderr.decode('utf-8', errors='ignore').strip()}")
+    return manifests
+
+
+class FixtureServer:
+    """遅延と一時的な失敗を加えてフィクスチャを配信するHTTPサーバー"""
+
+    def __init__(self, directory: str, latency: float, fail_every: int):
+        self.stats = {'requests': 0, 'bytes': 0, 'injected_failures': 0}
+        self._failed_paths = set()
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                time.sleep(latency)
+                with server._lock:
+                    server.stats['requests'] += 1
+                    segment = self.path.rsplit('/', 1)[-1]
+                    number = _segment_number(segment)
+                    fail = (fail_every > 0 and number >= 0 and number % fail_every == fail_every - 1
+                            and segment not in server._failed_paths)
+                    if fail:
+                        server._failed_paths.add(segment)
+                        server.stats['injected_failures'] += 1
+                if fail:
+                    self.send_error(503)
+                    return
+                super().do_GET()
+
+            def copyfile(self, source, outputfile):
+                written = 0
+                while True:
+                    chunk = source.read(64 * 1024)
+                    if not chunk:
+                        break
+                    outputfile.write(chunk)
+                    written += len(chunk)
+                with server._lock:
+                    server.stats['bytes'] += written
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=directory))
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}'
+
+    def reset(self):
+        with self._lock:
+            self.stats = {'requests': 0, 'bytes': 0, 'injected_failures': 0}
+            self._failed_paths = set()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _segment_number(filename: str) -> int:
+    """セグメントのファイル名に含まれる番号（マニフェストなど番号がないものは-1）"""
+    digits = ''.join(c for c in os.path.splitext(filename)[0] if c.isdigit())
+    return int(digits) if digits and os.path.splitext(filename)[1] in ('.ts', '.m4s') else -1
+
+
+def run_download(url: str, output_path: str, fragments: int, format_spec: str, budget=None) -> dict:
+    """ダウンロードを1回実行して計測する"""
+    import src.download_engine as download_engine
+
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    previous_budget = download_engine._budget
+    download_engine._budget = budget or download_engine.BandwidthBudget(limit=0)
+    started = time.perf_counter()
+    try:
+        download_engine.download_media(url, output_path, concurrent_fragment_downloads=fragments, format=format_spec)
+        status, error = 'ok', None
+    except Exception as e:
+        status, error = 'failed', str(e)
+    finally:
+        download_engine._budget = previous_budget
+    wall = time.perf_counter() - started
+    size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    return {
+        'status': status,
+        'error': error,
+        'wall_seconds': round(wall, 3),
+        'output_bytes': size,
+        'throughput_bytes_per_second': round(size / wall) if status == 'ok' and wall > 0 else None,
+    }
+
+
+def run_benchmarks(args) -> dict:
+    os.makedirs(args.workdir, exist_ok=True)
+    width, height = (int(value) for value in args.resolution.split('x'))
+    source_path = generate_media(
+        os.path.join(args.workdir, f'synthetic_{int(args.duration)}s_{width}x{height}_{args.fps}fps.mp4'),
+        args.duration, width, height, args.fps
+    )
+    fixture_dir = os.path.join(args.workdir, f'fixtures_{os.path.splitext(os.path.basename(source_path))[0]}')
+    manifests = generate_fixtures(source_path, fixture_dir, args.segment_seconds)
+    output_dir = tempfile.mkdtemp(prefix='download-', dir=args.workdir)
+
+    formats = {'hls': 'best', 'dash': 'bv*+ba/b'}
+    results = {
+        'version': 1,
+        'revision': git_revision(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {
+            'duration': args.duration, 'resolution': args.resolution, 'segment_seconds': args.segment_seconds,
+            'latency': args.latency, 'fail_every': args.fail_every, 'bandwidth_limit': args.bandwidth_limit,
+        },
+        'downloads': {},
+    }
+
+    try:
+        with FixtureServer(fixture_dir, args.latency, args.fail_every) as server:
+            for name in args.formats:
+                url = f'{server.base_url}/{manifests[name]}'
+                for fragments in args.fragments:
+                    server.reset()
+                    result = run_download(url, os.path.join(output_dir, f'{name}_{fragments}.mp4'),
+                                          fragments, formats[name])
+                    result.update(server.stats)
+                    results['downloads'][f'{name}_fragments_{fragments}'] = result
+                    print(f"{name} fragments={fragments}: {result['status']} {result['wall_seconds']}s "
+                          f"requests={result['requests']} injected_failures={result['injected_failures']}")
+
+                if args.bandwidth_limit:
+                    from src.download_engine import BandwidthBudget
+                    server.reset()
+                    fragments = max(args.fragments)
+                    result = run_download(url, os.path.join(output_dir, f'{name}_limited.mp4'), fragments,
+                                          formats[name], BandwidthBudget(limit=args.bandwidth_limit))
+                    result.update(server.stats)
+                    if result['status'] == 'ok':
+                        result['observed_bytes_per_second'] = round(result['bytes'] / result['wall_seconds'])
+                    results['downloads'][f'{name}_bandwidth_limited'] = result
+                    print(f"{name} bandwidth limit={args.bandwidth_limit}: {result['status']} {result['wall_seconds']}s")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ローカルのHLS/DASHフィクスチャでダウンロードエンジンを計測する')
+    parser.add_argument('--duration', type=float, default=60.0, help='合成動画の長さ（秒）')
+    parser.add_argument('--resolution', default='1280x720', help='合成動画の解像度（幅x高さ）')
+    parser.add_argument('--fps', type=int, default=30, help='合成動画のフレームレート')
+    parser.add_argument('--segment-seconds', type=float, default=2.0, help='セグメントの長さ（秒）')
+    parser.add_argument('--formats', nargs='+', default=['hls', 'dash'], choices=['hls', 'dash'], help='計測する形式')
+    parser.add_argument('--fragments', nargs='+', type=int, default=[1, 8], help='フラグメントの並列数')
+    parser.add_argument('--latency', type=float, default=0.05, help='リクエストごとの遅延（秒）')
+    parser.add_argument('--fail-every', type=int, default=0, help='N個ごとのセグメントで最初のリクエストを失敗させる')
+    parser.add_argument('--bandwidth-limit', type=float, default=0, help='帯域の上限（バイト/秒、Redisが必要）')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'ai-kirinuki-benchmark'),
+                        help='合成動画とフィクスチャの保存先')
+    parser.add_argument('--output', default=None, help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+
+    failed = [name for name, result in results['downloads'].items() if result['status'] != 'ok']
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
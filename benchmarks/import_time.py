@@ -0,0 +1,104 @@
+"""Webプロセスの起動時インポート時間のベンチマーク
+
+`python -X importtime` でWebプロセスのエントリーポイントを読み込み、
+インポートにかかった時間と、Webプロセスで読み込まれてはならない重いライブラリ
+（torch, whisper, moviepyなど）が含まれていないかを確認する。
+
+使い方:
+    python benchmarks/import_time.py                 # 結果を表示
+    python benchmarks/import_time.py --max-ms 1500   # 合計時間の上限を超えたら失敗
+    python benchmarks/import_time.py --json out.json # 結果をJSONで保存
+
+重いライブラリが読み込まれた場合、または上限を超えた場合は終了コード1を返す。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Webプロセスで読み込まれてはならないトップレベルのモジュール
+FORBIDDEN_MODULES = ['torch', 'transformers', 'whisper', 'moviepy', 'yt_dlp', 'numpy', 'boto3']
+
+
+def measure(module: str):
+    """
+    指定モジュールのインポート時間を計測する
+
+    Returns:
+        (合計時間（ミリ秒）, {トップレベルモジュール名: 累積時間（ミリ秒）},
+         {読み込まれた禁止モジュール: それを読み込んだトップレベルのインポート})
+    """
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite://')  # インメモリのSQLiteで計測
+    env['PYTHONPATH'] = ROOT_DIR + os.pathsep + env.get('PYTHONPATH', '')
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=tempfile.gettempdir(), env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"{module} のインポートに失敗しました:\n{result.stderr[-2000:]}")
+
+    top_level = {}
+    forbidden = {}
+    pending = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, raw_name = line[len('import time:'):].split('|')
+        name = raw_name.strip()
+        # 間接的に読み込まれたもの（src.tasks → src.video_processor → numpy など）も検出するため、
+        # 字下げ（インポートの階層）によらずすべての行を確認する
+        if name.split('.')[0] in FORBIDDEN_MODULES:
+            pending.append(name)
+        # 字下げが1文字のものがトップレベルのインポート（子は後ろに字下げされて先に出力される）
+        if raw_name.startswith(' ') and not raw_name.startswith('  '):
+            top_level[name] = int(cumulative_us) / 1000.0
+            for module_name in pending:
+                forbidden.setdefault(module_name, name)
+            pending = []
+
+    return sum(top_level.values()), top_level, forbidden
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Webプロセスのインポート時間を計測する')
+    parser.add_argument('--module', default='src.app', help='計測するモジュール（既定: src.app）')
+    parser.add_argument('--max-ms', type=float, default=None, help='合計インポート時間の上限（ミリ秒）')
+    parser.add_argument('--top', type=int, default=15, help='表示する上位モジュール数')
+    parser.add_argument('--json', dest='json_path', default=None, help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+
+    total_ms, top_level, forbidden_by = measure(args.module)
+    forbidden = sorted({name.split('.')[0] for name in forbidden_by})
+
+    print(f"{args.module} のインポート時間: {total_ms:.1f} ms")
+    for name, elapsed in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {elapsed:9.1f} ms  {name}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'module': args.module, 'total_ms': total_ms, 'modules': top_level,
+                       'forbidden': forbidden, 'forbidden_imported_by': forbidden_by}, f, ensure_ascii=False, indent=2)
+
+    failed = False
+    if forbidden:
+        print(f"NG: Webプロセスで重いライブラリが読み込まれています: {', '.join(forbidden)}")
+        for package in forbidden:
+            importer = next(forbidden_by[name] for name in sorted(forbidden_by) if name.split('.')[0] == package)
+            print(f"  {package}: {importer} のインポートで読み込まれています")
+        failed = True
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"NG: インポート時間が上限 {args.max_ms:.0f} ms を超えています")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
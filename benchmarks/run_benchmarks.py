@@ -0,0 +1,389 @@
+"""処理パイプライン全体のベンチマーク
+
+FFmpegのテストソース（映像: testsrc2、音声: 断続的なサイン波）から合成動画を
+ローカルで生成し、以下を計測してJSONファイルに保存する。ネットワークとGPUは不要。
+
+- ステージ単体: プロキシ作成、音声抽出、文字起こし（tinyモデル）、境界インデックス作成、
+  ハイライト解析、動画の書き出し、ストレージへの保存
+- エンドツーエンド: ダウンローダーを合成動画のコピーに置き換え、Celeryタスクチェーンを
+  eagerモードでそのまま実行（DBは作業ディレクトリのSQLite。Redisは不要）
+
+各ステージは別プロセスで実行するため、ピークメモリはステージごとの値になる。
+スループットは「処理した動画の秒数 / 実時間の秒数」。Whisperがインストールされていない
+環境では文字起こしをスキップし（エンドツーエンドでは空の結果に置き換え）、結果に記録する。
+
+使い方:
+    python benchmarks/run_benchmarks.py --duration 120 --resolution 1280x720 --output bench.json
+    python benchmarks/run_benchmarks.py --output new.json --baseline old.json --max-regression 20
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# 結果ファイルの形式のバージョン（形式を変えたら上げる）
+RESULTS_VERSION = 1
+
+# ステージ単体のベンチマークの実行順（後のステージは前のステージの出力を使用する）
+STAGES = ('proxy', 'extract_audio', 'transcribe', 'scene_index', 'analyze', 'render', 'storage')
+
+# エンドツーエンドで使用するセッションIDの接頭辞（uploads/outputsの後片付けに使用）
+SESSION_PREFIX = 'benchmark-'
+
+
+def generate_media(path: str, duration: float, width: int, height: int, fps: int) -> str:
+    """
+    合成動画を生成する（同じ設定の動画が既にあれば再利用）
+
+    音声は無音区間を挟んだサイン波にして、音量の変化がスコアに反映されるようにする。
+    """
+    if os.path.exists(path):
+        return path
+
+    temp_path = path + '.tmp.mp4'
+    command = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:beep_factor=4:sample_rate=44100:duration={duration}',
+        '-af', "volume='if(lt(mod(t,20),12),1,0.05)':eval=frame",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', '128k', '-shortest',
+        temp_path
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise Exception(f"合成動画の生成に失敗しました: {result.stderr.decode('utf-8', errors='ignore').strip()}")
+    os.replace(temp_path, path)
+    return path
+
+
+def whisper_available() -> bool:
+    """Whisperが使用可能かどうか（読み込まずに確認する）"""
+    import importlib.util
+    return importlib.util.find_spec('whisper') is not None and importlib.util.find_spec('torch') is not None
+
+
+def run_in_child(function, *args) -> dict:
+    """
+    関数をフォークした子プロセスで実行し、JSONで返された結果を受け取る
+
+    親プロセスは重いライブラリを読み込まないため、子プロセスのピークメモリは
+    そのステージで読み込んだもの（とFFmpegなどの子プロセス）だけを反映する。
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            result = function(*args)
+        except Exception as e:
+            result = {'status': 'failed', 'error': str(e), 'traceback': traceback.format_exc()}
+        with os.fdopen(write_fd, 'w') as f:
+            json.dump(result, f)
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    if not data:
+        return {'status': 'failed', 'error': '子プロセスが結果を返さずに終了しました'}
+    return json.loads(data)
+
+
+def _run_stage(stage: str, context: dict) -> dict:
+    """ステージを1つ実行して計測結果と次のステージへの出力を返す（子プロセスで実行される）"""
+    from src.instrumentation import measure_stage
+
+    timings = {}
+    outputs = {}
+
+    if stage == 'proxy':
+        from src.media_proxy import ensure_analysis_proxy
+        with measure_stage(stage, timings):
+            outputs['proxy_path'] = ensure_analysis_proxy(context['source_path'])
+
+    elif stage == 'extract_audio':
+        from src.transcription import extract_audio
+        with measure_stage(stage, timings):
+            outputs['audio_path'] = extract_audio(context['proxy_path'])
+
+    elif stage == 'transcribe':
+        from src.transcription import load_whisper_model, transcribe_audio_chunks
+        # モデルの読み込みは別に計測する（ワーカーでは起動時に読み込み済み）
+        with measure_stage('model_load', timings):
+            load_whisper_model()
+        segments = []
+        with measure_stage(stage, timings):
+            for _, chunk_segments in transcribe_audio_chunks(context['audio_path']):
+                segments.extend(chunk_segments)
+        outputs['segments'] = segments
+
+    elif stage == 'scene_index':
+        from src.scene_index import build_boundary_index
+        with measure_stage(stage, timings):
+            outputs['boundary_index'] = build_boundary_index(context['proxy_path'], context.get('segments'))
+
+    elif stage == 'analyze':
+        from src.video_processor import get_video_highlights
+        with measure_stage(stage, timings):
+            highlights = get_video_highlights(context['proxy_path'],
+                                              transcript_segments=context.get('segments'),
+                                              boundary_index=context.get('boundary_index'))
+        outputs['highlights'] = [list(highlight) for highlight in highlights]
+
+    elif stage == 'render':
+        from src.video_processor import process_video
+        highlights = [(start, end) for start, end, _ in context['highlights']]
+        with measure_stage(stage, timings):
+            outputs['render_path'] = process_video(context['source_path'], highlights,
+                                                   context['workdir'], 'benchmark-render')
+
+    elif stage == 'storage':
+        from src.storage_utils import StorageManager
+        storage = StorageManager(use_s3=False)
+        filename = f"{SESSION_PREFIX}storage.mp4"
+        with measure_stage(stage, timings):
+            storage.save_output_file(context['render_path'], filename)
+        storage.delete_file(filename)
+
+    else:
+        raise ValueError(f"未対応のステージです: {stage}")
+
+    return {'status': 'success', 'timings': timings, 'outputs': outputs}
+
+
+def _run_end_to_end(context: dict, stub_transcription: bool) -> dict:
+    """ダウンローダーを差し替えてCeleryタスクチェーンをeagerモードで実行する（子プロセスで実行される）"""
+    # 前回の計測のDBは使わない（スキーマが変わっている場合があるため）
+    db_path = os.path.join(context['workdir'], 'benchmark.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+
+    import src.tasks
+    import src.transcription
+    from src.app import app
+    from src.models import db, Video, ProcessLog, ProcessStatus
+    from src.instrumentation import measure_stage
+
+    src.tasks.celery.conf.task_always_eager = True
+
+    def stub_download(youtube_url, output_dir, session_id, storage_manager=None, preview=False, **kwargs):
+        path = os.path.join(output_dir, f"{session_id}.mp4")
+        shutil.copyfile(context['source_path'], path)
+        return path
+
+    def stub_metadata(video, youtube_url):
+        video.title = 'benchmark'
+        video.duration = int(context['media_seconds'])
+
+    src.tasks.download_video = stub_download
+    # 合成動画は全体をコピーするため、2段階ダウンロード（書き出し時の区間の取得）は使用しない
+    src.tasks.TWO_PHASE_DOWNLOAD = False
+    src.tasks.extract_metadata = stub_metadata
+
+    def stub_transcription_chunks(audio_path, offset=0.0, **kwargs):
+        os.remove(audio_path)
+        yield offset + context['media_seconds'], []
+
+    if stub_transcription:
+        src.transcription.transcribe_audio_chunks = stub_transcription_chunks
+
+    session_id = f"{SESSION_PREFIX}{os.getpid()}"
+    timings = {}
+    try:
+        with app.app_context():
+            video = Video(youtube_url='https://www.youtube.com/watch?v=benchmark0', session_id=session_id,
+                          status=ProcessStatus.PENDING, progress=0)
+            db.session.add(video)
+            db.session.commit()
+
+            with measure_stage('end_to_end', timings):
+                src.tasks.process_video_task.delay(video.id)
+
+            db.session.expire_all()
+            video = db.session.get(Video, video.id)
+            stage_timings = {}
+            for log in ProcessLog.query.filter_by(video_id=video.id).order_by(ProcessLog.id).all():
+                stage_timings.update(log.get_details().get('timings', {}))
+
+            return {
+                'status': 'success' if video.status == ProcessStatus.COMPLETED else 'failed',
+                'error': video.error_message,
+                'timings': timings,
+                'stage_timings': stage_timings,
+                'highlights_count': len(video.highlights),
+            }
+    finally:
+        for folder in ('uploads', 'outputs'):
+            for path in glob.glob(os.path.join(ROOT_DIR, folder, f"{session_id}*")):
+                os.remove(path)
+
+
+def add_throughput(timing: dict, media_seconds: float) -> dict:
+    """計測結果にスループット（動画の秒数 / 実時間の秒数）を追加する"""
+    wall = timing.get('wall_seconds') or 0.0
+    timing['throughput'] = round(media_seconds / wall, 2) if wall > 0 else None
+    return timing
+
+
+def git_revision() -> str:
+    """計測したコミット（未コミットの変更がある場合は -dirty を付ける）"""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT_DIR,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.strip()
+        return revision + ('-dirty' if dirty else '')
+    except FileNotFoundError:
+        return 'unknown'
+
+
+def run_benchmarks(args) -> dict:
+    """合成動画を生成して、ステージ単体とエンドツーエンドのベンチマークを実行する"""
+    os.environ['WHISPER_MODEL_SIZE'] = args.whisper_model
+    width, height = (int(value) for value in args.resolution.lower().split('x'))
+    os.makedirs(args.workdir, exist_ok=True)
+
+    media_name = f"synthetic_{int(args.duration)}s_{width}x{height}_{args.fps}fps.mp4"
+    source_path = generate_media(os.path.join(args.workdir, media_name), args.duration, width, height, args.fps)
+
+    # キャッシュされたプロキシが残っていると作成時間を計測できないため削除する
+    from src.media_proxy import proxy_path_for
+    if os.path.exists(proxy_path_for(source_path)):
+        os.remove(proxy_path_for(source_path))
+
+    transcription = 'whisper' if whisper_available() else 'skipped'
+    context = {'source_path': source_path, 'workdir': args.workdir, 'media_seconds': args.duration}
+    stages = {}
+
+    for stage in args.stages:
+        if stage == 'transcribe' and transcription == 'skipped':
+            stages[stage] = {'status': 'skipped', 'reason': 'whisperがインストールされていません'}
+            print(f"{stage:>14}: スキップ（whisperがインストールされていません）")
+            continue
+
+        result = run_in_child(_run_stage, stage, context)
+        if result['status'] != 'success':
+            stages[stage] = result
+            print(f"{stage:>14}: 失敗 {result.get('error')}")
+            break
+
+        context.update(result['outputs'])
+        for name, timing in result['timings'].items():
+            stages[name] = add_throughput(timing, args.duration)
+            print(f"{name:>14}: {timing['wall_seconds']:8.2f}s  x{timing['throughput'] or 0:7.1f}  "
+                  f"peak RSS {timing['peak_rss_bytes'] / 2**20:7.0f}MB")
+
+    end_to_end = None
+    if not args.skip_end_to_end:
+        end_to_end = run_in_child(_run_end_to_end, context, transcription == 'skipped')
+        if end_to_end.get('timings', {}).get('end_to_end'):
+            add_throughput(end_to_end['timings']['end_to_end'], args.duration)
+            timing = end_to_end['timings']['end_to_end']
+            print(f"{'end_to_end':>14}: {timing['wall_seconds']:8.2f}s  x{timing['throughput'] or 0:7.1f}  "
+                  f"peak RSS {timing['peak_rss_bytes'] / 2**20:7.0f}MB  ({end_to_end['status']})")
+        else:
+            print(f"{'end_to_end':>14}: 失敗 {end_to_end.get('error')}")
+
+    for path in (context.get('audio_path'), context.get('render_path')):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    return {
+        'version': RESULTS_VERSION,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'revision': git_revision(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'media': {'duration': args.duration, 'width': width, 'height': height, 'fps': args.fps},
+        'transcription': transcription if transcription == 'skipped' else f"whisper-{args.whisper_model}",
+        'stages': stages,
+        'end_to_end': end_to_end,
+    }
+
+
+def _throughputs(results: dict) -> dict:
+    """結果ファイルから名前ごとのスループットを取り出す"""
+    values = {name: stage.get('throughput') for name, stage in results.get('stages', {}).items()}
+    end_to_end = (results.get('end_to_end') or {}).get('timings', {}).get('end_to_end')
+    if end_to_end:
+        values['end_to_end'] = end_to_end.get('throughput')
+    return {name: value for name, value in values.items() if value}
+
+
+def compare_results(baseline: dict, current: dict, max_regression: float = None) -> bool:
+    """
+    2つの結果のスループットを比較して表示する
+
+    Returns:
+        スループットの低下がすべてmax_regression（%）以内であればTrue
+    """
+    if baseline.get('media') != current.get('media'):
+        print(f"注意: 合成動画の設定が異なります（{baseline.get('media')} / {current.get('media')}）")
+
+    print(f"{'stage':>14}  {baseline.get('revision', '?'):>12}  {current.get('revision', '?'):>12}  change")
+    ok = True
+    old, new = _throughputs(baseline), _throughputs(current)
+    for name in [name for name in new if name in old]:
+        change = (new[name] - old[name]) / old[name] * 100.0
+        regressed = max_regression is not None and change < -max_regression
+        ok = ok and not regressed
+        print(f"{name:>14}  x{old[name]:11.1f}  x{new[name]:11.1f}  {change:+6.1f}%{'  <- 低下' if regressed else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='合成動画で処理パイプラインのベンチマークを実行する')
+    parser.add_argument('--duration', type=float, default=60.0, help='合成動画の長さ（秒）')
+    parser.add_argument('--resolution', default='1280x720', help='合成動画の解像度（幅x高さ）')
+    parser.add_argument('--fps', type=int, default=30, help='合成動画のフレームレート')
+    parser.add_argument('--whisper-model', default='tiny', help='文字起こしに使用するWhisperモデル')
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=STAGES, help='実行するステージ')
+    parser.add_argument('--skip-end-to-end', action='store_true', help='エンドツーエンドの計測を行わない')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'ai-kirinuki-benchmark'),
+                        help='合成動画と中間ファイルの保存先')
+    parser.add_argument('--output', default=None, help='結果を保存するJSONファイル')
+    parser.add_argument('--baseline', default=None, help='比較対象の結果ファイル')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='許容するスループットの低下（%%）。超えた場合は終了コード1')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='ベンチマークを実行せずに2つの結果ファイルを比較する')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        sys.exit(0 if compare_results(baseline, current, args.max_regression) else 1)
+
+    results = run_benchmarks(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if not compare_results(baseline, results, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
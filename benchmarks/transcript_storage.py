@@ -0,0 +1,143 @@
+"""文字起こしの保存形式（セグメントごとの行 / 動画ごとの配列）の比較
+
+合成した文字起こしセグメント（既定は3時間分）をSQLiteに保存し、保存形式ごとに
+データベースのサイズ・全セグメントの読み込み時間・時間範囲の取り出し時間・/detail の応答時間を計測する。
+ネットワーク・Redis・FFmpegは不要。
+
+使い方:
+    python benchmarks/transcript_storage.py --hours 3 --segment-seconds 4
+    python benchmarks/transcript_storage.py --output transcript.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# 合成テキストに使用する文字（ひらがな・カタカナ・漢字・記号）
+_CHARACTERS = 'あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん' \
+              'アイウエオカキクケコサシスセソ今日配信動画最高面白発表新作ゲーム実況、。！？'
+
+
+def synthetic_segments(hours: float, segment_seconds: float, seed: int = 0):
+    """一定の長さのセグメントと、ランダムな日本語風のテキストを生成する"""
+    rng = random.Random(seed)
+    position = 0.0
+    segments = []
+    while position < hours * 3600:
+        length = segment_seconds * rng.uniform(0.5, 1.5)
+        text = ''.join(rng.choice(_CHARACTERS) for _ in range(int(length * rng.uniform(4, 8))))
+        segments.append({'start_time': round(position, 2), 'end_time': round(position + length, 2), 'text': text})
+        position += length
+    return segments
+
+
+def _timed(function, repeat: int) -> float:
+    """function を repeat 回実行した実時間の中央値（ミリ秒）"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+def run_scenario(storage: str, segments, args) -> dict:
+    """指定した保存形式でセグメントを保存して計測する（設定を持ち越さないよう子プロセスで実行する）"""
+    workdir = tempfile.mkdtemp(prefix='transcript-')
+    db_path = os.path.join(workdir, 'kirinuki.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['TRANSCRIPT_STORAGE'] = storage
+    try:
+        from src.app import app
+        from src.models import db, Video, ProcessStatus, TranscriptSegment
+        from src.transcript_store import is_packed_storage, load_segments, pack_video_transcript
+
+        with app.app_context():
+            video = Video(youtube_url='https://www.youtube.com/watch?v=benchmark', session_id=str(uuid.uuid4()),
+                          status=ProcessStatus.COMPLETED, progress=100, duration=args.hours * 3600)
+            db.session.add(video)
+            db.session.commit()
+            rows = [TranscriptSegment(video_id=video.id, **segment) for segment in segments]
+            db.session.add_all(rows)
+            video.transcript = ''.join(segment['text'] for segment in segments)
+            db.session.commit()
+            if is_packed_storage():
+                pack_video_transcript(video, rows)
+                db.session.commit()
+            db.session.execute(db.text('VACUUM'))
+            session_id, video_id = video.session_id, video.id
+
+        def load_all():
+            with app.app_context():
+                load_segments(db.session.get(Video, video_id))
+
+        def load_window():
+            with app.app_context():
+                load_segments(db.session.get(Video, video_id), args.hours * 1800, args.hours * 1800 + 600)
+
+        client = app.test_client()
+        return {
+            'storage': storage,
+            'db_bytes': os.path.getsize(db_path),
+            'load_all_ms': _timed(load_all, args.repeat),
+            'load_window_ms': _timed(load_window, args.repeat),
+            'detail_ms': _timed(lambda: client.get(f'/detail/{session_id}?t={int(args.hours * 1800)}'), args.repeat),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_in_child(storage: str, segments, args) -> dict:
+    """子プロセスで計測し、結果をパイプで受け取る"""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            result = run_scenario(storage, segments, args)
+        except Exception as e:
+            result = {'storage': storage, 'error': str(e)}
+        with os.fdopen(write_fd, 'w') as f:
+            json.dump(result, f)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='文字起こしの保存形式ごとのサイズと読み込み時間を計測する')
+    parser.add_argument('--hours', type=float, default=3.0, help='合成する文字起こしの長さ（時間）')
+    parser.add_argument('--segment-seconds', type=float, default=4.0, help='セグメントの平均の長さ（秒）')
+    parser.add_argument('--repeat', type=int, default=5, help='各計測の繰り返し回数')
+    parser.add_argument('--output', default=None, help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+
+    segments = synthetic_segments(args.hours, args.segment_seconds)
+    results = {
+        'config': {'hours': args.hours, 'segment_seconds': args.segment_seconds, 'segments': len(segments)},
+        'scenarios': [run_in_child(storage, segments, args) for storage in ('rows', 'packed')],
+    }
+    for result in results['scenarios']:
+        print(json.dumps(result, ensure_ascii=False))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    sys.exit(1 if any('error' in result for result in results['scenarios']) else 0)
+
+
+if __name__ == '__main__':
+    main()
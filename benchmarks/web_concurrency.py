@@ -0,0 +1,245 @@
+"""Webの同時接続数の比較（gunicorn（WSGI） / uvicorn（ASGI））
+
+受信の遅いクライアント（動画のストリーミングを少しずつ読むクライアント）が接続を保持している間に、
+/status へのリクエストがどれだけ応答されるか（成功数と応答時間）を、保持する接続の数ごとに計測する。
+WSGIの同期ワーカーでは配信中の接続がワーカー（スレッド）を占有するため、接続数がワーカー数を超えると
+/status が応答されなくなる。ASGIでは配信中の接続はイベントループ上で待機するため、/status は応答され続ける。
+
+サーバーはモード・接続数ごとに作業ディレクトリのSQLiteで起動し直す。Redisは不要（進捗の読み取りは失敗して無視される）。
+
+使い方:
+    python benchmarks/web_concurrency.py --holders 0 8 64 512 --workers 2 --threads 4
+    python benchmarks/web_concurrency.py --modes asgi --holders 1000 --hold 20 --output web.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# 出力ファイルのセッションIDの接頭辞（outputs/の後片付けに使用）
+SESSION_PREFIX = 'benchmark-'
+
+# 配信する動画のサイズ（ソケットのバッファより十分大きくし、配信中の接続がサーバー側で待機するようにする）
+VIDEO_BYTES = 64 * 1024 * 1024
+
+# 受信の遅いクライアントのソケットの受信バッファ
+SLOW_RCVBUF = 4096
+
+
+def seed_database(db_path: str) -> dict:
+    """完了した動画（配信用）と処理中の動画（/status用）を登録する"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    from src.app import app
+    from src.models import db, Video, ProcessLog, ProcessStatus
+
+    session_ids = {'completed': f"{SESSION_PREFIX}{uuid.uuid4()}", 'processing': f"{SESSION_PREFIX}{uuid.uuid4()}"}
+    with app.app_context():
+        for kind, status in (('completed', ProcessStatus.COMPLETED), ('processing', ProcessStatus.TRANSCRIBING)):
+            video = Video(youtube_url='https://www.youtube.com/watch?v=benchmark', session_id=session_ids[kind],
+                          title='benchmark', status=status, progress=40)
+            db.session.add(video)
+            db.session.flush()
+            db.session.add(ProcessLog(video_id=video.id, status=status, message='benchmark'))
+        db.session.commit()
+
+    # 中身は配信の計測に関係しないため、スパースファイルにする
+    video_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{session_ids['completed']}.mp4")
+    with open(video_path, 'wb') as f:
+        f.truncate(VIDEO_BYTES)
+    session_ids['video_path'] = video_path
+    return session_ids
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode: str, port: int, args, env: dict) -> subprocess.Popen:
+    """サーバーを起動する（ログは作業ディレクトリに保存する）"""
+    if mode == 'wsgi':
+        command = ['gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+                   '--threads', str(args.threads), '--timeout', '120', 'run:app']
+    else:
+        command = ['uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                   '--workers', str(args.workers), '--no-access-log']
+    log = open(os.path.join(args.workdir, f'{mode}-{port}.log'), 'w')
+    return subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_server(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def http_get(port: int, path: str, timeout: float, rcvbuf: int = 0):
+    """GETリクエストの接続を開いて送信する（rcvbuf を指定した場合は受信バッファを小さくする）"""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket()
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.setblocking(False)
+    await asyncio.wait_for(loop.sock_connect(sock, ('127.0.0.1', port)), timeout)
+    reader, writer = await asyncio.open_connection(sock=sock, limit=max(rcvbuf, 65536))
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode('ascii'))
+    await writer.drain()
+    return reader, writer
+
+
+async def probe(port: int, path: str, timeout: float):
+    """リクエストを1回送信し、応答を最後まで受信するまでの時間（秒）を返す（失敗した場合はNone）"""
+    started = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await http_get(port, path, timeout)
+        response = await asyncio.wait_for(reader.read(), max(0.0, timeout - (time.perf_counter() - started)))
+        if not response.startswith(b'HTTP/1.1 200'):
+            return None
+        return time.perf_counter() - started
+    except (asyncio.TimeoutError, OSError):
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def hold(port: int, path: str, seconds: float, timeout: float, established: list):
+    """動画の配信を受け始めてから、受信せずに接続を保持する（受信の遅いクライアント）"""
+    writer = None
+    try:
+        reader, writer = await http_get(port, path, timeout, rcvbuf=SLOW_RCVBUF)
+        first = await asyncio.wait_for(reader.read(SLOW_RCVBUF), timeout)
+        if first.startswith(b'HTTP/1.1 200'):
+            established.append(True)
+        await asyncio.sleep(seconds)
+    except (asyncio.TimeoutError, OSError):
+        pass
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def measure(port: int, session_ids: dict, holders: int, args) -> dict:
+    """holders 個の接続を保持した状態で、/status へのリクエストを計測する"""
+    established = []
+    holding = [asyncio.ensure_future(hold(port, f"/video/{session_ids['completed']}", args.hold, args.timeout,
+                                          established)) for _ in range(holders)]
+    await asyncio.sleep(args.settle)
+
+    status_path = f"/status/{session_ids['processing']}"
+    results = await asyncio.gather(*[probe(port, status_path, args.timeout) for _ in range(args.probes)])
+    latencies = sorted(result * 1000 for result in results if result is not None)
+
+    for task in holding:
+        task.cancel()
+    await asyncio.gather(*holding, return_exceptions=True)
+
+    summary = {'holders': holders, 'established': len(established), 'probes': args.probes, 'ok': len(latencies)}
+    if latencies:
+        summary.update({
+            'p50_ms': round(statistics.median(latencies), 1),
+            'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+            'max_ms': round(latencies[-1], 1),
+        })
+    return summary
+
+
+async def wait_ready(port: int, path: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await probe(port, path, 1.0) is not None:
+            return
+        await asyncio.sleep(0.2)
+    raise Exception(f"サーバーが起動しませんでした（ポート {port}）")
+
+
+def run_mode(mode: str, session_ids: dict, args, env: dict) -> list:
+    """モードごとに、保持する接続の数を変えて計測する（計測ごとにサーバーを起動し直す）"""
+    results = []
+    for holders in args.holders:
+        port = _free_port()
+        process = start_server(mode, port, args, env)
+        try:
+            asyncio.run(wait_ready(port, f"/status/{session_ids['processing']}"))
+            result = {'mode': mode, **asyncio.run(measure(port, session_ids, holders, args))}
+        except Exception as e:
+            result = {'mode': mode, 'holders': holders, 'error': str(e)}
+        finally:
+            stop_server(process)
+        print(json.dumps(result, ensure_ascii=False))
+        results.append(result)
+    return results
+
+
+def _raise_fd_limit(required: int):
+    """保持する接続の数だけファイルディスクリプタを使えるようにする（サーバーの子プロセスにも引き継がれる）"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = required if hard == resource.RLIM_INFINITY else min(required, hard)
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WSGIとASGIの同時接続数を比較する')
+    parser.add_argument('--modes', nargs='+', choices=('wsgi', 'asgi'), default=['wsgi', 'asgi'])
+    parser.add_argument('--holders', nargs='+', type=int, default=[0, 8, 64, 512],
+                        help='保持する配信中の接続の数')
+    parser.add_argument('--workers', type=int, default=2, help='サーバーのプロセス数')
+    parser.add_argument('--threads', type=int, default=4, help='gunicornの1プロセスあたりのスレッド数')
+    parser.add_argument('--probes', type=int, default=50, help='/status へ同時に送信するリクエストの数')
+    parser.add_argument('--hold', type=float, default=15.0, help='接続を保持する時間（秒）')
+    parser.add_argument('--settle', type=float, default=2.0, help='接続を開いてから計測を始めるまでの時間（秒）')
+    parser.add_argument('--timeout', type=float, default=5.0, help='1リクエストのタイムアウト（秒）')
+    parser.add_argument('--output', default=None, help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+
+    _raise_fd_limit(max(args.holders) * 2 + args.probes + 256)
+    args.workdir = tempfile.mkdtemp(prefix='web-concurrency-')
+    session_ids = seed_database(os.path.join(args.workdir, 'kirinuki.db'))
+    env = dict(os.environ,
+               PYTHONPATH=ROOT_DIR,
+               DATABASE_URL=os.environ['DATABASE_URL'],
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(args.workdir, 'metrics'),
+               # 接続できないRedisを指定し、進捗の読み取りをすぐに失敗させる
+               CELERY_BROKER_URL='redis://127.0.0.1:1/0',
+               PROGRESS_REDIS_URL='redis://127.0.0.1:1/0')
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'])
+
+    results = {
+        'config': {'workers': args.workers, 'threads': args.threads, 'probes': args.probes, 'hold': args.hold,
+                   'timeout': args.timeout},
+        'scenarios': [],
+    }
+    try:
+        for mode in args.modes:
+            results['scenarios'].extend(run_mode(mode, session_ids, args, env))
+    finally:
+        os.remove(session_ids['video_path'])
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    sys.exit(1 if any('error' in result for result in results['scenarios']) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""ワーカーの子プロセスあたりのメモリ使用量の計測
+
+Celeryのプリフォークと同じようにプロセスをフォークし、モデルを
+(a) 各子プロセスで読み込む場合 と (b) フォーク前の親プロセスで読み込んで共有する場合
+の子プロセスごとのメモリ使用量（/proc/<pid>/smaps_rollup の Rss / Pss / Private）を比較する。
+ブローカー（Redis）は不要。Linuxでのみ動作する。
+
+使い方:
+    python benchmarks/worker_memory.py --children 4
+    WHISPER_MODEL_SIZE=tiny python benchmarks/worker_memory.py --json memory.json
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+
+def read_memory(pid: int) -> dict:
+    """プロセスのメモリ使用量（MB）を取得する"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].rstrip(':') in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024.0
+    return {
+        'rss_mb': values.get('Rss', 0.0),
+        'pss_mb': values.get('Pss', 0.0),
+        'private_mb': values.get('Private_Clean', 0.0) + values.get('Private_Dirty', 0.0),
+    }
+
+
+def run_scenario(children: int, preload_in_parent: bool) -> dict:
+    """子プロセスをフォークしてメモリ使用量を計測する（計測は別プロセスで行い、状態を持ち越さない）"""
+    read_fd, write_fd = os.pipe()
+    runner = os.fork()
+    if runner == 0:
+        os.close(read_fd)
+        from src.worker_bootstrap import preload_worker_resources
+
+        if preload_in_parent:
+            preload_worker_resources()
+            gc.collect()
+            gc.freeze()
+
+        pids = []
+        for _ in range(children):
+            pid = os.fork()
+            if pid == 0:
+                # 子プロセス: worker_process_init と同じく読み込み（親で読み込み済みなら何もしない）
+                preload_worker_resources()
+                time.sleep(3600)
+                os._exit(0)
+            pids.append(pid)
+
+        # 子プロセスの読み込み完了を待ってから計測
+        time.sleep(5 if preload_in_parent else 5 + children * 2)
+        per_child = [read_memory(pid) for pid in pids]
+        for pid in pids:
+            os.kill(pid, 9)
+            os.waitpid(pid, 0)
+
+        result = {
+            'preload_in_parent': preload_in_parent,
+            'children': children,
+            'parent': read_memory(os.getpid()),
+            'per_child': per_child,
+            'total_pss_mb': sum(child['pss_mb'] for child in per_child) + read_memory(os.getpid())['pss_mb'],
+        }
+        os.write(write_fd, json.dumps(result).encode())
+        os.close(write_fd)
+        os._exit(0)
+
+    os.close(write_fd)
+    data = b''
+    while True:
+        chunk = os.read(read_fd, 65536)
+        if not chunk:
+            break
+        data += chunk
+    os.close(read_fd)
+    os.waitpid(runner, 0)
+    return json.loads(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ワーカーの子プロセスあたりのメモリ使用量を計測する')
+    parser.add_argument('--children', type=int, default=2, help='子プロセス数（--concurrency相当）')
+    parser.add_argument('--json', dest='json_path', default=None, help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+
+    results = [run_scenario(args.children, preload_in_parent=False),
+               run_scenario(args.children, preload_in_parent=True)]
+
+    for result in results:
+        label = '親プロセスで共有読み込み' if result['preload_in_parent'] else '子プロセスごとに読み込み'
+        print(f"[{label}] 子プロセス数={result['children']}")
+        for index, child in enumerate(result['per_child']):
+            print(f"  child{index}: RSS={child['rss_mb']:.0f}MB PSS={child['pss_mb']:.0f}MB "
+                  f"Private={child['private_mb']:.0f}MB")
+        print(f"  合計PSS（親を含む）: {result['total_pss_mb']:.0f}MB")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
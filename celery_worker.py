@@ -1,17 +1,31 @@
+import os
+# 接続プールをワーカー用の設定にする（アプリの読み込み前に設定する）
+os.environ.setdefault('DB_PROCESS_TYPE', 'worker')
 from src.app import app
 from src.tasks import celery
-from celery.schedules import crontab
 from src.tasks import monitor_failed_tasks
+from src.recovery import MONITOR_INTERVAL
+from src.workspace import CLEANUP_INTERVAL
+from src.download_engine import DOWNLOAD_QUEUE
+# ワーカー起動時のモデル事前読み込み・ウォームアップ（シグナルを登録する）
+import src.worker_bootstrap  # noqa: F401
 
 # 定期実行タスクの設定
 celery.conf.beat_schedule = {
     'monitor-failed-tasks': {
         'task': 'src.tasks.monitor_failed_tasks',
-        'schedule': crontab(minute='*/30'),  # 30分ごとに実行
+        # ハートビートが途絶えたジョブを数十秒で検出できるよう、短い間隔で実行する
+        # （候補の検索は1回のクエリのため、頻繁に実行しても負荷は小さい）
+        'schedule': MONITOR_INTERVAL,
+    },
+    'cleanup-workspace': {
+        'task': 'src.tasks.cleanup_workspace',
+        # 古い一時ファイルの削除と、ディスク容量の上限の確認
+        'schedule': CLEANUP_INTERVAL,
     },
 }
 
 if __name__ == '__main__':
     with app.app_context():
-        # celery worker と beat を同時に起動
-        celery.worker_main(['worker', '--loglevel=info', '-B'])
\ No newline at end of file
+        # celery worker と beat を同時に起動（1台で動かす場合はダウンロード用のキューも処理する）
+        celery.worker_main(['worker', '--loglevel=info', '-B', '-Q', f'default,{DOWNLOAD_QUEUE}'])
\ No newline at end of file
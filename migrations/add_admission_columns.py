@@ -0,0 +1,28 @@
+"""add admission columns
+
+Revision ID: 8a7d6c9e0f1b
+Revises: 7f6c5b8d9e0a
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '8a7d6c9e0f1b'
+down_revision = '7f6c5b8d9e0a'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Videoテーブルにリクエスト元のクライアントと見積もり処理時間のカラムを追加
+    op.add_column('videos', sa.Column('client_id', sa.String(length=64), nullable=True))
+    op.add_column('videos', sa.Column('estimated_cost', sa.Float(), nullable=True))
+    
+    # クライアントごとの処理中のジョブの集計用のインデックス
+    op.create_index('ix_videos_client_id_status', 'videos', ['client_id', 'status'])
+
+def downgrade():
+    op.drop_index('ix_videos_client_id_status', table_name='videos')
+    op.drop_column('videos', 'estimated_cost')
+    op.drop_column('videos', 'client_id')
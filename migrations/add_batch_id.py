@@ -0,0 +1,24 @@
+"""add batch_id
+
+Revision ID: 9b8e7d0f1a2c
+Revises: 8a7d6c9e0f1b
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9b8e7d0f1a2c'
+down_revision = '8a7d6c9e0f1b'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Videoテーブルに一括登録のバッチIDのカラムを追加
+    op.add_column('videos', sa.Column('batch_id', sa.String(length=36), nullable=True))
+    op.create_index('ix_videos_batch_id', 'videos', ['batch_id'])
+
+def downgrade():
+    op.drop_index('ix_videos_batch_id', table_name='videos')
+    op.drop_column('videos', 'batch_id')
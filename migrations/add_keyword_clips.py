@@ -0,0 +1,28 @@
+"""add keyword clips
+
+Revision ID: df2c1b4e5a6b
+Revises: ce1b0a3d4f5a
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'df2c1b4e5a6b'
+down_revision = 'ce1b0a3d4f5a'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Videoテーブルにキーワードから作成した切り抜きの元動画と検索語句のカラムを追加
+    op.add_column('videos', sa.Column('source_video_id', sa.Integer(), nullable=True))
+    op.add_column('videos', sa.Column('clip_keywords', sa.String(length=255), nullable=True))
+    op.create_foreign_key('fk_videos_source_video_id', 'videos', 'videos', ['source_video_id'], ['id'])
+    op.create_index('ix_videos_source_video_id', 'videos', ['source_video_id'])
+
+def downgrade():
+    op.drop_index('ix_videos_source_video_id', table_name='videos')
+    op.drop_constraint('fk_videos_source_video_id', 'videos', type_='foreignkey')
+    op.drop_column('videos', 'clip_keywords')
+    op.drop_column('videos', 'source_video_id')
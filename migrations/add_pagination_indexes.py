@@ -0,0 +1,29 @@
+"""add pagination indexes
+
+Revision ID: e03d2c5f6b7c
+Revises: df2c1b4e5a6b
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e03d2c5f6b7c'
+down_revision = 'df2c1b4e5a6b'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 履歴一覧のキーセット方式のページ分割用のインデックス
+    op.create_index('ix_videos_created_at_id', 'videos', ['created_at', 'id'])
+    op.create_index('ix_videos_status_created_at_id', 'videos', ['status', 'created_at', 'id'])
+    # 詳細ページの処理ログ・ハイライトの取得用のインデックス
+    op.create_index('ix_process_logs_video_id_created_at_id', 'process_logs', ['video_id', 'created_at', 'id'])
+    op.create_index('ix_highlights_video_id_start_time', 'highlights', ['video_id', 'start_time'])
+
+def downgrade():
+    op.drop_index('ix_highlights_video_id_start_time', table_name='highlights')
+    op.drop_index('ix_process_logs_video_id_created_at_id', table_name='process_logs')
+    op.drop_index('ix_videos_status_created_at_id', table_name='videos')
+    op.drop_index('ix_videos_created_at_id', table_name='videos')
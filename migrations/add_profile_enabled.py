@@ -0,0 +1,23 @@
+"""add profile enabled
+
+Revision ID: 5d4a3f6b7c8e
+Revises: 4c3f2e5a6b7d
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5d4a3f6b7c8e'
+down_revision = '4c3f2e5a6b7d'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Videoテーブルにプロファイリングの有効・無効のカラムを追加
+    op.add_column('videos', sa.Column('profile_enabled', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+def downgrade():
+    # Videoテーブルからプロファイリングの有効・無効のカラムを削除
+    op.drop_column('videos', 'profile_enabled')
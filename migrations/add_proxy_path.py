@@ -0,0 +1,23 @@
+"""add proxy path
+
+Revision ID: 4c3f2e5a6b7d
+Revises: 3b2e1d4f5a6c
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4c3f2e5a6b7d'
+down_revision = '3b2e1d4f5a6c'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Videoテーブルに解析用プロキシ動画のパスのカラムを追加
+    op.add_column('videos', sa.Column('proxy_path', sa.String(length=255), nullable=True))
+
+def downgrade():
+    # Videoテーブルから解析用プロキシ動画のパスのカラムを削除
+    op.drop_column('videos', 'proxy_path')
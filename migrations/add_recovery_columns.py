@@ -0,0 +1,28 @@
+"""add recovery columns
+
+Revision ID: 7f6c5b8d9e0a
+Revises: 6e5b4a7c8d9f
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7f6c5b8d9e0a'
+down_revision = '6e5b4a7c8d9f'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Videoテーブルに自動リカバリーの再開回数とハートビートのカラムを追加
+    op.add_column('videos', sa.Column('retry_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('videos', sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+    
+    # 監視タスクの候補検索用のインデックス
+    op.create_index('ix_videos_status_heartbeat_at', 'videos', ['status', 'heartbeat_at'])
+
+def downgrade():
+    op.drop_index('ix_videos_status_heartbeat_at', table_name='videos')
+    op.drop_column('videos', 'heartbeat_at')
+    op.drop_column('videos', 'retry_count')
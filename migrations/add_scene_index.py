@@ -0,0 +1,23 @@
+"""add scene index
+
+Revision ID: 2a1f0c3d4e5b
+Revises: 1234567890ab
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '2a1f0c3d4e5b'
+down_revision = '1234567890ab'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Videoテーブルにシーン境界インデックスのカラムを追加
+    op.add_column('videos', sa.Column('scene_index', sa.Text(), nullable=True))
+
+def downgrade():
+    # Videoテーブルからシーン境界インデックスのカラムを削除
+    op.drop_column('videos', 'scene_index')
@@ -0,0 +1,23 @@
+"""add target duration
+
+Revision ID: 3b2e1d4f5a6c
+Revises: 2a1f0c3d4e5b
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '3b2e1d4f5a6c'
+down_revision = '2a1f0c3d4e5b'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Videoテーブルに切り抜き動画の目標の長さのカラムを追加
+    op.add_column('videos', sa.Column('target_duration', sa.Float(), nullable=True))
+
+def downgrade():
+    # Videoテーブルから切り抜き動画の目標の長さのカラムを削除
+    op.drop_column('videos', 'target_duration')
@@ -0,0 +1,23 @@
+"""add transcribed until
+
+Revision ID: 6e5b4a7c8d9f
+Revises: 5d4a3f6b7c8e
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '6e5b4a7c8d9f'
+down_revision = '5d4a3f6b7c8e'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Videoテーブルに文字起こしのチェックポイントのカラムを追加
+    op.add_column('videos', sa.Column('transcribed_until', sa.Float(), nullable=True))
+
+def downgrade():
+    # Videoテーブルから文字起こしのチェックポイントのカラムを削除
+    op.drop_column('videos', 'transcribed_until')
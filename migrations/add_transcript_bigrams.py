@@ -0,0 +1,34 @@
+"""add transcript bigrams
+
+Revision ID: f15a4b8c9d0e
+Revises: e03d2c5f6b7c
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'f15a4b8c9d0e'
+down_revision = 'e03d2c5f6b7c'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 2文字の語句の検索用のバイグラムの索引（登録済みの動画は flask index-transcripts で再登録する）
+    if op.get_bind().dialect.name == 'postgresql':
+        op.add_column('transcript_search', sa.Column('bigrams', postgresql.ARRAY(sa.Text()), nullable=False,
+                                                     server_default='{}'))
+        op.create_index('ix_transcript_search_bigrams', 'transcript_search', ['bigrams'],
+                        postgresql_using='gin')
+    else:
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS transcript_bigram_fts USING fts5("
+                   "bigrams, tokenize='unicode61 remove_diacritics 0')")
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_transcript_search_bigrams', table_name='transcript_search')
+        op.drop_column('transcript_search', 'bigrams')
+    else:
+        op.execute("DROP TABLE IF EXISTS transcript_bigram_fts")
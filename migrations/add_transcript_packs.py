@@ -0,0 +1,39 @@
+"""add transcript packs
+
+Revision ID: bd0a9f2c3e4f
+Revises: ac9f8e1b2c3d
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'bd0a9f2c3e4f'
+down_revision = 'ac9f8e1b2c3d'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # 文字起こしセグメントを動画ごとに1行へまとめるテーブルを作成
+    op.create_table('transcript_packs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('video_id', sa.Integer(), nullable=False),
+        sa.Column('segment_count', sa.Integer(), nullable=False),
+        sa.Column('start_times', sa.LargeBinary(), nullable=False),
+        sa.Column('end_times', sa.LargeBinary(), nullable=False),
+        sa.Column('text_offsets', sa.LargeBinary(), nullable=False),
+        sa.Column('text_blob', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['video_id'], ['videos.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('video_id')
+    )
+    
+    # セグメントの行を時間範囲で取得するためのインデックス
+    op.create_index('ix_transcript_segments_video_id_start_time', 'transcript_segments', ['video_id', 'start_time'])
+
+def downgrade():
+    # インデックスとテーブルを削除
+    op.drop_index('ix_transcript_segments_video_id_start_time', table_name='transcript_segments')
+    op.drop_table('transcript_packs')
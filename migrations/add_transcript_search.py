@@ -0,0 +1,43 @@
+"""add transcript search
+
+Revision ID: ce1b0a3d4f5a
+Revises: bd0a9f2c3e4f
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'ce1b0a3d4f5a'
+down_revision = 'bd0a9f2c3e4f'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # 日本語の部分一致検索のため、pg_trgmのGINインデックスを作成
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.create_table('transcript_search',
+            sa.Column('id', sa.BigInteger(), nullable=False),
+            sa.Column('video_id', sa.Integer(), nullable=False),
+            sa.Column('start_time', sa.Float(), nullable=False),
+            sa.Column('end_time', sa.Float(), nullable=False),
+            sa.Column('text', sa.Text(), nullable=False),
+            sa.ForeignKeyConstraint(['video_id'], ['videos.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_transcript_search_text_trgm', 'transcript_search', ['text'],
+                        postgresql_using='gin', postgresql_ops={'text': 'gin_trgm_ops'})
+        op.create_index('ix_transcript_search_video_id_start_time', 'transcript_search', ['video_id', 'start_time'])
+    else:
+        # SQLiteではFTS5（トライグラム）の仮想テーブルを作成
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS transcript_fts USING fts5("
+                   "text, video_id UNINDEXED, start_time UNINDEXED, end_time UNINDEXED, tokenize='trigram')")
+
+def downgrade():
+    # 検索用のテーブルを削除
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_table('transcript_search')
+    else:
+        op.execute("DROP TABLE IF EXISTS transcript_fts")
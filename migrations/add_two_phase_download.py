@@ -0,0 +1,23 @@
+"""add two_phase_download
+
+Revision ID: ac9f8e1b2c3d
+Revises: 9b8e7d0f1a2c
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'ac9f8e1b2c3d'
+down_revision = '9b8e7d0f1a2c'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Videoテーブルに2段階ダウンロードの有無のカラムを追加
+    op.add_column('videos', sa.Column('two_phase_download', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+def downgrade():
+    # Videoテーブルから2段階ダウンロードの有無のカラムを削除
+    op.drop_column('videos', 'two_phase_download')
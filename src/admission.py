@@ -0,0 +1,229 @@
+"""ジョブ受付時のアドミッション制御
+
+/process は受け付けたリクエストをすべてキューに投入していたため、アクセスが集中すると
+数時間分の処理がRedisに積まれ、すべてのジョブの待ち時間が延びていた。
+このモジュールは受付前にクライアントごとの同時処理数・全体の処理待ち件数を確認し、
+上限内の場合だけメタデータを取得して（動画はダウンロードしない）処理コストを見積もる。
+いずれかの上限（全体の処理待ち時間を含む）を超える場合は受け付けずに、処理を開始できるまでの目安の時間を返す。
+
+処理待ちの件数とコストはDBの処理中（ACTIVE_STATUSES）のジョブから集計する。
+複数のWebプロセスで同時に判定するため、上限は厳密ではなく目安として扱う。
+"""
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+from sqlalchemy import func
+from src.models import db, Video
+from src.recovery import ACTIVE_STATUSES
+from src.instrumentation import ADMISSION_DECISIONS, ADMISSION_BACKLOG_SECONDS, ADMISSION_PROBE_DURATION
+
+logger = logging.getLogger(__name__)
+
+# 処理できる動画の最大長さ（秒）
+MAX_VIDEO_LENGTH = float(os.getenv('MAX_VIDEO_LENGTH', '3600'))
+
+# クライアントごとの同時処理数（処理待ちを含む）の上限
+MAX_ACTIVE_PER_CLIENT = int(os.getenv('ADMISSION_MAX_ACTIVE_PER_CLIENT', '2'))
+
+# 全体の処理待ち件数（処理中を含む）の上限
+MAX_QUEUED_JOBS = int(os.getenv('ADMISSION_MAX_QUEUED_JOBS', '50'))
+
+# 全体の処理待ち時間（見積もった処理時間の合計を同時実行数で割ったもの、秒）の上限
+MAX_QUEUED_SECONDS = float(os.getenv('ADMISSION_MAX_QUEUED_SECONDS', '7200'))
+
+# 処理コストの見積もり: 動画1秒あたりの処理時間（秒、720p相当）
+COST_PER_MEDIA_SECOND = float(os.getenv('ADMISSION_COST_PER_MEDIA_SECOND', '0.5'))
+
+# 見積もりの基準とする解像度（高さ）
+COST_BASE_HEIGHT = 720
+
+# メタデータを取得できなかった場合に仮定する動画の長さ（秒）
+DEFAULT_DURATION = float(os.getenv('ADMISSION_DEFAULT_DURATION', '1800'))
+
+# 処理待ち時間の計算に使用するワーカーの同時実行数
+WORKER_CONCURRENCY = int(os.getenv('ADMISSION_WORKER_CONCURRENCY', '2'))
+
+# メタデータ取得のタイムアウト（秒）
+PROBE_TIMEOUT = float(os.getenv('ADMISSION_PROBE_TIMEOUT', '10'))
+
+# クライアントを識別するヘッダー（リバースプロキシが設定するもの。未設定の場合は接続元のIPアドレス）
+CLIENT_HEADER = os.getenv('ADMISSION_CLIENT_HEADER')
+
+
+@dataclass
+class AdmissionDecision:
+    """アドミッション制御の判定結果"""
+    accepted: bool
+    reason: str  # 'accepted', 'too_long', 'client_limit', 'queue_full', 'backlog_full'
+    message: str
+    estimated_cost: float  # このジョブの見積もり処理時間（秒）
+    eta_seconds: float  # 処理を開始できるまでの目安の時間（秒）
+    metadata: Dict
+
+    @property
+    def retry_after(self) -> int:
+        """Retry-Afterヘッダーに指定する秒数"""
+        return max(1, int(math.ceil(self.eta_seconds)))
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data['eta_seconds'] = round(self.eta_seconds)
+        data['estimated_cost'] = round(self.estimated_cost)
+        return data
+
+
+def client_id_from_request(request) -> str:
+    """リクエストからクライアントの識別子を求める"""
+    return client_id_from_headers(request.headers, request.remote_addr)
+
+
+def client_id_from_headers(headers, remote_addr: Optional[str]) -> str:
+    """リクエストのヘッダーと接続元のIPアドレスからクライアントの識別子を求める（ASGIのリクエストでも使用する）"""
+    if CLIENT_HEADER:
+        value = headers.get(CLIENT_HEADER, '').split(',')[0].strip()
+        if value:
+            return value[:64]
+    return (remote_addr or 'unknown')[:64]
+
+
+def probe_metadata(youtube_url: str) -> Dict:
+    """
+    動画をダウンロードせずにメタデータ（長さ・解像度など）を取得する
+
+    Returns:
+        'title', 'duration', 'height', 'thumbnail_url' を含む辞書（取得できなかった項目はNone）
+    """
+    import yt_dlp
+
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'skip_download': True,
+        'noplaylist': True,
+        'socket_timeout': PROBE_TIMEOUT,
+    }
+
+    started = time.perf_counter()
+    try:
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(youtube_url, download=False)
+    finally:
+        ADMISSION_PROBE_DURATION.observe(time.perf_counter() - started)
+
+    thumbnails = sorted(info.get('thumbnails') or [],
+                        key=lambda x: (x.get('width') or 0) * (x.get('height') or 0), reverse=True)
+    return {
+        'title': info.get('title'),
+        'duration': info.get('duration'),
+        'height': info.get('height'),
+        'thumbnail_url': thumbnails[0].get('url') if thumbnails else None,
+    }
+
+
+def estimate_job_cost(duration: Optional[float], height: Optional[int] = None) -> float:
+    """
+    動画の長さと解像度からジョブの処理時間（秒）を見積もる
+
+    文字起こし・解析は縮小したプロキシで行うため長さにほぼ比例し、
+    ダウンロードと書き出しは解像度に比例するため、720p以上では解像度に応じて割り増す。
+    """
+    duration = duration or DEFAULT_DURATION
+    resolution_factor = max(1.0, (height or COST_BASE_HEIGHT) / COST_BASE_HEIGHT)
+    return duration * COST_PER_MEDIA_SECOND * resolution_factor
+
+
+def current_load(client_id: Optional[str] = None) -> Dict:
+    """
+    処理中・処理待ちのジョブの件数と見積もり処理時間の合計を集計する
+
+    Returns:
+        'active_jobs', 'backlog_seconds'（同時実行数で割った待ち時間）,
+        'client_active_jobs'（client_idを指定した場合のみ）を含む辞書
+    """
+    active_jobs, total_cost = db.session.query(
+        func.count(Video.id),
+        func.coalesce(func.sum(func.coalesce(Video.estimated_cost, estimate_job_cost(None))), 0.0)
+    ).filter(Video.status.in_(ACTIVE_STATUSES)).one()
+
+    load = {
+        'active_jobs': active_jobs,
+        'backlog_seconds': float(total_cost) / max(1, WORKER_CONCURRENCY),
+    }
+    if client_id is not None:
+        load['client_active_jobs'] = Video.query.filter(
+            Video.client_id == client_id, Video.status.in_(ACTIVE_STATUSES)
+        ).count()
+
+    ADMISSION_BACKLOG_SECONDS.set(load['backlog_seconds'])
+    return load
+
+
+def admit_job(youtube_url: str, client_id: str, metadata: Optional[Dict] = None) -> AdmissionDecision:
+    """
+    ジョブを受け付けるかどうかを判定する
+
+    同時処理数・処理待ち件数の上限はDBの集計だけで判定できるため、メタデータの取得（yt-dlpによる通信で
+    最大 PROBE_TIMEOUT 秒）より先に判定し、アクセスの集中時は取得せずにすぐ429を返す。
+    メタデータは受け付けられる場合だけ、長さと処理待ち時間の判定のために取得する。
+
+    Args:
+        youtube_url: 処理する動画のURL
+        client_id: リクエスト元のクライアントの識別子
+        metadata: 取得済みのメタデータ（'title', 'duration', 'height', 'thumbnail_url'。指定した場合は取得しない。
+                  キーワードから作成する切り抜きでは、切り抜きの長さを 'duration' に指定してコストを見積もる）
+
+    Returns:
+        判定結果（受け付けない場合も、処理を開始できるまでの目安の時間を含む）
+    """
+    load = current_load(client_id)
+    eta = load['backlog_seconds']
+    known_metadata = metadata
+    metadata = {'title': None, 'duration': None, 'height': None, 'thumbnail_url': None}
+    cost = 0.0  # メタデータの取得前に判定した場合は見積もらない
+
+    def decide(accepted: bool, reason: str, message: str, eta_seconds: float = eta) -> AdmissionDecision:
+        ADMISSION_DECISIONS.labels(decision='accepted' if accepted else 'rejected', reason=reason).inc()
+        return AdmissionDecision(accepted, reason, message, cost, eta_seconds, metadata)
+
+    if load['client_active_jobs'] >= MAX_ACTIVE_PER_CLIENT:
+        # 処理中のジョブが1件終わるまでの目安（待ち時間をジョブ数で均等に割ったもの）
+        return decide(False, 'client_limit',
+                      f"同時に処理できるのは{MAX_ACTIVE_PER_CLIENT}件までです。処理中の動画が完了してから再度お試しください",
+                      eta / max(1, load['active_jobs']))
+
+    if load['active_jobs'] >= MAX_QUEUED_JOBS:
+        return decide(False, 'queue_full', "処理待ちの動画が多いため、現在は受け付けていません")
+
+    if known_metadata is not None:
+        metadata = dict(metadata, **known_metadata)
+    else:
+        try:
+            metadata = probe_metadata(youtube_url)
+        except Exception as e:
+            # メタデータを取得できなくても受付は継続する（見積もりには既定の長さを使用）
+            logger.warning(f"メタデータの取得に失敗したため、既定の長さで見積もります: {str(e)}")
+    cost = estimate_job_cost(metadata['duration'], metadata['height'])
+
+    if metadata['duration'] and metadata['duration'] > MAX_VIDEO_LENGTH:
+        return decide(False, 'too_long', f"{int(MAX_VIDEO_LENGTH // 60)}分を超える動画は処理できません", 0.0)
+
+    if eta + cost / max(1, WORKER_CONCURRENCY) > MAX_QUEUED_SECONDS:
+        return decide(False, 'backlog_full', "処理待ちの動画が多いため、現在は受け付けていません",
+                      eta + cost / max(1, WORKER_CONCURRENCY) - MAX_QUEUED_SECONDS)
+
+    return decide(True, 'accepted', "動画処理リクエストを受け付けました")
+
+
+def limits() -> Dict:
+    """設定されている上限（確認用）"""
+    return {
+        'max_video_length': MAX_VIDEO_LENGTH,
+        'max_active_per_client': MAX_ACTIVE_PER_CLIENT,
+        'max_queued_jobs': MAX_QUEUED_JOBS,
+        'max_queued_seconds': MAX_QUEUED_SECONDS,
+        'cost_per_media_second': COST_PER_MEDIA_SECOND,
+        'worker_concurrency': WORKER_CONCURRENCY,
+    }
@@ -1,18 +1,35 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, abort
+import hmac
+import time
+from datetime import datetime
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, abort, g, Response
 from werkzeug.utils import secure_filename
 import uuid
-import boto3
-from src.youtube_downloader import is_valid_youtube_url
-from src.models import db, Video, Highlight, ProcessLog, ProcessStatus
-from src.tasks import process_video_task, configure_celery
-from src.db_manager import init_db
-from src.storage_utils import StorageManager
+from sqlalchemy import func, insert, update
+from sqlalchemy.orm import defer, load_only
 from dotenv import load_dotenv
 
-# 環境変数のロード
+# 環境変数のロード（src の各モジュールは読み込み時に環境変数から設定を読むため、それらより先に読み込む）
 load_dotenv()
 
+from src.youtube_downloader import is_valid_youtube_url, expand_video_urls
+from src.models import db, Video, Highlight, ProcessLog, ProcessStatus
+from src.tasks import process_video_task, enqueue_videos, enqueue_keyword_clip, configure_celery
+from src.db_manager import init_db
+from src.db_pool import engine_options, pool_status
+from src.db_routing import init_routing, read_only, replica_binds
+from src.storage_utils import StorageManager
+from src.instrumentation import HTTP_REQUEST_DURATION, metrics_response
+from src.profiling import is_profile_artifact
+from src.progress import get_progress
+from src.workspace import disk_usage
+from src.transcript_store import TRANSCRIPT_PAGE_SECONDS, load_segments, pack_video_transcript, transcript_text
+from src.transcript_search import SearchTooBroad, index_video_transcript, parse_terms, search_segments
+from src.pagination import (HISTORY_PAGE_SIZE, LOG_PAGE_SIZE, InvalidCursor, keyset_page, page_size)
+from src.keyword_clips import MAX_PADDING, PADDING_AFTER, PADDING_BEFORE, create_keyword_clip, find_keyword_intervals
+from src.admission import (admit_job, client_id_from_request, current_load, estimate_job_cost,
+                           limits as admission_limits, MAX_VIDEO_LENGTH)
+
 def create_app():
     app = Flask(__name__, template_folder='../templates', static_folder='../static')
     
@@ -20,9 +37,28 @@ def create_app():
     app.secret_key = os.getenv('SECRET_KEY', 'dev_key')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///../instance/kirinuki.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # 接続プールの設定（プロセスの種類ごとの接続数、PgBouncer経由の場合はプールしない）
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    # リードレプリカ（設定されている場合、read_only のビューの読み取りを振り分ける）
+    app.config['DATABASE_REPLICA_URL'] = os.getenv('DATABASE_REPLICA_URL')
+    # 書き込み後、同じクライアントの読み取りをプライマリで行う時間（秒、レプリカの遅延より長くする）
+    app.config['DATABASE_REPLICA_STICKY_SECONDS'] = float(os.getenv('DATABASE_REPLICA_STICKY_SECONDS', '10'))
+    replica_url = app.config['DATABASE_REPLICA_URL']
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(
+        replica_url, engine_options(replica_url) if replica_url else {}
+    )
     app.config['CELERY_BROKER_URL'] = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
     app.config['CELERY_RESULT_BACKEND'] = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
     
+    # 切り抜き動画の目標の長さとして指定できる上限（秒）
+    app.config['MAX_TARGET_DURATION'] = float(os.getenv('MAX_TARGET_DURATION', '1800'))
+    
+    # 管理用エンドポイントの認証トークン（未設定の場合は管理用エンドポイントを無効化）
+    app.config['ADMIN_TOKEN'] = os.getenv('ADMIN_TOKEN')
+    
+    # 一括登録（/api/batch）で1回に登録できる動画の上限
+    app.config['BATCH_MAX_VIDEOS'] = int(os.getenv('BATCH_MAX_VIDEOS', '1000'))
+    
     # ストレージ設定 (ローカルまたはS3)
     app.config['USE_S3'] = os.getenv('USE_S3', 'False').lower() in ('true', '1', 't')
     app.config['S3_UPLOAD_BUCKET'] = os.getenv('S3_UPLOAD_BUCKET')
@@ -48,6 +84,7 @@ def create_app():
     
     # データベースの初期化
     init_db(app)
+    init_routing(app)
     
     # Celeryの設定
     configure_celery(app)
@@ -56,6 +93,28 @@ def create_app():
 
 app = create_app()
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    """リクエストの処理時間をPrometheusのヒストグラムに記録する"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        HTTP_REQUEST_DURATION.labels(
+            endpoint=request.endpoint or 'unknown',
+            method=request.method,
+            status=response.status_code
+        ).observe(time.perf_counter() - started)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus形式のメトリクス（Webプロセス分。ワーカー分はワーカー側で公開）"""
+    body, content_type = metrics_response()
+    return Response(body, content_type=content_type)
+
 @app.route('/')
 def index():
     """トップページ"""
@@ -74,14 +133,51 @@ def process():
         flash('有効なYouTube URLを入力してください')
         return redirect(url_for('index'))
     
+    # 切り抜き動画の目標の長さ（秒）。未指定の場合は動画の長さに対する割合で選択
+    target_duration = request.form.get('target_duration', type=float)
+    if target_duration is not None and not (0 < target_duration <= app.config['MAX_TARGET_DURATION']):
+        flash(f"切り抜き動画の長さは1〜{int(app.config['MAX_TARGET_DURATION'])}秒の範囲で指定してください")
+        return redirect(url_for('index'))
+    
+    # 各ステージをプロファイラの下で実行するかどうか（処理が遅い原因の調査用）
+    profile_enabled = request.form.get('profile') in ('1', 'on', 'true')
+    
+    # JSONで応答するかどうか（APIクライアントからのリクエスト）
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    
+    # アドミッション制御（処理コストを見積もり、上限を超える場合は受け付けない）
+    client_id = client_id_from_request(request)
+    decision = admit_job(youtube_url, client_id)
+    if not decision.accepted:
+        status_code = 413 if decision.reason == 'too_long' else 429
+        if wants_json:
+            response = jsonify({'status': 'rejected', **decision.to_dict()})
+        else:
+            message = decision.message
+            if status_code == 429:
+                message += f"（約{max(1, decision.retry_after // 60)}分後に再度お試しください）"
+            flash(message)
+            response = app.make_response(render_template('index.html'))
+        response.status_code = status_code
+        if status_code == 429:
+            response.headers['Retry-After'] = str(decision.retry_after)
+        return response
+    
     # セッションID（ユニークな処理ID）の生成
     session_id = str(uuid.uuid4())
     
     try:
-        # データベースにビデオレコードを作成
+        # データベースにビデオレコードを作成（受付時に取得したメタデータを先に記録）
         new_video = Video(
             youtube_url=youtube_url,
             session_id=session_id,
+            title=decision.metadata['title'],
+            duration=decision.metadata['duration'],
+            thumbnail_url=decision.metadata['thumbnail_url'],
+            target_duration=target_duration,
+            profile_enabled=profile_enabled,
+            client_id=client_id,
+            estimated_cost=decision.estimated_cost,
             status=ProcessStatus.PENDING,
             progress=0
         )
@@ -92,14 +188,24 @@ def process():
         log = ProcessLog(
             video_id=new_video.id,
             status=ProcessStatus.PENDING,
-            message="動画処理リクエストを受け付けました"
+            message=f"{decision.message}（開始までの目安: 約{round(decision.eta_seconds / 60)}分）"
         )
+        log.set_details({'admission': decision.to_dict()})
         db.session.add(log)
         db.session.commit()
         
         # Celeryタスクを非同期に実行
         process_video_task.delay(new_video.id)
         
+        if wants_json:
+            return jsonify({
+                'status': 'queued',
+                'session_id': session_id,
+                'status_url': url_for('status', session_id=session_id),
+                'eta_seconds': round(decision.eta_seconds),
+                'estimated_cost': round(decision.estimated_cost)
+            }), 202
+        
         # 処理状況確認ページへリダイレクト
         return redirect(url_for('processing', session_id=session_id))
         
@@ -107,7 +213,18 @@ def process():
         flash(f'エラーが発生しました: {str(e)}')
         return redirect(url_for('index'))
 
+@app.route('/api/admission')
+def admission_stats():
+    """アドミッション制御の上限と現在の処理待ちの状況"""
+    load = current_load()
+    return jsonify({
+        'limits': admission_limits(),
+        'active_jobs': load['active_jobs'],
+        'backlog_seconds': round(load['backlog_seconds'])
+    })
+
 @app.route('/processing/<session_id>')
+@read_only
 def processing(session_id):
     """処理状況確認ページ"""
     # セッションIDからビデオレコードを検索
@@ -125,6 +242,7 @@ def processing(session_id):
     return render_template('processing.html', session_id=session_id, video=video)
 
 @app.route('/status/<session_id>')
+@read_only
 def status(session_id):
     """処理状況のAPIエンドポイント"""
     video = Video.query.filter_by(session_id=session_id).first()
@@ -137,17 +255,37 @@ def status(session_id):
     
     # 最新のログメッセージを取得
     latest_log = ProcessLog.query.filter_by(video_id=video.id).order_by(ProcessLog.created_at.desc()).first()
-    message = latest_log.message if latest_log else ""
     
-    return jsonify({
+    # 処理中のステージ内部の進捗（ワーカーがRedisに書き込んだもの）があれば反映する
+    live_progress = None
+    if video.status not in (ProcessStatus.COMPLETED, ProcessStatus.FAILED):
+        live_progress = get_progress(session_id)
+    
+    return jsonify(status_payload(video, latest_log.message if latest_log else "", live_progress))
+
+def status_payload(video, message, live_progress=None):
+    """
+    /status の応答の内容（ASGIの /status と共通）
+    
+    Args:
+        video: ビデオレコード
+        message: 最新のログメッセージ
+        live_progress: ワーカーがRedisに書き込んだステージ内部の進捗（ない場合はNone）
+    """
+    progress = video.progress
+    if live_progress and live_progress.get('progress', 0) > progress:
+        progress = live_progress['progress']
+        message = live_progress.get('message') or message
+    return {
         'status': video.status.value,
-        'progress': video.progress,
+        'progress': progress,
         'message': message,
         'title': video.title,
         'thumbnail_url': video.thumbnail_url
-    })
+    }
 
 @app.route('/result/<session_id>')
+@read_only
 def result(session_id):
     """結果表示ページ"""
     video = Video.query.filter_by(session_id=session_id).first()
@@ -189,6 +327,7 @@ def download(session_id):
     if app.config['USE_S3']:
         # S3の場合は署名付きURLを生成して直接ダウンロード
         try:
+            import boto3
             s3_client = boto3.client('s3', region_name=app.config['AWS_REGION'])
             s3_url = s3_client.generate_presigned_url(
                 'get_object',
@@ -227,6 +366,7 @@ def video(session_id):
         else:
             # 署名付きURLを生成
             try:
+                import boto3
                 s3_client = boto3.client('s3', region_name=app.config['AWS_REGION'])
                 s3_url = s3_client.generate_presigned_url(
                     'get_object',
@@ -244,34 +384,549 @@ def video(session_id):
         # ローカルの場合は直接ファイルを送信
         return send_from_directory(directory=app.config['OUTPUT_FOLDER'], path=output_filename)
 
+def history_page(status=None, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """履歴一覧の1ページ分の動画（新しい順、一覧に表示するカラムだけを読み込む）"""
+    query = Video.query.options(load_only(*Video.summary_columns()))
+    if status is not None:
+        query = query.filter(Video.status == status)
+    return keyset_page(query, Video, cursor, limit)
+
+def parse_status_filter(value):
+    """クエリパラメータのステータスを ProcessStatus にする（未指定の場合はNone）"""
+    return ProcessStatus(value) if value else None
+
 @app.route('/history')
+@read_only
 def history():
     """処理履歴一覧ページ"""
-    videos = Video.query.order_by(Video.created_at.desc()).limit(20).all()
-    return render_template('history.html', videos=videos)
+    try:
+        status_filter = parse_status_filter(request.args.get('status'))
+        videos, next_cursor = history_page(status_filter, request.args.get('cursor'))
+    except (ValueError, InvalidCursor):
+        flash('指定された条件が正しくありません')
+        return redirect(url_for('history'))
+    return render_template('history.html', videos=videos, next_cursor=next_cursor, status_filter=status_filter,
+                           statuses=list(ProcessStatus), is_first_page=not request.args.get('cursor'))
+
+@app.route('/api/history')
+@read_only
+def history_api():
+    """
+    処理履歴の一覧（キーセット方式のページ分割）
+    
+    クエリパラメータ:
+        status: ステータスで絞り込む（省略可）
+        cursor: 前のページの next_cursor（省略時は最新のページ）
+        limit: 1ページの件数（既定は HISTORY_PAGE_SIZE）
+    """
+    try:
+        status_filter = parse_status_filter(request.args.get('status'))
+        videos, next_cursor = history_page(status_filter, request.args.get('cursor'),
+                                           page_size(request.args.get('limit', type=int), HISTORY_PAGE_SIZE))
+    except (ValueError, InvalidCursor):
+        return jsonify({
+            'status': 'error',
+            'message': '指定された条件が正しくありません'
+        }), 400
+    
+    return jsonify({
+        'videos': [video.to_summary_dict() for video in videos],
+        'next_cursor': next_cursor
+    })
+
+def find_video_for_detail(session_id):
+    """詳細表示用に動画を取得する（文字起こしの全文・境界インデックスなどの大きなカラムは読み込まない）"""
+    return Video.query.options(defer(Video.transcript), defer(Video.scene_index), defer(Video.description)) \
+        .filter_by(session_id=session_id).first()
+
+def has_transcript(video):
+    """文字起こしが完了しているかどうか（全文を読み込まずに判定する）"""
+    return db.session.query(Video.transcript.isnot(None)).filter(Video.id == video.id).scalar()
+
+def transcript_window(video, transcript_from, completed):
+    """
+    文字起こしセグメントを TRANSCRIPT_PAGE_SECONDS 秒分取得する（completed は文字起こしが完了しているかどうか）
+    
+    Returns:
+        (セグメントのリスト, 範囲の終了時間, 続きがあるかどうか)
+    """
+    transcript_to = transcript_from + TRANSCRIPT_PAGE_SECONDS
+    segments = load_segments(video, transcript_from, transcript_to) if completed else []
+    has_more = transcript_to < video.duration if video.duration else bool(segments)
+    return segments, transcript_to, has_more
+
+def find_video_or_404(session_id):
+    """セッションIDの動画を取得する（見つからない場合は404のJSONを返す）"""
+    video = find_video_for_detail(session_id)
+    if video is None:
+        abort(make_json_error('指定された処理が見つかりません', 404))
+    return video
+
+def make_json_error(message, status_code):
+    response = jsonify({'status': 'error', 'message': message})
+    response.status_code = status_code
+    return response
 
 @app.route('/detail/<session_id>')
+@read_only
 def detail(session_id):
     """詳細情報ページ"""
-    video = Video.query.filter_by(session_id=session_id).first()
+    video = find_video_for_detail(session_id)
     
     if not video:
         flash('指定された処理が見つかりません')
         return redirect(url_for('index'))
     
-    # 処理ログを取得
-    logs = ProcessLog.query.filter_by(video_id=video.id).order_by(ProcessLog.created_at).all()
+    # 処理ログを取得（最初のページだけを表示し、続きは /api/videos/<session_id>/logs から読み込む）
+    logs, logs_next_cursor = keyset_page(ProcessLog.query.filter_by(video_id=video.id), ProcessLog,
+                                         limit=LOG_PAGE_SIZE, descending=False)
     
     # ハイライト情報を取得
     highlights = Highlight.query.filter_by(video_id=video.id).order_by(Highlight.start_time).all()
     
-    # 文字起こしセグメントを取得
-    transcript_segments = []
-    if video.transcript:  # 文字起こしが完了している場合
-        from src.models import TranscriptSegment
-        transcript_segments = TranscriptSegment.query.filter_by(video_id=video.id).order_by(TranscriptSegment.start_time).all()
+    # 文字起こしセグメントを取得（長い動画でも読み込む量が増えないよう、TRANSCRIPT_PAGE_SECONDS 秒ずつ表示する）
+    # 全文は表示する場合にだけ /api/videos/<session_id>/transcript から読み込む
+    completed = has_transcript(video)
+    transcript_from = max(0, request.args.get('t', 0, type=int))
+    transcript_segments, transcript_to, transcript_has_more = transcript_window(video, transcript_from, completed)
+    
+    return render_template('detail.html', video=video, logs=logs, logs_next_cursor=logs_next_cursor,
+                           highlights=highlights, has_transcript=completed,
+                           transcript_segments=transcript_segments,
+                           transcript_from=transcript_from, transcript_to=transcript_to,
+                           transcript_page_seconds=TRANSCRIPT_PAGE_SECONDS, transcript_has_more=transcript_has_more)
+
+@app.route('/api/videos/<session_id>/logs')
+@read_only
+def video_logs(session_id):
+    """
+    処理ログの一覧（古い順、キーセット方式のページ分割）
+    
+    クエリパラメータ:
+        cursor: 前のページの next_cursor（省略時は最初のページ）
+        limit: 1ページの件数（既定は DETAIL_LOG_PAGE_SIZE）
+    """
+    video = find_video_or_404(session_id)
+    try:
+        logs, next_cursor = keyset_page(ProcessLog.query.filter_by(video_id=video.id), ProcessLog,
+                                        request.args.get('cursor'),
+                                        page_size(request.args.get('limit', type=int), LOG_PAGE_SIZE),
+                                        descending=False)
+    except InvalidCursor:
+        return make_json_error('指定された条件が正しくありません', 400)
+    
+    return jsonify({
+        'logs': [log.to_dict() for log in logs],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/videos/<session_id>/segments')
+@read_only
+def video_segments(session_id):
+    """
+    文字起こしセグメント（t 秒から TRANSCRIPT_PAGE_SECONDS 秒分）
+    
+    クエリパラメータ:
+        t: 範囲の開始（秒、省略時は先頭）
+    """
+    video = find_video_or_404(session_id)
+    transcript_from = max(0, request.args.get('t', 0, type=int))
+    segments, transcript_to, has_more = transcript_window(video, transcript_from, has_transcript(video))
+    return jsonify({
+        'from': transcript_from,
+        'to': transcript_to,
+        'segments': [{'start_time': segment.start_time, 'end_time': segment.end_time, 'text': segment.text}
+                     for segment in segments],
+        'next_t': int(transcript_to) if has_more else None
+    })
+
+@app.route('/api/videos/<session_id>/transcript')
+@read_only
+def video_transcript(session_id):
+    """文字起こしの全文"""
+    video = find_video_or_404(session_id)
+    return jsonify({'transcript': transcript_text(video)})
+
+@app.route('/profile/<session_id>/<filename>')
+def profile_artifact(session_id, filename):
+    """プロファイル結果のダウンロードエンドポイント"""
+    video = Video.query.filter_by(session_id=session_id).first()
+    
+    if not video or not is_profile_artifact(session_id, filename):
+        abort(404)
+    
+    if app.config['USE_S3']:
+        # S3の場合は署名付きURLを生成
+        try:
+            import boto3
+            s3_client = boto3.client('s3', region_name=app.config['AWS_REGION'])
+            s3_url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={
+                    'Bucket': app.config['S3_OUTPUT_BUCKET'],
+                    'Key': filename,
+                },
+                ExpiresIn=300  # 5分間有効
+            )
+            return redirect(s3_url)
+        except Exception as e:
+            app.logger.error(f"S3 URL生成エラー: {str(e)}")
+            abort(500)
+    else:
+        # HTML形式（pyinstrument）はブラウザで表示し、pstats形式はダウンロードさせる
+        return send_from_directory(directory=app.config['OUTPUT_FOLDER'], path=filename,
+                                   as_attachment=filename.endswith('.pstats'))
+
+def require_admin_token():
+    """X-Admin-Token ヘッダーを検証する（ADMIN_TOKEN 未設定の場合は404）"""
+    admin_token = app.config['ADMIN_TOKEN']
+    if not admin_token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        abort(403)
+
+@app.route('/admin/profile/<session_id>', methods=['POST'])
+def admin_set_profile(session_id):
+    """指定した処理のプロファイリングの有効・無効を切り替える（管理者用）
+
+    X-Admin-Token ヘッダーに ADMIN_TOKEN を指定する。処理中の場合は次のステージから反映される。
+    """
+    require_admin_token()
+    
+    video = Video.query.filter_by(session_id=session_id).first()
+    if not video:
+        return jsonify({
+            'status': 'error',
+            'message': '指定された処理が見つかりません'
+        }), 404
+    
+    data = request.get_json(silent=True) or request.form
+    enabled = data.get('enabled', True)
+    if isinstance(enabled, str):
+        enabled = enabled.lower() in ('true', '1', 't', 'on')
+    video.profile_enabled = bool(enabled)
+    db.session.commit()
+    
+    return jsonify({
+        'status': 'success',
+        'session_id': session_id,
+        'profile_enabled': video.profile_enabled
+    })
+
+@app.route('/api/batch', methods=['POST'])
+def create_batch():
+    """複数の動画・プレイリスト・チャンネルの一括登録（管理者用）
+
+    JSONで {"urls": [...], "target_duration": 60} を受け取り、動画IDで重複を除いてから
+    ビデオレコードを1回のINSERTで作成し、処理をまとめてキューに投入する。
+    進捗は返却した batch_id で /api/batch/<batch_id> から確認する。
+    個別のリクエストと異なり、メタデータの取得とクライアントごとの上限の確認は行わない。
+    """
+    require_admin_token()
+    
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls') or []
+    if isinstance(urls, str):
+        urls = [urls]
+    if not urls or not all(isinstance(url, str) for url in urls):
+        return jsonify({'status': 'error', 'message': 'urls にYouTubeのURLのリストを指定してください'}), 400
+    
+    target_duration = data.get('target_duration')
+    if target_duration is not None:
+        try:
+            target_duration = float(target_duration)
+        except (TypeError, ValueError):
+            target_duration = -1
+        if not (0 < target_duration <= app.config['MAX_TARGET_DURATION']):
+            return jsonify({
+                'status': 'error',
+                'message': f"切り抜き動画の長さは1〜{int(app.config['MAX_TARGET_DURATION'])}秒の範囲で指定してください"
+            }), 400
+    
+    # プレイリスト・チャンネルを展開し、動画IDで重複を除く
+    try:
+        entries = expand_video_urls(urls, app.config['BATCH_MAX_VIDEOS'])
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"プレイリストの展開エラー: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'プレイリストの展開に失敗しました: {str(e)}'}), 502
+    
+    # 長さが上限を超える動画（一覧から長さがわかるもの）は登録しない
+    skipped = [entry['youtube_url'] for entry in entries if entry['duration'] and entry['duration'] > MAX_VIDEO_LENGTH]
+    entries = [entry for entry in entries if not (entry['duration'] and entry['duration'] > MAX_VIDEO_LENGTH)]
+    if not entries:
+        return jsonify({'status': 'error', 'message': '登録できる動画がありません', 'skipped': skipped}), 400
+    
+    batch_id = str(uuid.uuid4())
+    client_id = client_id_from_request(request)
+    now = datetime.utcnow()
+    
+    try:
+        # ビデオレコードを1回のINSERTで作成
+        db.session.execute(insert(Video), [{
+            'youtube_url': entry['youtube_url'],
+            'session_id': str(uuid.uuid4()),
+            'title': entry['title'],
+            'duration': entry['duration'],
+            'target_duration': target_duration,
+            'profile_enabled': False,
+            'client_id': client_id,
+            'estimated_cost': estimate_job_cost(entry['duration']),
+            'batch_id': batch_id,
+            'status': ProcessStatus.PENDING,
+            'progress': 0,
+            'retry_count': 0,
+            'created_at': now,
+            'updated_at': now,
+        } for entry in entries])
+        video_ids = [video_id for (video_id,) in
+                     db.session.query(Video.id).filter_by(batch_id=batch_id).order_by(Video.id)]
+        
+        # 処理開始のログも1回のINSERTで記録
+        db.session.execute(insert(ProcessLog), [{
+            'video_id': video_id,
+            'status': ProcessStatus.PENDING,
+            'message': f"一括登録で動画処理リクエストを受け付けました（バッチID: {batch_id}）",
+            'created_at': now,
+        } for video_id in video_ids])
+        db.session.commit()
+        
+        # 処理をまとめてキューに投入し、タスクIDを記録
+        task_ids = enqueue_videos(video_ids)
+        db.session.execute(update(Video), [
+            {'id': video_id, 'current_task_id': task_id} for video_id, task_id in task_ids.items()
+        ])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"一括登録エラー: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'エラーが発生しました: {str(e)}'}), 500
+    
+    return jsonify({
+        'status': 'queued',
+        'batch_id': batch_id,
+        'count': len(video_ids),
+        'skipped': skipped,
+        'status_url': url_for('batch_status', batch_id=batch_id)
+    }), 202
+
+@app.route('/api/batch/<batch_id>')
+@read_only
+def batch_status(batch_id):
+    """一括登録した動画の処理状況"""
+    counts = dict(
+        db.session.query(Video.status, func.count(Video.id)).filter_by(batch_id=batch_id).group_by(Video.status).all()
+    )
+    if not counts:
+        return jsonify({
+            'status': 'error',
+            'message': '指定されたバッチが見つかりません'
+        }), 404
+    
+    total = sum(counts.values())
+    finished = counts.get(ProcessStatus.COMPLETED, 0) + counts.get(ProcessStatus.FAILED, 0)
+    videos = db.session.query(Video.session_id, Video.youtube_url, Video.title, Video.status, Video.progress) \
+        .filter_by(batch_id=batch_id).order_by(Video.id).all()
+    
+    return jsonify({
+        'batch_id': batch_id,
+        'total': total,
+        'finished': finished == total,
+        'counts': {status.value: count for status, count in counts.items()},
+        'progress': round(sum(video.progress or 0 for video in videos) / total),
+        'videos': [{
+            'session_id': video.session_id,
+            'youtube_url': video.youtube_url,
+            'title': video.title,
+            'status': video.status.value,
+            'progress': video.progress
+        } for video in videos]
+    })
+
+@app.route('/api/workspace')
+def workspace_usage():
+    """作業ファイルのディスク使用量と空き容量（管理者用）"""
+    require_admin_token()
+    return jsonify(disk_usage())
+
+@app.route('/api/db-pool')
+def db_pool_status():
+    """このプロセスのデータベース接続プールの状態（管理者用）"""
+    require_admin_token()
+    return jsonify(pool_status())
+
+@app.route('/api/search')
+@read_only
+def search_transcripts():
+    """
+    全動画の文字起こしを語句で検索する
+    
+    クエリパラメータ:
+        q: 検索語句（空白区切りでAND条件）
+        video: 対象の動画のセッションID（省略時はすべての動画）
+        from, to: 時間範囲（秒）
+        limit: 返す件数（既定は50）
+    """
+    terms = parse_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({
+            'status': 'error',
+            'message': '検索語句を指定してください'
+        }), 400
+    
+    video_ids = None
+    session_id = request.args.get('video')
+    if session_id:
+        video = Video.query.filter_by(session_id=session_id).first()
+        if video is None:
+            return jsonify({
+                'status': 'error',
+                'message': '指定された動画が見つかりません'
+            }), 404
+        video_ids = [video.id]
+    
+    try:
+        results = search_segments(
+            terms,
+            video_ids=video_ids,
+            start_time=request.args.get('from', type=float),
+            end_time=request.args.get('to', type=float),
+            limit=request.args.get('limit', 50, type=int)
+        )
+    except SearchTooBroad as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    videos = {}
+    if results:
+        videos = {video.id: video for video in db.session.query(Video.id, Video.session_id, Video.title)
+                  .filter(Video.id.in_({result['video_id'] for result in results}))}
+    
+    return jsonify({
+        'query': terms,
+        'count': len(results),
+        'results': [{
+            'session_id': videos[result['video_id']].session_id,
+            'title': videos[result['video_id']].title,
+            'start_time': result['start_time'],
+            'end_time': result['end_time'],
+            'text': result['text'],
+            'detail_url': url_for('detail', session_id=videos[result['video_id']].session_id,
+                                  t=int(result['start_time']))
+        } for result in results if result['video_id'] in videos]
+    })
+
+@app.route('/api/keyword-clip', methods=['POST'])
+def create_keyword_clip_job():
+    """
+    処理済みの動画の文字起こしから、語句を含む場面をまとめた切り抜き動画を作成する
+    
+    リクエストボディ（JSON）:
+        session_id: 元動画のセッションID（文字起こしが完了していること）
+        keywords: 語句（空白区切りの文字列またはリスト、いずれかを含むセグメントを使用）
+        padding_before, padding_after: セグメントの前後に付ける余白（秒、省略可）
+    """
+    data = request.get_json(silent=True) or {}
+    keywords = data.get('keywords')
+    terms = parse_terms(' '.join(keywords) if isinstance(keywords, list) else str(keywords or ''))
+    if not terms:
+        return jsonify({
+            'status': 'error',
+            'message': '語句を指定してください'
+        }), 400
+    
+    try:
+        padding_before = float(data.get('padding_before', PADDING_BEFORE))
+        padding_after = float(data.get('padding_after', PADDING_AFTER))
+    except (TypeError, ValueError):
+        padding_before = padding_after = -1.0
+    if not (0 <= padding_before <= MAX_PADDING and 0 <= padding_after <= MAX_PADDING):
+        return jsonify({
+            'status': 'error',
+            'message': f'余白は0〜{int(MAX_PADDING)}秒の範囲で指定してください'
+        }), 400
+    
+    source = Video.query.filter_by(session_id=data.get('session_id') or '').first()
+    if source is None:
+        return jsonify({
+            'status': 'error',
+            'message': '指定された動画が見つかりません'
+        }), 404
+    # キーワードから作成した切り抜きを指定した場合は、その元動画の文字起こしを使用する
+    if source.source_video is not None:
+        source = source.source_video
+    if source.transcript is None:
+        return jsonify({
+            'status': 'error',
+            'message': '文字起こしが完了していません'
+        }), 409
+    
+    hits, intervals, truncated = find_keyword_intervals(source, terms, padding_before=padding_before,
+                                                        padding_after=padding_after)
+    if not intervals:
+        return jsonify({
+            'status': 'error',
+            'message': '語句を含む発言が見つかりません'
+        }), 404
+    duration = sum(end_time - start_time for start_time, end_time, _ in intervals)
     
-    return render_template('detail.html', video=video, logs=logs, highlights=highlights, transcript_segments=transcript_segments)
+    # アドミッション制御（/process と同じ上限。処理コストは切り抜きの長さから見積もり、メタデータは取得しない）
+    client_id = client_id_from_request(request)
+    decision = admit_job(source.youtube_url, client_id, metadata={
+        'title': source.title, 'duration': duration, 'height': None, 'thumbnail_url': source.thumbnail_url
+    })
+    if not decision.accepted:
+        response = jsonify({'status': 'rejected', **decision.to_dict()})
+        response.status_code = 413 if decision.reason == 'too_long' else 429
+        if response.status_code == 429:
+            response.headers['Retry-After'] = str(decision.retry_after)
+        return response
+    
+    video = create_keyword_clip(source, terms, hits, intervals, truncated, client_id=client_id,
+                                estimated_cost=decision.estimated_cost)
+    db.session.commit()
+    
+    # 文字起こし・解析は行わず、書き出し（元動画のファイルがない場合はダウンロード）から処理する
+    enqueue_keyword_clip(video)
+    db.session.commit()
+    
+    return jsonify({
+        'status': 'queued',
+        'session_id': video.session_id,
+        'source_session_id': source.session_id,
+        'keywords': terms,
+        'stage': video.status.value,
+        'clips': [{'start_time': start_time, 'end_time': end_time, 'matches': count}
+                  for start_time, end_time, count in intervals],
+        'duration': duration,
+        'truncated': truncated,
+        'status_url': url_for('status', session_id=video.session_id)
+    }), 202
+
+@app.cli.command('pack-transcripts')
+def pack_transcripts_command():
+    """文字起こしが完了した動画のセグメントの行を、動画ごとの配列にまとめる（TRANSCRIPT_STORAGE=packed への移行用）"""
+    from src.models import TranscriptPack
+    videos = Video.query.filter(
+        Video.transcript.isnot(None),
+        ~Video.id.in_(db.session.query(TranscriptPack.video_id))
+    ).order_by(Video.id).all()
+    for video in videos:
+        pack = pack_video_transcript(video)
+        db.session.commit()
+        print(f"{video.session_id}: {pack.segment_count}件のセグメントをまとめました")
+
+@app.cli.command('index-transcripts')
+def index_transcripts_command():
+    """文字起こしが完了した動画を検索用のインデックスに登録する（既存のデータの移行用）"""
+    videos = Video.query.filter(Video.transcript.isnot(None)).order_by(Video.id).all()
+    for video in videos:
+        segments = load_segments(video)
+        index_video_transcript(video.id, segments)
+        db.session.commit()
+        print(f"{video.session_id}: {len(segments)}件のセグメントを登録しました")
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
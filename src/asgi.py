@@ -0,0 +1,414 @@
+"""ASGIでのWebの配信（非同期の処理状況・動画の配信・ジョブの受付）
+
+Flaskのアプリ（src/app.py）は同期のため、gunicornの同期ワーカーでは待機中・配信中の接続
+（処理状況の確認、動画のストリーミングやダウンロード）がそれぞれワーカーを1つ占有し、
+同時接続数はワーカー数（スレッド数）までに制限されていた。
+このモジュールは次のエンドポイントをStarletteの非同期のビューで処理し、それ以外はFlaskのアプリに渡す
+（a2wsgi によりスレッドプールで実行する）。
+
+- GET /status/<session_id>: 非同期のDB（SQLAlchemy + asyncpg / aiosqlite）とRedisで読み取る。
+  ?wait=<秒> を指定すると、クライアントが知っている状態（?state= と ?progress=）から変わるまで待機する（ロングポーリング）
+- GET /status/<session_id>/events: 状態が変わるたびに送信するServer-Sent Events（完了・失敗で終了する）
+- GET /video/<session_id>, /download/<session_id>: 動画を非同期に配信する（Rangeリクエストに対応）
+- POST /process: JSONで応答するAPIクライアントからの受付（フォームからの送信はFlaskで処理する）
+
+待機中・配信中の接続はイベントループ上のコルーチンのためスレッドを占有せず、1プロセスで数千の接続を保持できる。
+進捗の通知はRedisのチャンネルを1プロセスで1接続だけ購読して受け取る（src.progress.ProgressNotifier）。
+
+起動方法（asgi.py を参照）:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from functools import wraps
+from typing import Dict, Optional
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from src.app import app as flask_app, status_payload
+from src.admission import admit_job, client_id_from_headers
+from src.async_db import AsyncDatabase
+from src.db_routing import STICKY_COOKIE, primary_required, sticky_cookie_expiry
+from src.instrumentation import ASGI_OPEN_STREAMS, DB_READ_ROUTING, HTTP_REQUEST_DURATION
+from src.models import db, Video, ProcessLog, ProcessStatus
+from src.progress import ProgressNotifier, get_progress_async
+from src.tasks import process_video_task
+from src.youtube_downloader import is_valid_youtube_url
+
+logger = logging.getLogger(__name__)
+
+# ロングポーリングで待機できる時間の上限（秒）
+MAX_WAIT = float(os.getenv('ASGI_STATUS_MAX_WAIT', '60'))
+
+# 待機中に進捗の通知がない場合にDBを確認する間隔（秒、ステージの切り替わりはDBにだけ記録されるため）
+RECHECK_INTERVAL = float(os.getenv('ASGI_STATUS_RECHECK_INTERVAL', '5'))
+
+# SSEの接続を保持する時間の上限（秒、超えた場合は閉じてクライアントに再接続させる）
+STREAM_MAX_SECONDS = float(os.getenv('ASGI_STREAM_MAX_SECONDS', '1800'))
+
+# SSEの接続を維持するためのコメントを送る間隔（秒）
+KEEPALIVE_INTERVAL = 15.0
+
+# Flaskのビューを実行するスレッド数（1プロセスあたり）
+WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '10'))
+
+TERMINAL_STATUSES = (ProcessStatus.COMPLETED.value, ProcessStatus.FAILED.value)
+
+
+@contextmanager
+def open_stream(endpoint: str):
+    """待機中・配信中の接続の数をメトリクスに記録する"""
+    gauge = ASGI_OPEN_STREAMS.labels(endpoint=endpoint)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def timed(endpoint: str):
+    """リクエストの処理時間を記録する（Flaskのビューと同じヒストグラム）"""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            status_code = 500
+            try:
+                response = await handler(request)
+                status_code = response.status_code
+                return response
+            except HTTPException as e:
+                status_code = e.status_code
+                raise
+            finally:
+                HTTP_REQUEST_DURATION.labels(
+                    endpoint=endpoint, method=request.method, status=status_code
+                ).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def json_error(message: str, status_code: int) -> JSONResponse:
+    return JSONResponse({'status': 'error', 'message': message}, status_code=status_code)
+
+
+def _float_param(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def use_replica(request: Request) -> bool:
+    """読み取りをリードレプリカで行うかどうか（直前に書き込みを行ったクライアントはプライマリ）"""
+    replica = request.app.state.database.has_replica and not primary_required(request.cookies)
+    DB_READ_ROUTING.labels(target='replica' if replica else 'primary').inc()
+    return replica
+
+
+async def load_status(database: AsyncDatabase, session_id: str, replica: bool) -> Optional[Dict]:
+    """/status の応答の内容（処理が見つからない場合はNone）"""
+    async with database.session(replica) as session:
+        video = (await session.execute(
+            select(Video)
+            .options(load_only(Video.id, Video.status, Video.progress, Video.title, Video.thumbnail_url))
+            .where(Video.session_id == session_id)
+            .limit(1)
+        )).scalar_one_or_none()
+        if video is None:
+            return None
+        message = (await session.execute(
+            select(ProcessLog.message)
+            .where(ProcessLog.video_id == video.id)
+            .order_by(ProcessLog.created_at.desc())
+            .limit(1)
+        )).scalar_one_or_none()
+
+    live_progress = None
+    if video.status.value not in TERMINAL_STATUSES:
+        live_progress = await get_progress_async(session_id)
+    return status_payload(video, message or "", live_progress)
+
+
+@timed('status')
+async def status(request: Request):
+    """処理状況のAPIエンドポイント（?wait= を指定した場合はロングポーリング）"""
+    session_id = request.path_params['session_id']
+    database = request.app.state.database
+    replica = use_replica(request)
+    payload = await load_status(database, session_id, replica)
+    if payload is None:
+        return json_error('指定された処理が見つかりません', 404)
+
+    wait = min(_float_param(request.query_params.get('wait')) or 0.0, MAX_WAIT)
+    if wait <= 0:
+        return JSONResponse(payload)
+
+    # クライアントが知っている状態（未指定の場合は現在の状態）から変わるまで待機する
+    known_progress = _float_param(request.query_params.get('progress'))
+    known = (request.query_params.get('state', payload['status']),
+             payload['progress'] if known_progress is None else known_progress)
+    deadline = time.monotonic() + wait
+    with open_stream('status'):
+        while (payload['status'], payload['progress']) == known and payload['status'] not in TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or await request.is_disconnected():
+                break
+            await request.app.state.notifier.wait(session_id, min(remaining, RECHECK_INTERVAL))
+            payload = await load_status(database, session_id, replica) or payload
+    return JSONResponse(payload)
+
+
+@timed('status_events')
+async def status_events(request: Request):
+    """処理状況のServer-Sent Events（状態が変わるたびに /status と同じ内容を送信する）"""
+    session_id = request.path_params['session_id']
+    database = request.app.state.database
+    notifier = request.app.state.notifier
+    replica = use_replica(request)
+    payload = await load_status(database, session_id, replica)
+    if payload is None:
+        return json_error('指定された処理が見つかりません', 404)
+
+    async def events():
+        current, sent = payload, None
+        started = last_write = time.monotonic()
+        with open_stream('status_events'):
+            # 接続が切れた場合の再接続の間隔（ミリ秒）
+            yield f"retry: {int(RECHECK_INTERVAL * 1000)}\n\n"
+            while True:
+                now = time.monotonic()
+                if current != sent:
+                    yield f"data: {json.dumps(current, ensure_ascii=False)}\n\n"
+                    sent, last_write = current, now
+                    if current['status'] in TERMINAL_STATUSES:
+                        return
+                elif now - last_write >= KEEPALIVE_INTERVAL:
+                    yield ": keepalive\n\n"
+                    last_write = now
+                if now - started >= STREAM_MAX_SECONDS:
+                    return
+                await notifier.wait(session_id, min(RECHECK_INTERVAL, KEEPALIVE_INTERVAL))
+                current = await load_status(database, session_id, replica) or current
+
+    return StreamingResponse(events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+class TrackedFileResponse(FileResponse):
+    """配信中の接続の数を記録する FileResponse"""
+
+    def __init__(self, *args, endpoint: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.endpoint = endpoint
+
+    async def __call__(self, scope, receive, send):
+        with open_stream(self.endpoint):
+            await super().__call__(scope, receive, send)
+
+
+async def find_output_filename(request: Request) -> str:
+    """完了した処理の出力ファイル名（処理が見つからないか完了していない場合は404）"""
+    session_id = request.path_params['session_id']
+    async with request.app.state.database.session() as session:
+        video_status = (await session.execute(
+            select(Video.status).where(Video.session_id == session_id).limit(1)
+        )).scalar_one_or_none()
+    if video_status != ProcessStatus.COMPLETED:
+        raise HTTPException(404)
+    return f"{session_id}.mp4"
+
+
+def presigned_url(filename: str, expires_in: int, attachment: bool = False) -> str:
+    """出力ファイルの署名付きURL（boto3は同期のため、スレッドプールで呼び出す）"""
+    import boto3
+    s3_client = boto3.client('s3', region_name=flask_app.config['AWS_REGION'])
+    params = {'Bucket': flask_app.config['S3_OUTPUT_BUCKET'], 'Key': filename}
+    if attachment:
+        params['ResponseContentDisposition'] = f'attachment; filename={filename}'
+    return s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+
+def local_output(filename: str, endpoint: str, attachment: bool) -> TrackedFileResponse:
+    path = os.path.join(flask_app.config['OUTPUT_FOLDER'], filename)
+    if not os.path.isfile(path):
+        raise HTTPException(404)
+    return TrackedFileResponse(path, media_type='video/mp4', filename=filename if attachment else None,
+                               endpoint=endpoint)
+
+
+@timed('download')
+async def download(request: Request):
+    """動画ダウンロードエンドポイント"""
+    output_filename = await find_output_filename(request)
+    if not flask_app.config['USE_S3']:
+        return local_output(output_filename, 'download', attachment=True)
+    try:
+        url = await run_in_threadpool(presigned_url, output_filename, 300, True)
+    except Exception as e:
+        logger.error(f"S3 URL生成エラー: {str(e)}")
+        raise HTTPException(500)
+    return RedirectResponse(url, status_code=302)
+
+
+@timed('video')
+async def video(request: Request):
+    """動画ストリーミングエンドポイント"""
+    output_filename = await find_output_filename(request)
+    if not flask_app.config['USE_S3']:
+        return local_output(output_filename, 'video', attachment=False)
+    cloudfront_domain = os.getenv('CLOUDFRONT_DOMAIN')
+    if cloudfront_domain:
+        return RedirectResponse(f"https://{cloudfront_domain}/{output_filename}", status_code=302)
+    try:
+        url = await run_in_threadpool(presigned_url, output_filename, 3600)
+    except Exception as e:
+        logger.error(f"S3 URL生成エラー: {str(e)}")
+        raise HTTPException(500)
+    return RedirectResponse(url, status_code=302)
+
+
+def _admit(youtube_url: str, client_id: str):
+    """アドミッション制御（メタデータの取得とDBの集計は同期のため、スレッドプールで実行する）"""
+    with flask_app.app_context():
+        return admit_job(youtube_url, client_id)
+
+
+async def submit_job(request: Request) -> JSONResponse:
+    """動画処理のリクエスト受付（JSONで応答する。Flaskの /process と同じ判定を行う）"""
+    form = await request.form()
+    youtube_url = form.get('youtube_url')
+    if not youtube_url:
+        return json_error('YouTubeのURLを入力してください', 400)
+    if not is_valid_youtube_url(youtube_url):
+        return json_error('有効なYouTube URLを入力してください', 400)
+
+    target_duration = _float_param(form.get('target_duration'))
+    max_target_duration = flask_app.config['MAX_TARGET_DURATION']
+    if target_duration is not None and not (0 < target_duration <= max_target_duration):
+        return json_error(f"切り抜き動画の長さは1〜{int(max_target_duration)}秒の範囲で指定してください", 400)
+    profile_enabled = form.get('profile') in ('1', 'on', 'true')
+
+    client_id = client_id_from_headers(request.headers, request.client.host if request.client else None)
+    decision = await run_in_threadpool(_admit, youtube_url, client_id)
+    if not decision.accepted:
+        status_code = 413 if decision.reason == 'too_long' else 429
+        response = JSONResponse({'status': 'rejected', **decision.to_dict()}, status_code=status_code)
+        if status_code == 429:
+            response.headers['Retry-After'] = str(decision.retry_after)
+        return response
+
+    session_id = str(uuid.uuid4())
+    database = request.app.state.database
+    try:
+        async with database.session() as session:
+            new_video = Video(
+                youtube_url=youtube_url,
+                session_id=session_id,
+                title=decision.metadata['title'],
+                duration=decision.metadata['duration'],
+                thumbnail_url=decision.metadata['thumbnail_url'],
+                target_duration=target_duration,
+                profile_enabled=profile_enabled,
+                client_id=client_id,
+                estimated_cost=decision.estimated_cost,
+                status=ProcessStatus.PENDING,
+                progress=0
+            )
+            session.add(new_video)
+            await session.flush()
+            log = ProcessLog(
+                video_id=new_video.id,
+                status=ProcessStatus.PENDING,
+                message=f"{decision.message}（開始までの目安: 約{round(decision.eta_seconds / 60)}分）"
+            )
+            log.set_details({'admission': decision.to_dict()})
+            session.add(log)
+            await session.commit()
+            video_id = new_video.id
+
+        # Celeryへの投入（ブローカーへの送信）は同期のため、スレッドプールで実行する
+        await run_in_threadpool(process_video_task.delay, video_id)
+    except Exception as e:
+        return json_error(f'エラーが発生しました: {str(e)}', 500)
+
+    response = JSONResponse({
+        'status': 'queued',
+        'session_id': session_id,
+        'status_url': request.app.url_path_for('status', session_id=session_id),
+        'eta_seconds': round(decision.eta_seconds),
+        'estimated_cost': round(decision.estimated_cost)
+    }, status_code=202)
+    if database.has_replica:
+        # 登録直後の /status をプライマリで読み取る（src.db_routing と同じCookie）
+        sticky_seconds = flask_app.config['DATABASE_REPLICA_STICKY_SECONDS']
+        response.set_cookie(STICKY_COOKIE, sticky_cookie_expiry(sticky_seconds), max_age=int(sticky_seconds) + 1,
+                            httponly=True, samesite='lax')
+    return response
+
+
+def wants_json(request: Request) -> bool:
+    """JSONで応答するかどうか（Flaskの request.accept_mimetypes.best と同じ判定）"""
+    return parse_accept_header(request.headers.get('accept'), MIMEAccept).best == 'application/json'
+
+
+class ProcessEndpoint:
+    """POST /process（APIクライアントは非同期に受け付け、フォームからの送信はFlaskに渡す）"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        if not wants_json(request):
+            # フラッシュメッセージとテンプレートの表示はFlaskで行う
+            await self.wsgi_app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        response = await submit_job(request)
+        HTTP_REQUEST_DURATION.labels(
+            endpoint='process', method=request.method, status=response.status_code
+        ).observe(time.perf_counter() - started)
+        await response(scope, receive, send)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.notifier.start()
+    try:
+        yield
+    finally:
+        await app.state.notifier.stop()
+        await app.state.database.dispose()
+
+
+def create_asgi_app() -> Starlette:
+    """非同期のエンドポイントとFlaskのアプリを1つのASGIアプリにまとめる"""
+    wsgi_app = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+    with flask_app.app_context():
+        database = AsyncDatabase(db.engines)
+
+    app = Starlette(routes=[
+        Route('/status/{session_id}', status, name='status'),
+        Route('/status/{session_id}/events', status_events, name='status_events'),
+        Route('/video/{session_id}', video, name='video'),
+        Route('/download/{session_id}', download, name='download'),
+        Route('/process', ProcessEndpoint(wsgi_app), methods=['POST'], name='process'),
+        Mount('/', app=wsgi_app),
+    ], lifespan=lifespan)
+    app.state.database = database
+    app.state.notifier = ProgressNotifier()
+    return app
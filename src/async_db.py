@@ -0,0 +1,73 @@
+"""ASGIのWebで使用する非同期のデータベース接続
+
+Flask-SQLAlchemy（同期）のエンジンと同じ接続先・モデルを、SQLAlchemyの非同期エンジンで使用する。
+ドライバーは PostgreSQL が asyncpg、SQLite（ローカル開発）が aiosqlite。
+リードレプリカ（DATABASE_REPLICA_URL）を設定した場合は、読み取り専用のセッションをレプリカに接続する。
+"""
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from sqlalchemy.engine import URL
+from src.db_pool import async_engine_options
+from src.db_routing import REPLICA_BIND
+
+# 同期のドライバーに対応する非同期のドライバー
+_ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(url: URL) -> URL:
+    """同期のエンジンの接続先を非同期のドライバーの接続先にする"""
+    drivername = _ASYNC_DRIVERS.get(url.drivername)
+    if drivername is None:
+        raise ValueError(f"非同期の接続に対応していないデータベースです: {url.drivername}")
+    return url.set(drivername=drivername)
+
+
+class AsyncDatabase:
+    """
+    非同期のエンジンとセッション
+
+    Args:
+        engines: Flask-SQLAlchemy の db.engines（SQLiteの相対パスを解決済みの接続先を使用する）
+    """
+
+    def __init__(self, engines: Dict):
+        self.urls = {key: async_url(engine.url) for key, engine in engines.items()}
+        self._engines = {}
+        self._sessionmakers = {}
+
+    def _sessionmaker(self, key: Optional[str]):
+        if key not in self._sessionmakers:
+            from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+            url = self.urls[key]
+            engine = create_async_engine(url, **async_engine_options(url.render_as_string(hide_password=False)))
+            self._engines[key] = engine
+            self._sessionmakers[key] = async_sessionmaker(engine, expire_on_commit=False)
+        return self._sessionmakers[key]
+
+    @property
+    def has_replica(self) -> bool:
+        return REPLICA_BIND in self.urls
+
+    @asynccontextmanager
+    async def session(self, use_replica: bool = False):
+        """
+        非同期のセッション（コミットは呼び出し側で行う）
+
+        Args:
+            use_replica: リードレプリカに接続するかどうか（レプリカが未設定の場合はプライマリ）
+        """
+        key = REPLICA_BIND if use_replica and self.has_replica else None
+        async with self._sessionmaker(key)() as session:
+            yield session
+
+    async def dispose(self):
+        """すべてのエンジンの接続を閉じる"""
+        for engine in self._engines.values():
+            await engine.dispose()
+        self._engines.clear()
+        self._sessionmakers.clear()
@@ -1,5 +1,7 @@
 from flask_migrate import Migrate
 from src.models import db
+from src.db_pool import configure_pool
+from src.transcript_search import ensure_search_index
 
 migrate = Migrate()
 
@@ -9,4 +11,8 @@ def init_db(app):
     migrate.init_app(app, db)
     
     with app.app_context():
-        db.create_all()
\ No newline at end of file
+        # 接続プールを監視し、フォークした子プロセス（Celeryのワーカーなど）では引き継いだ接続を使わない
+        configure_pool(db.engines.values())
+        db.create_all()
+        # 文字起こしの検索用の仮想テーブル（SQLite）はcreate_allでは作成されない
+        ensure_search_index()
\ No newline at end of file
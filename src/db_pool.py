@@ -0,0 +1,215 @@
+"""データベースの接続プールの設定
+
+これまではWeb・ワーカーともにFlask-SQLAlchemyの既定（1プロセスあたり最大15接続）で接続していたため、
+ワーカーを増やすとPostgreSQLの接続数の上限に達していた。また、アプリの作成後にフォークした
+Celeryの子プロセスは、親プロセスが作成した接続をプールごと引き継いでいた。
+このモジュールは次のように接続を管理する。
+
+- プロセスの種類（DB_PROCESS_TYPE: 'web' / 'worker' / 'asgi'）ごとに、必要な数だけの接続数を既定にする。
+  プリフォークのワーカーは1プロセスで1タスクずつ処理するため、セッションとハートビートの2接続で足りる
+- フォークした子プロセスでは、引き継いだ接続を閉じずに（親プロセスが使用中のため）プールから切り離す
+- DB_PGBOUNCER を有効にすると、接続をPgBouncer（トランザクションプーリング）に任せ、アプリ側ではプールしない
+- 貸し出し中の接続数・pool_sizeを超えた接続数・取得の待ち時間をPrometheusのメトリクスに記録する
+
+接続にはプロセスの種類を application_name として設定するため、pg_stat_activity で接続元を確認できる。
+"""
+import os
+import threading
+import time
+from typing import Dict, Iterable, Tuple
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+from src.instrumentation import (DB_POOL_CHECKED_OUT, DB_POOL_OVERFLOW, DB_POOL_CONNECTIONS, DB_POOL_WAIT,
+                                 DB_POOL_TIMEOUTS)
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('true', '1', 't')
+
+
+# プロセスの種類（celery_worker.py はアプリを読み込む前に 'worker' を設定する）
+PROCESS_TYPE = os.getenv('DB_PROCESS_TYPE', 'web')
+
+# プロセスの種類ごとの既定の (pool_size, max_overflow)
+# Web: gunicornの同期ワーカーは1リクエストずつ処理する（管理用のAPIなどで同時に使う分を少し残す）
+# ワーカー: タスクのセッションとハートビートのスレッドで2接続
+# ASGI: 1プロセスで多数のリクエストを並行して処理する（接続を使うのはクエリの間だけのため、接続数は同時接続数より少なくてよい）
+# （DB_POOL_SIZE: 1プロセスで保持する接続数、DB_MAX_OVERFLOW: 一時的に追加で作成できる接続数 で上書きできる）
+_POOL_DEFAULTS = {'web': (3, 2), 'worker': (2, 1), 'asgi': (5, 10)}
+
+# 接続の空きを待つ時間（秒）
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+
+# この時間（秒）より古い接続は作り直す（ロードバランサーなどによるアイドル接続の切断への対策）
+POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+# 接続の貸し出し前に切断されていないかを確認する
+POOL_PRE_PING = _env_flag('DB_POOL_PRE_PING', 'True')
+
+# PgBouncer（トランザクションプーリング）経由で接続する
+PGBOUNCER = _env_flag('DB_PGBOUNCER', 'False')
+
+
+def pool_limits(process_type: str = PROCESS_TYPE) -> Tuple[int, int]:
+    """プロセスの種類ごとの (pool_size, max_overflow)"""
+    default_size, default_overflow = _POOL_DEFAULTS.get(process_type, _POOL_DEFAULTS['web'])
+    return (int(os.getenv('DB_POOL_SIZE', str(default_size))),
+            int(os.getenv('DB_MAX_OVERFLOW', str(default_overflow))))
+
+
+class InstrumentedQueuePool(QueuePool):
+    """接続の取得にかかった時間とタイムアウトを記録する QueuePool"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.labels(process=PROCESS_TYPE).inc()
+            raise
+        finally:
+            DB_POOL_WAIT.labels(process=PROCESS_TYPE).observe(time.perf_counter() - started)
+
+
+def engine_options(database_uri: str, process_type: str = PROCESS_TYPE) -> Dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS に設定するエンジンのオプション
+
+    SQLite（ローカル開発）は接続数の上限がないため、Flask-SQLAlchemyの既定のままにする。
+    """
+    if not database_uri.startswith('postgresql'):
+        return {}
+
+    connect_args = {'application_name': f'ai-kirinuki-{process_type}'}
+    if PGBOUNCER:
+        # PgBouncerが接続をプールするため、アプリ側ではトランザクションごとに接続する
+        # （psycopg2はサーバー側のプリペアドステートメントを使用しないため、トランザクションプーリングで動作する）
+        return {'poolclass': NullPool, 'connect_args': connect_args}
+
+    pool_size, max_overflow = pool_limits(process_type)
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': POOL_TIMEOUT,
+        'pool_recycle': POOL_RECYCLE,
+        'pool_pre_ping': POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
+def async_engine_options(database_uri: str, process_type: str = PROCESS_TYPE) -> Dict:
+    """
+    ASGIの非同期エンジン（asyncpg）のオプション
+
+    接続数・タイムアウトは engine_options と同じ設定を使用する（プールは非同期用の AsyncAdaptedQueuePool）。
+    """
+    if not database_uri.startswith('postgresql'):
+        return {}
+
+    connect_args = {'server_settings': {'application_name': f'ai-kirinuki-{process_type}'}}
+    if PGBOUNCER:
+        # トランザクションプーリングではプリペアドステートメントのキャッシュ（asyncpgとSQLAlchemyの両方）を使用できない
+        connect_args.update({'statement_cache_size': 0, 'prepared_statement_cache_size': 0})
+        return {'poolclass': NullPool, 'connect_args': connect_args}
+
+    pool_size, max_overflow = pool_limits(process_type)
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': POOL_TIMEOUT,
+        'pool_recycle': POOL_RECYCLE,
+        'pool_pre_ping': POOL_PRE_PING,
+        'connect_args': connect_args,
+    }
+
+
+class PoolMonitor:
+    """接続プールのイベントから、開いている接続数と貸し出し中の接続数を数えてメトリクスに反映する"""
+
+    def __init__(self, process_type: str = PROCESS_TYPE):
+        self.process_type = process_type
+        self.engines = []
+        self.connections = 0
+        self.checked_out = 0
+        self._lock = threading.Lock()
+
+    def attach(self, engine):
+        """エンジン（dispose で作り直したプールを含む）のイベントを監視する"""
+        self.engines.append(engine)
+        event.listen(engine, 'connect', lambda *args: self._update(engine, connections=1))
+        event.listen(engine, 'close', lambda *args: self._update(engine, connections=-1))
+        event.listen(engine, 'close_detached', lambda *args: self._update(engine, connections=-1))
+        event.listen(engine, 'checkout', lambda *args: self._update(engine, checked_out=1))
+        event.listen(engine, 'checkin', lambda *args: self._update(engine, checked_out=-1))
+
+    def _update(self, engine, connections: int = 0, checked_out: int = 0):
+        with self._lock:
+            self.connections = max(0, self.connections + connections)
+            self.checked_out = max(0, self.checked_out + checked_out)
+            DB_POOL_CONNECTIONS.labels(process=self.process_type).set(self.connections)
+            DB_POOL_CHECKED_OUT.labels(process=self.process_type).set(self.checked_out)
+            overflow = engine.pool.overflow() if isinstance(engine.pool, QueuePool) else 0
+            DB_POOL_OVERFLOW.labels(process=self.process_type).set(max(0, overflow))
+
+    def reset(self):
+        """フォーク直後の子プロセスで、親プロセスの接続の数え方を引き継がないよう初期化する"""
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.checked_out = 0
+
+    def dispose_after_fork(self):
+        """
+        フォークした子プロセスで、引き継いだ接続をプールから切り離す
+
+        close=False のため親プロセスの接続は閉じず（ソケットは親プロセスが使用している）、
+        子プロセスは最初のクエリで自分の接続を作成する。
+        """
+        for engine in self.engines:
+            engine.dispose(close=False)
+        self.reset()
+
+
+_monitor = PoolMonitor()
+_fork_handler_registered = False
+
+
+def configure_pool(engines: Iterable):
+    """
+    エンジンの接続プールを監視し、フォークした子プロセスで接続を作り直すよう登録する
+
+    Celeryのプリフォークの子プロセスや gunicorn --preload のワーカーのように、
+    アプリの作成後にフォークするすべての場合に対応するため、os.register_at_fork を使用する。
+    """
+    global _fork_handler_registered
+    for engine in engines:
+        _monitor.attach(engine)
+    if not _fork_handler_registered and hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_monitor.dispose_after_fork)
+        _fork_handler_registered = True
+
+
+def pool_status() -> Dict:
+    """このプロセスの接続プールの状態"""
+    status = {
+        'process_type': PROCESS_TYPE,
+        'pgbouncer': PGBOUNCER,
+        'connections': _monitor.connections,
+        'checked_out': _monitor.checked_out,
+        'engines': [],
+    }
+    for engine in _monitor.engines:
+        pool = engine.pool
+        entry = {'pool_class': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update({
+                'pool_size': pool.size(),
+                'max_overflow': pool._max_overflow,
+                'timeout': pool.timeout(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': max(0, pool.overflow()),
+            })
+        status['engines'].append(entry)
+    return status
@@ -0,0 +1,112 @@
+"""読み取り専用のリクエストのリードレプリカへの振り分け
+
+/status のポーリングや /history・/detail・/result の表示は読み取りだけだが、タスクの書き込みと同じ
+プライマリのデータベースに接続していた。DATABASE_REPLICA_URL を設定すると、read_only を付けた
+ビューの読み取りをリードレプリカに振り分ける。
+
+- 書き込み（flush）は常にプライマリで行う。タスク（Celery）やCLIはリクエストの外のため、常にプライマリを使用する
+- レプリカは書き込みから遅れて反映されるため、書き込みを行ったリクエストの応答にCookieを設定し、
+  その後 DATABASE_REPLICA_STICKY_SECONDS 秒間は同じクライアントの読み取りもプライマリで行う
+  （ジョブの登録直後に処理状況のページを開いても「見つかりません」にならない）
+
+DATABASE_REPLICA_URL が未設定の場合はすべてプライマリを使用する。
+接続先と時間は create_app でアプリの設定（app.config）に読み込む。
+"""
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from src.instrumentation import DB_READ_ROUTING
+
+# リードレプリカのバインドキー
+REPLICA_BIND = 'replica'
+
+# 読み取りをプライマリで行う期限（UNIX時間）を保存するCookie
+STICKY_COOKIE = 'kirinuki_primary_until'
+
+
+class RoutingSession(Session):
+    """read_only のビューの読み取りをリードレプリカに振り分けるセッション"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('db_use_replica'):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_binds(replica_url, engine_options):
+    """
+    SQLALCHEMY_BINDS に設定するリードレプリカのバインド（未設定の場合は空）
+
+    Args:
+        replica_url: リードレプリカの接続先
+        engine_options: エンジンのオプション（プライマリと同じ接続プールの設定）
+    """
+    if not replica_url:
+        return {}
+    return {REPLICA_BIND: {'url': replica_url, **engine_options}}
+
+
+def primary_required(cookies) -> bool:
+    """このクライアントが直前に書き込みを行ったかどうか（Cookieの期限内か）"""
+    try:
+        return float(cookies.get(STICKY_COOKIE, '0')) > time.time()
+    except ValueError:
+        return False
+
+
+def sticky_cookie_expiry(sticky_seconds: float) -> str:
+    """
+    書き込みを行ったクライアントに設定するCookieの値（読み取りをプライマリで行う期限）
+
+    Args:
+        sticky_seconds: 読み取りをプライマリで行う時間（秒、DATABASE_REPLICA_STICKY_SECONDS）
+    """
+    return str(time.time() + sticky_seconds)
+
+
+def read_only(view):
+    """
+    読み取りだけを行うビューに付けるデコレータ（リードレプリカが設定されていれば、そちらで読み取る）
+
+    直前に書き込みを行ったクライアントのリクエストは、レプリカへの反映を待たずに読めるようプライマリで処理する。
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        use_replica = (REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {})
+                       and not primary_required(request.cookies))
+        g.db_use_replica = use_replica
+        DB_READ_ROUTING.labels(target='replica' if use_replica else 'primary').inc()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _mark_written(session, flush_context):
+    """リクエスト内の書き込みを記録する（応答時に read-your-writes のCookieを設定する）"""
+    if has_request_context():
+        g.db_wrote = True
+
+
+def init_routing(app):
+    """
+    書き込みを行ったクライアントに read-your-writes のCookieを設定する（リードレプリカを設定した場合のみ）
+
+    db.session は models.py で RoutingSession を使用するよう設定している。
+    """
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return
+
+    if not event.contains(RoutingSession, 'after_flush', _mark_written):
+        event.listen(RoutingSession, 'after_flush', _mark_written)
+
+    sticky_seconds = app.config['DATABASE_REPLICA_STICKY_SECONDS']
+
+    @app.after_request
+    def set_read_your_writes_cookie(response):
+        if g.pop('db_wrote', False):
+            response.set_cookie(STICKY_COOKIE, sticky_cookie_expiry(sticky_seconds),
+                                max_age=int(sticky_seconds) + 1, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,249 @@
+"""動画のダウンロードエンジン
+
+yt-dlpの既定の設定では1つのジョブが1本の接続で順番にダウンロードするため、
+ダウンロード中のワーカーはほとんどの時間をネットワークの待ち時間に費やしていた。
+このモジュールは次の設定でyt-dlpを実行する。
+
+- HLS/DASHのフラグメントを並列にダウンロードする（DOWNLOAD_CONCURRENT_FRAGMENTS）
+- 失敗したフラグメントはファイル全体ではなくフラグメント単位で再試行し、
+  中断した場合も .part / .ytdl ファイルから途中のフラグメントまで再開する
+- 全ワーカー合計のダウンロード帯域（DOWNLOAD_BANDWIDTH_LIMIT）をRedisのトークンバケットで共有し、
+  ダウンロードがS3への転送などほかの通信の帯域を使い切らないようにする
+
+2段階ダウンロード（TWO_PHASE_DOWNLOAD）を有効にすると、最初は文字起こし・解析用の低画質版だけを取得し、
+書き出し時に選択したハイライトの区間だけを高画質で取得する（yt-dlpの download_ranges）。
+数時間の配信では、転送量とディスク使用量が1桁程度小さくなる。
+
+ダウンロードはI/O待ちが中心のため、download_task は専用のキュー（DOWNLOAD_QUEUE）に振り分け、
+スレッドプールのワーカー（celery worker -Q downloads -P threads）で1プロセスあたり多数を並行して実行する。
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ダウンロードタスクを振り分けるキュー
+DOWNLOAD_QUEUE = os.getenv('DOWNLOAD_QUEUE', 'downloads')
+
+# 並列にダウンロードするフラグメント数
+CONCURRENT_FRAGMENTS = int(os.getenv('DOWNLOAD_CONCURRENT_FRAGMENTS', '8'))
+
+# フラグメント単位・リクエスト単位の再試行回数
+FRAGMENT_RETRIES = int(os.getenv('DOWNLOAD_FRAGMENT_RETRIES', '10'))
+HTTP_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', '5'))
+
+# 全ワーカー合計のダウンロード帯域の上限（バイト/秒、0の場合は無制限）
+BANDWIDTH_LIMIT = float(os.getenv('DOWNLOAD_BANDWIDTH_LIMIT', '0'))
+
+# 2段階ダウンロード（低画質版で解析し、ハイライトの区間だけを高画質で取得する）
+TWO_PHASE_DOWNLOAD = os.getenv('TWO_PHASE_DOWNLOAD', 'False').lower() in ('true', '1', 't')
+
+# 2段階ダウンロードで最初に取得する低画質版のフォーマット（シーン検出のため映像も取得する）
+PREVIEW_FORMAT = os.getenv('TWO_PHASE_PREVIEW_FORMAT', 'b[height<=360][ext=mp4]/bv*[height<=360]+ba/w')
+
+# 区間を並行して取得する数
+SECTION_CONCURRENCY = int(os.getenv('DOWNLOAD_SECTION_CONCURRENCY', '4'))
+
+# 帯域の消費をまとめてRedisに問い合わせる単位（バイト）
+BANDWIDTH_CHUNK = 1024 * 1024
+
+# 帯域のトークンバケット（未設定の場合はCeleryのブローカーと同じRedisを使用）
+BANDWIDTH_REDIS_URL = os.getenv('DOWNLOAD_BANDWIDTH_REDIS_URL') or os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+BANDWIDTH_KEY = 'kirinuki:download:bandwidth'
+
+# トークンバケットから n バイト分を取り出し、不足している場合は待つべき秒数を返す。
+# 不足分は借りとして記録する（後続の呼び出しがその分だけ待つ）ため、複数のワーカーで公平に分け合える。
+# 時刻はワーカー間の時計のずれの影響を受けないよう、Redisのサーバー時刻を使用する。
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * rate) - requested
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], 60)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+
+class BandwidthBudget:
+    """
+    全ワーカーで共有するダウンロード帯域の予算
+
+    yt-dlpの進捗フックから呼び出し、受信したバイト数に応じて必要なだけ待つ。
+    フックはダウンロード中のスレッド（並列フラグメントの場合はその各スレッド）で呼ばれるため、
+    待つことでそのダウンロードの速度が抑えられる。Redisに接続できない場合は制限しない。
+    """
+
+    def __init__(self, limit: float = BANDWIDTH_LIMIT, redis_url: str = BANDWIDTH_REDIS_URL):
+        self.limit = limit
+        self.redis_url = redis_url
+        self._script = None
+        self._lock = threading.Lock()
+        self._disabled = limit <= 0
+
+    def _acquire_script(self):
+        if self._script is None:
+            import redis
+            client = redis.Redis.from_url(self.redis_url, socket_timeout=1, socket_connect_timeout=1)
+            self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+        return self._script
+
+    def consume(self, num_bytes: int):
+        """num_bytes バイトを受信したことを記録し、帯域の上限を超えている場合は待つ"""
+        if self._disabled or num_bytes <= 0:
+            return
+        try:
+            wait = float(self._acquire_script()(keys=[BANDWIDTH_KEY], args=[self.limit, self.limit, num_bytes]))
+        except Exception as e:
+            logger.warning(f"帯域の予算を取得できないため、制限せずにダウンロードします: {str(e)}")
+            self._disabled = True
+            return
+        if wait > 0:
+            time.sleep(wait)
+
+    def progress_hook(self) -> Callable[[Dict], None]:
+        """ダウンロード1件分の進捗フック（受信量を BANDWIDTH_CHUNK 単位でまとめて consume する）"""
+        state = {'filename': None, 'reported': 0, 'pending': 0}
+
+        def hook(status: Dict):
+            downloaded = status.get('downloaded_bytes')
+            if downloaded is None:
+                return
+            with self._lock:
+                # 形式（映像・音声）ごとに出力ファイルが異なり、downloaded_bytes は0から数え直される
+                if status.get('filename') != state['filename']:
+                    state['filename'] = status.get('filename')
+                    state['reported'] = 0
+                delta = max(0, downloaded - state['reported'])
+                state['reported'] = max(state['reported'], downloaded)
+                state['pending'] += delta
+                if state['pending'] < BANDWIDTH_CHUNK and status.get('status') != 'finished':
+                    return
+                num_bytes, state['pending'] = state['pending'], 0
+            self.consume(num_bytes)
+
+        return hook
+
+
+_budget = None
+
+
+def bandwidth_budget() -> BandwidthBudget:
+    """プロセス内で共有する帯域の予算"""
+    global _budget
+    if _budget is None:
+        _budget = BandwidthBudget()
+    return _budget
+
+
+def build_ydl_options(output_path: str, progress_hooks: Optional[List[Callable]] = None, **overrides) -> Dict:
+    """
+    ダウンロード用のyt-dlpのオプションを作成する
+
+    Args:
+        output_path: 出力ファイルのパス
+        progress_hooks: 追加の進捗フック
+        overrides: 上書きするオプション（'format' など）
+    """
+    options = {
+        'format': 'best[ext=mp4]/best',  # 最高品質のmp4を選択、なければ最高品質
+        'outtmpl': output_path,          # 出力ファイルパス
+        'quiet': True,                   # 並行して実行するため、進捗の表示は行わない
+        'noprogress': True,
+        'no_warnings': False,            # 警告を表示
+        'ignoreerrors': False,           # エラーを無視しない
+        'noplaylist': True,              # プレイリストをダウンロードしない
+        'geo_bypass': True,              # 地域制限をバイパス
+        'nocheckcertificate': True,      # SSL証明書チェックを無効化
+        'continuedl': True,              # 中断したダウンロードを途中から再開する
+        'nopart': False,                 # 再開できるよう、ダウンロード中は .part ファイルに書き込む
+        'concurrent_fragment_downloads': CONCURRENT_FRAGMENTS,  # HLS/DASHのフラグメントを並列にダウンロード
+        'retries': HTTP_RETRIES,
+        'fragment_retries': FRAGMENT_RETRIES,  # 失敗したフラグメントだけを再試行する
+        'skip_unavailable_fragments': False,   # 欠けたフラグメントがある場合は失敗させる（再開時に取得し直す）
+        'retry_sleep_functions': {
+            'http': lambda n: min(2 ** n, 30),
+            'fragment': lambda n: min(2 ** n, 30),
+        },
+        'progress_hooks': [bandwidth_budget().progress_hook(), *(progress_hooks or [])],
+    }
+    options.update(overrides)
+    return options
+
+
+def download_media(url: str, output_path: str, progress_hooks: Optional[List[Callable]] = None, **overrides) -> str:
+    """
+    URLの動画をダウンロードする（出力ファイルが既にある場合はダウンロードしない）
+
+    Args:
+        url: 動画のURL（YouTubeのほか、yt-dlpが対応するHLS/DASHのマニフェストなど）
+        output_path: 出力ファイルのパス
+        progress_hooks: 追加の進捗フック
+        overrides: 上書きするyt-dlpのオプション
+
+    Returns:
+        出力ファイルのパス
+    """
+    if os.path.exists(output_path):
+        logger.info(f"ダウンロード済みのファイルを再利用: {output_path}")
+        return output_path
+
+    # yt_dlpはダウンロード時にのみ読み込む
+    import yt_dlp
+
+    with yt_dlp.YoutubeDL(build_ydl_options(output_path, progress_hooks, **overrides)) as ydl:
+        logger.info(f"動画のダウンロードを開始: {url}")
+        ydl.download([url])
+
+    if not os.path.exists(output_path):
+        raise ValueError("動画のダウンロードに失敗しました")
+    return output_path
+
+
+def section_filename(start_time: float, end_time: float) -> str:
+    """区間のファイル名（区間が変わった場合は別のファイルになる）"""
+    return f"section_{int(round(start_time * 1000))}_{int(round(end_time * 1000))}.mp4"
+
+
+def download_sections(url: str, sections: Sequence[Tuple[float, float]], output_dir: str,
+                      progress_hooks: Optional[List[Callable]] = None) -> List[str]:
+    """
+    動画の指定した区間だけをダウンロードする（取得済みの区間は再利用する）
+
+    区間の境界で正確に切り出せるよう、境界にキーフレームを入れる（区間内だけ再エンコードされる）。
+
+    Args:
+        url: 動画のURL
+        sections: 取得する区間（開始時間, 終了時間）のリスト
+        output_dir: 保存先ディレクトリ
+        progress_hooks: 追加の進捗フック
+
+    Returns:
+        区間ごとの動画ファイルのパス（sections と同じ順）
+    """
+    from yt_dlp.utils import download_range_func
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    def fetch(section: Tuple[float, float]) -> str:
+        start_time, end_time = section
+        return download_media(
+            url, os.path.join(output_dir, section_filename(start_time, end_time)), progress_hooks,
+            download_ranges=download_range_func(None, [(start_time, end_time)]),
+            force_keyframes_at_cuts=True,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, SECTION_CONCURRENCY)) as executor:
+        return list(executor.map(fetch, sections))
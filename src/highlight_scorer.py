@@ -0,0 +1,354 @@
+"""音声エネルギーと発話密度によるハイライトスコアリング
+
+ビジョンモデルを使わず、CPUのみで動作する軽量なスコアラー。
+音声からRMS音量とスペクトルフラックスを、文字起こしから発話速度と
+キーワード出現数をフレーム単位で求め、ウィンドウ単位に集約してスコア化する。
+"""
+import os
+import subprocess
+import numpy as np
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 解析用に音声をデコードする際のサンプリングレート（Hz）
+ANALYSIS_SAMPLE_RATE = 8000
+
+# 特徴量を計算するフレームの長さ（秒）
+FRAME_SECONDS = 0.1
+
+# 一度に読み込んでFFTするフレーム数（メモリ使用量の上限を決める）
+FRAMES_PER_BLOCK = 600
+
+# 音声特徴量のキャッシュファイルの拡張子（解析対象の動画と同じ場所に保存する）
+FEATURES_CACHE_SUFFIX = '.features.npz'
+
+# 盛り上がりを示すキーワード（環境変数 HIGHLIGHT_KEYWORDS で上書き可能）
+DEFAULT_KEYWORDS = ['すごい', 'すげえ', 'やばい', 'ヤバい', 'マジ', 'えぇ', 'うわ', 'おお', '草', '笑', 'きた', 'キタ']
+
+# 各特徴量の重み
+FEATURE_WEIGHTS = {
+    'rms': 0.35,
+    'flux': 0.25,
+    'speech_rate': 0.25,
+    'keywords': 0.15,
+}
+
+
+def load_keywords() -> List[str]:
+    """環境変数からキーワード一覧を取得する"""
+    value = os.getenv('HIGHLIGHT_KEYWORDS')
+    if not value:
+        return list(DEFAULT_KEYWORDS)
+    return [keyword.strip() for keyword in value.split(',') if keyword.strip()]
+
+
+def make_windows(duration: float, segment_length: float, overlap: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    動画全体を固定長のウィンドウに分割する
+
+    Args:
+        duration: 動画の長さ（秒）
+        segment_length: ウィンドウの長さ（秒）
+        overlap: 連続するウィンドウ間のオーバーラップ（秒）
+
+    Returns:
+        (開始時間の配列, 終了時間の配列)
+    """
+    step = segment_length - overlap
+    if step <= 0:
+        raise ValueError("overlapはsegment_lengthより小さくしてください")
+
+    starts = np.arange(0.0, duration, step, dtype=np.float64)
+    ends = np.minimum(starts + segment_length, duration)
+    return starts, ends
+
+
+def compute_audio_frame_features(media_path: str, sample_rate: int = ANALYSIS_SAMPLE_RATE,
+                                 frame_seconds: float = FRAME_SECONDS,
+                                 duration: Optional[float] = None,
+                                 progress_callback: Optional[Callable[[float], None]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    FFmpegで音声をデコードし、フレームごとのRMS音量とスペクトルフラックスを計算する
+
+    音声はブロック単位でストリーミング処理するため、長時間の動画でも
+    メモリ使用量はブロックサイズに比例した一定量に収まる。
+
+    Args:
+        media_path: 動画または音声ファイルのパス
+        sample_rate: デコード時のサンプリングレート
+        frame_seconds: フレームの長さ（秒）
+        duration: 音声の長さ（秒、進捗の計算に使用）
+        progress_callback: デコード済みの割合（0〜1）を受け取る関数
+
+    Returns:
+        (RMS配列, スペクトルフラックス配列)
+    """
+    frame_size = int(sample_rate * frame_seconds)
+    block_bytes = frame_size * FRAMES_PER_BLOCK * 2  # s16leなので1サンプル2バイト
+    window = np.hanning(frame_size).astype(np.float32)
+
+    command = [
+        'ffmpeg', '-nostdin', '-v', 'error',
+        '-i', media_path,
+        '-vn', '-ac', '1', '-ar', str(sample_rate),
+        '-f', 's16le', '-'
+    ]
+
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise Exception("FFmpegがインストールされていないか、パスが通っていません。インストール方法はREADMEを参照してください。")
+
+    rms_blocks = []
+    flux_blocks = []
+    previous_spectrum = None
+    remainder = b''
+    frames_done = 0
+
+    try:
+        while True:
+            chunk = process.stdout.read(block_bytes)
+            if not chunk:
+                break
+
+            data = remainder + chunk
+            usable = (len(data) // (frame_size * 2)) * frame_size * 2
+            remainder = data[usable:]
+            if usable == 0:
+                continue
+
+            samples = np.frombuffer(data[:usable], dtype=np.int16).astype(np.float32) / 32768.0
+            frames = samples.reshape(-1, frame_size)
+
+            rms_blocks.append(np.sqrt(np.mean(frames * frames, axis=1)))
+
+            spectrum = np.abs(np.fft.rfft(frames * window, axis=1))
+            if previous_spectrum is None:
+                previous = np.vstack([spectrum[:1], spectrum[:-1]])
+            else:
+                previous = np.vstack([previous_spectrum, spectrum[:-1]])
+            flux_blocks.append(np.maximum(spectrum - previous, 0.0).sum(axis=1))
+            previous_spectrum = spectrum[-1:]
+            
+            frames_done += len(frames)
+            if progress_callback and duration:
+                progress_callback(min(frames_done * frame_seconds / duration, 1.0))
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode('utf-8', errors='ignore')
+        process.stderr.close()
+        process.wait()
+
+    if process.returncode != 0 and not rms_blocks:
+        # 音声トラックが存在しない動画の場合は空の特徴量として扱う
+        if 'does not contain any stream' in stderr or 'Output file #0 does not contain' in stderr:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+        raise Exception(f"音声のデコード中にエラーが発生しました: {stderr.strip()}")
+
+    if not rms_blocks:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+    return np.concatenate(rms_blocks), np.concatenate(flux_blocks)
+
+
+def _segment_field(segment, name):
+    """辞書とTranscriptSegmentの両方からフィールドを取り出す"""
+    if isinstance(segment, dict):
+        return segment.get(name)
+    return getattr(segment, name, None)
+
+
+def compute_transcript_frame_features(segments: Iterable, n_frames: int, keywords: Sequence[str],
+                                      frame_seconds: float = FRAME_SECONDS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    文字起こしセグメントからフレームごとの発話速度とキーワード出現数を計算する
+
+    日本語は単語区切りがないため、発話速度は空白を除いた文字数/秒で近似する。
+
+    Args:
+        segments: 文字起こしセグメント（辞書またはTranscriptSegment）
+        n_frames: フレーム数
+        keywords: 盛り上がりを示すキーワード
+        frame_seconds: フレームの長さ（秒）
+
+    Returns:
+        (発話速度配列, キーワード出現数配列)
+    """
+    speech_rate = np.zeros(n_frames, dtype=np.float64)
+    keyword_hits = np.zeros(n_frames, dtype=np.float64)
+    if n_frames == 0:
+        return speech_rate, keyword_hits
+
+    starts, ends, char_counts, hit_counts = [], [], [], []
+    for segment in segments:
+        text = _segment_field(segment, 'text') or ''
+        starts.append(float(_segment_field(segment, 'start_time') or 0.0))
+        ends.append(float(_segment_field(segment, 'end_time') or 0.0))
+        char_counts.append(len(''.join(text.split())))
+        hit_counts.append(sum(text.count(keyword) for keyword in keywords))
+
+    if not starts:
+        return speech_rate, keyword_hits
+
+    starts = np.asarray(starts)
+    ends = np.maximum(np.asarray(ends), starts + frame_seconds)
+    char_counts = np.asarray(char_counts, dtype=np.float64)
+    hit_counts = np.asarray(hit_counts, dtype=np.float64)
+
+    # 差分配列で各セグメントの発話速度をフレーム上に展開する
+    start_idx = np.clip((starts / frame_seconds).astype(np.int64), 0, n_frames)
+    end_idx = np.clip(np.ceil(ends / frame_seconds).astype(np.int64), 0, n_frames)
+    rates = char_counts / (ends - starts)
+
+    diff = np.zeros(n_frames + 1, dtype=np.float64)
+    np.add.at(diff, start_idx, rates)
+    np.add.at(diff, end_idx, -rates)
+    speech_rate = np.cumsum(diff[:-1])
+
+    # キーワード出現数はセグメントの中央のフレームに計上する
+    mid_idx = np.clip(((starts + ends) / 2 / frame_seconds).astype(np.int64), 0, n_frames - 1)
+    np.add.at(keyword_hits, mid_idx, hit_counts)
+
+    return speech_rate, keyword_hits
+
+
+def aggregate_windows(frame_values: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                      frame_seconds: float = FRAME_SECONDS, reduce: str = 'mean') -> np.ndarray:
+    """
+    フレーム単位の特徴量をウィンドウ単位に集約する（累積和による一括計算）
+
+    Args:
+        frame_values: フレームごとの特徴量
+        starts: ウィンドウの開始時間
+        ends: ウィンドウの終了時間
+        frame_seconds: フレームの長さ（秒）
+        reduce: 'mean'（平均）または 'sum'（合計）
+
+    Returns:
+        ウィンドウごとの特徴量
+    """
+    n_frames = len(frame_values)
+    if n_frames == 0:
+        return np.zeros(len(starts), dtype=np.float64)
+
+    cumulative = np.concatenate([[0.0], np.cumsum(frame_values, dtype=np.float64)])
+    first = np.clip((starts / frame_seconds).astype(np.int64), 0, n_frames - 1)
+    last = np.clip(np.ceil(ends / frame_seconds).astype(np.int64), first + 1, n_frames)
+
+    totals = cumulative[last] - cumulative[first]
+    if reduce == 'sum':
+        return totals
+    return totals / (last - first)
+
+
+def _standardize(values: np.ndarray) -> np.ndarray:
+    """特徴量を標準化する（分散がない場合は0）"""
+    std = values.std()
+    if values.size == 0 or std < 1e-12:
+        return np.zeros_like(values, dtype=np.float64)
+    return np.clip((values - values.mean()) / std, -3.0, 3.0)
+
+
+def score_windows(features: Dict[str, np.ndarray], weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """
+    ウィンドウごとの特徴量を重み付けして0〜1の重要度スコアに変換する
+
+    Args:
+        features: 特徴量名をキーとするウィンドウ単位の配列
+        weights: 特徴量ごとの重み（省略時はFEATURE_WEIGHTS）
+
+    Returns:
+        重要度スコアの配列
+    """
+    weights = weights or FEATURE_WEIGHTS
+    combined = None
+    for name, weight in weights.items():
+        if name not in features:
+            continue
+        contribution = weight * _standardize(np.asarray(features[name], dtype=np.float64))
+        combined = contribution if combined is None else combined + contribution
+
+    if combined is None:
+        raise ValueError("スコア計算に使用できる特徴量がありません")
+
+    return 1.0 / (1.0 + np.exp(-combined))
+
+
+def _features_cache_path(media_path: str) -> str:
+    root, _ = os.path.splitext(media_path)
+    return root + FEATURES_CACHE_SUFFIX
+
+
+def load_audio_frame_features(media_path: str, duration: Optional[float] = None,
+                              progress_callback: Optional[Callable[[float], None]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    フレームごとの音声特徴量を取得する（計算済みであればキャッシュから読み込む）
+
+    音声のデコードはスコア計算で最も時間のかかる処理のため、結果を動画と同じ場所に
+    保存しておき、解析の再試行やパラメータを変えた再解析では再デコードしない。
+    """
+    cache_path = _features_cache_path(media_path)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(media_path):
+        try:
+            with np.load(cache_path) as cached:
+                if (int(cached['sample_rate']) == ANALYSIS_SAMPLE_RATE
+                        and float(cached['frame_seconds']) == FRAME_SECONDS):
+                    return cached['rms'], cached['flux']
+        except Exception:
+            # 壊れたキャッシュは計算し直す
+            pass
+
+    rms, flux = compute_audio_frame_features(media_path, duration=duration, progress_callback=progress_callback)
+
+    # 書き込み途中のファイルを読み込まないよう、一時ファイルに書き出してから置き換える
+    temp_path = cache_path + '.tmp.npz'
+    try:
+        np.savez(temp_path, rms=rms, flux=flux,
+                 sample_rate=ANALYSIS_SAMPLE_RATE, frame_seconds=FRAME_SECONDS)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return rms, flux
+
+
+def compute_window_scores(media_path: str, starts: np.ndarray, ends: np.ndarray,
+                          transcript_segments: Optional[Iterable] = None,
+                          keywords: Optional[Sequence[str]] = None,
+                          progress_callback: Optional[Callable[[float], None]] = None) -> np.ndarray:
+    """
+    ウィンドウごとの重要度スコアを計算する（メイン関数）
+
+    Args:
+        media_path: 動画または音声ファイルのパス
+        starts: ウィンドウの開始時間
+        ends: ウィンドウの終了時間
+        transcript_segments: 文字起こしセグメント（省略時は音声特徴のみ）
+        keywords: 盛り上がりを示すキーワード（省略時は環境変数または既定値）
+        progress_callback: 音声の解析済みの割合（0〜1）を受け取る関数
+
+    Returns:
+        重要度スコアの配列（0〜1）
+    """
+    duration = float(ends.max()) if len(ends) else None
+    rms, flux = load_audio_frame_features(media_path, duration=duration, progress_callback=progress_callback)
+
+    # 音声の長さとウィンドウ範囲のずれを吸収する
+    n_frames = max(len(rms), int(np.ceil(ends.max() / FRAME_SECONDS)) if len(ends) else 0)
+    if len(rms) < n_frames:
+        rms = np.pad(rms, (0, n_frames - len(rms)))
+        flux = np.pad(flux, (0, n_frames - len(flux)))
+
+    features = {
+        'rms': aggregate_windows(rms, starts, ends),
+        'flux': aggregate_windows(flux, starts, ends),
+    }
+
+    if transcript_segments is not None:
+        speech_rate, keyword_hits = compute_transcript_frame_features(
+            transcript_segments, n_frames, keywords if keywords is not None else load_keywords()
+        )
+        features['speech_rate'] = aggregate_windows(speech_rate, starts, ends)
+        features['keywords'] = aggregate_windows(keyword_hits, starts, ends, reduce='sum')
+
+    return score_windows(features)
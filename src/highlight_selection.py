@@ -0,0 +1,208 @@
+"""ハイライト候補ウィンドウの選択
+
+スコア付きのウィンドウ（開始時間・終了時間・スコアの配列）から、選択ポリシーに
+従ってハイライトを選ぶ。すべてNumPy配列のまま処理し、上位k件の抽出には
+全体のソートではなくargpartitionを使用する。
+"""
+import os
+import numpy as np
+from typing import Optional, Tuple
+
+# 選択ポリシー
+POLICY_PERCENTAGE = 'percentage'  # スコア上位の一定割合を選択
+POLICY_DURATION = 'duration'      # 合計時間が目標以内で重要度の合計が最大になるように選択
+POLICY_THRESHOLD = 'threshold'    # スコアが閾値以上のものを選択
+POLICIES = (POLICY_PERCENTAGE, POLICY_DURATION, POLICY_THRESHOLD)
+
+# ポリシーごとの既定値
+DEFAULT_POLICY_VALUES = {
+    POLICY_PERCENTAGE: 30.0,   # %
+    POLICY_DURATION: 60.0,     # 秒
+    POLICY_THRESHOLD: 0.7,     # スコア（0〜1）
+}
+
+# durationポリシーで選択するクリップ同士の最小間隔（秒）
+DEFAULT_MIN_GAP = 2.0
+
+# durationポリシーの動的計画法で使用する表の最大セル数
+MAX_DP_CELLS = 20_000_000
+
+Windows = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def load_selection_policy() -> Tuple[str, float]:
+    """
+    環境変数から選択ポリシーとその値を取得する
+
+    HIGHLIGHT_POLICY でポリシーを選び、値はそれぞれ HIGHLIGHT_PERCENTAGE、
+    HIGHLIGHT_TARGET_DURATION、HIGHLIGHT_SCORE_THRESHOLD から読み込む。
+    """
+    policy = os.getenv('HIGHLIGHT_POLICY', POLICY_PERCENTAGE).lower()
+    if policy not in POLICIES:
+        raise ValueError(f"未対応の選択ポリシーです: {policy}")
+
+    env_names = {
+        POLICY_PERCENTAGE: 'HIGHLIGHT_PERCENTAGE',
+        POLICY_DURATION: 'HIGHLIGHT_TARGET_DURATION',
+        POLICY_THRESHOLD: 'HIGHLIGHT_SCORE_THRESHOLD',
+    }
+    value = os.getenv(env_names[policy])
+    return policy, float(value) if value else DEFAULT_POLICY_VALUES[policy]
+
+
+def load_min_gap() -> float:
+    """環境変数 HIGHLIGHT_MIN_GAP からクリップ同士の最小間隔を取得する"""
+    value = os.getenv('HIGHLIGHT_MIN_GAP')
+    return float(value) if value else DEFAULT_MIN_GAP
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """スコア上位k件のインデックスを返す（順不同、O(n)）"""
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= n:
+        return np.arange(n)
+    return np.argpartition(-scores, k - 1)[:k]
+
+
+def _take(starts: np.ndarray, ends: np.ndarray, scores: np.ndarray, indices: np.ndarray) -> Windows:
+    """指定インデックスのウィンドウを時間順に並べて返す"""
+    indices = indices[np.argsort(starts[indices], kind='stable')]
+    return starts[indices], ends[indices], scores[indices]
+
+
+def select_by_percentage(starts: np.ndarray, ends: np.ndarray, scores: np.ndarray, percentage: float) -> Windows:
+    """スコア上位の一定割合（%）のウィンドウを選択する（最低1件）"""
+    k = max(1, int(len(scores) * percentage / 100.0)) if len(scores) else 0
+    return _take(starts, ends, scores, top_k_indices(scores, k))
+
+
+def select_by_threshold(starts: np.ndarray, ends: np.ndarray, scores: np.ndarray, threshold: float) -> Windows:
+    """スコアが閾値以上のウィンドウを選択する"""
+    return _take(starts, ends, scores, np.flatnonzero(scores >= threshold))
+
+
+def select_by_duration(starts: np.ndarray, ends: np.ndarray, scores: np.ndarray, target_duration: float,
+                       min_gap: float = 0.0, resolution: float = 1.0) -> Windows:
+    """
+    合計時間が目標時間以内で、重要度の合計が最大となるウィンドウの組み合わせを選択する
+
+    重なりのない（かつmin_gap秒以上離れた）ウィンドウだけを選ぶ、予算付きの区間スケジューリング
+    （ナップサック）を動的計画法で解く。重要度はスコア×長さ（秒）で評価する。
+    時間はresolution秒単位に量子化し、表の大きさがMAX_DP_CELLSを超える場合は
+    量子化の幅を広げるため、最適性は量子化の誤差の範囲で保証される。
+
+    Args:
+        starts: ウィンドウの開始時間
+        ends: ウィンドウの終了時間
+        scores: ウィンドウの重要度スコア
+        target_duration: 目標とする合計時間（秒）
+        min_gap: 選択するウィンドウ同士の最小間隔（秒）
+        resolution: 時間の量子化の幅（秒）
+
+    Returns:
+        時間順に並んだ (開始時間, 終了時間, スコア) の配列
+    """
+    n = len(scores)
+    if n == 0 or target_duration <= 0:
+        return _take(starts, ends, scores, np.zeros(0, dtype=np.int64))
+
+    # 表が大きくなりすぎないように量子化の幅を調整
+    while n * (int(target_duration / resolution) + 1) > MAX_DP_CELLS:
+        resolution *= 2
+    budget = int(target_duration / resolution)
+
+    order = np.argsort(ends, kind='stable')
+    sorted_starts, sorted_ends = starts[order], ends[order]
+    weights = np.maximum(np.ceil((sorted_ends - sorted_starts) / resolution - 1e-9).astype(np.int64), 1)
+    values = scores[order] * (sorted_ends - sorted_starts)
+
+    # previous[j]: ウィンドウjの直前に選択可能な最後のウィンドウの番号（1始まり、0はなし）
+    previous = np.searchsorted(sorted_ends + min_gap, sorted_starts, side='right')
+
+    table = np.zeros((n + 1, budget + 1), dtype=np.float64)
+    keep = np.zeros((n + 1, budget + 1), dtype=bool)
+    for j in range(1, n + 1):
+        weight = weights[j - 1]
+        table[j] = table[j - 1]
+        if weight > budget:
+            continue
+        candidate = table[previous[j - 1], :budget + 1 - weight] + values[j - 1]
+        better = candidate > table[j, weight:]
+        table[j, weight:][better] = candidate[better]
+        keep[j, weight:] = better
+
+    # 選択したウィンドウを復元
+    chosen = []
+    j, b = n, budget
+    while j > 0:
+        if keep[j, b]:
+            chosen.append(order[j - 1])
+            b -= weights[j - 1]
+            j = previous[j - 1]
+        else:
+            j -= 1
+
+    return _take(starts, ends, scores, np.asarray(chosen, dtype=np.int64))
+
+
+def merge_overlapping(starts: np.ndarray, ends: np.ndarray, scores: np.ndarray, gap: float = 0.0) -> Windows:
+    """
+    重なっている（またはgap秒以内で隣接する）ウィンドウを1つに結合する
+
+    結合後のスコアは結合したウィンドウの最大値とする。入力は時間順であること。
+    """
+    if len(starts) == 0:
+        return starts, ends, scores
+
+    running_end = np.maximum.accumulate(ends)
+    breaks = np.flatnonzero(starts[1:] > running_end[:-1] + gap) + 1
+    group_starts = np.concatenate([[0], breaks])
+    group_ends = np.concatenate([breaks, [len(starts)]]) - 1
+
+    return (
+        starts[group_starts],
+        running_end[group_ends],
+        np.maximum.reduceat(scores, group_starts),
+    )
+
+
+def select_highlights(starts: np.ndarray, ends: np.ndarray, scores: np.ndarray,
+                      policy: Optional[str] = None, value: Optional[float] = None,
+                      merge: bool = True, min_gap: Optional[float] = None) -> Windows:
+    """
+    選択ポリシーに従ってハイライトを選択する（メイン関数）
+
+    Args:
+        starts: ウィンドウの開始時間
+        ends: ウィンドウの終了時間
+        scores: ウィンドウの重要度スコア
+        policy: 選択ポリシー（省略時は環境変数から取得）
+        value: ポリシーの値（割合%、目標秒数、スコア閾値）
+        merge: 重なったウィンドウを結合するかどうか
+        min_gap: durationポリシーでのクリップ同士の最小間隔（省略時は環境変数から取得）
+
+    Returns:
+        時間順に並んだ (開始時間, 終了時間, スコア) の配列
+    """
+    if policy is None:
+        policy, env_value = load_selection_policy()
+        value = env_value if value is None else value
+    if value is None:
+        value = DEFAULT_POLICY_VALUES.get(policy)
+
+    if policy == POLICY_PERCENTAGE:
+        selected = select_by_percentage(starts, ends, scores, value)
+    elif policy == POLICY_DURATION:
+        selected = select_by_duration(starts, ends, scores, value,
+                                      min_gap=load_min_gap() if min_gap is None else min_gap)
+    elif policy == POLICY_THRESHOLD:
+        selected = select_by_threshold(starts, ends, scores, value)
+    else:
+        raise ValueError(f"未対応の選択ポリシーです: {policy}")
+
+    if merge:
+        selected = merge_overlapping(*selected)
+
+    return selected
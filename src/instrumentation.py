@@ -0,0 +1,203 @@
+"""処理ステージの計測とPrometheusメトリクス
+
+ダウンロード・音声抽出・文字起こし・解析・動画作成の各ステージについて、
+実時間・CPU時間・ピークメモリ・ディスクI/O量を計測する。計測結果は
+ProcessLog.details に保存され、同時にPrometheusのヒストグラムに記録される。
+
+Webとワーカーはどちらも複数プロセスで動作するため、環境変数
+PROMETHEUS_MULTIPROC_DIR が設定されている場合はprometheus_clientの
+マルチプロセスモードで集計する（プロセス起動前に設定しておくこと）。
+モードはprometheus_clientの読み込み時に決まるため、読み込む前にディレクトリを作成し、
+作成できない場合はシングルプロセスモードで集計する。
+"""
+import logging
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _prepare_multiprocess_dir() -> Optional[str]:
+    """マルチプロセスモードのディレクトリを作成する（未設定・作成できない場合はNone）"""
+    path = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if not path:
+        return None
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"PROMETHEUS_MULTIPROC_DIR を作成できないため、シングルプロセスモードで集計します: {str(e)}")
+        os.environ.pop('PROMETHEUS_MULTIPROC_DIR')
+        return None
+    return path
+
+
+MULTIPROC_DIR = _prepare_multiprocess_dir()
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST  # noqa: E402
+from prometheus_client import multiprocess, values  # noqa: E402
+
+# 集計のモード（prometheus_clientの読み込み時に決まるため、その値クラスから判定する）
+_MULTIPROCESS = values.ValueClass is not values.MutexValue
+
+# ステージの所要時間（数秒〜数時間）に合わせたバケット
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, float('inf'))
+BYTES_BUCKETS = (1e6, 1e7, 5e7, 1e8, 5e8, 1e9, 2e9, 5e9, 1e10, float('inf'))
+
+STAGE_DURATION = Histogram(
+    'kirinuki_stage_duration_seconds', '処理ステージの実時間', ['stage', 'status'], buckets=DURATION_BUCKETS
+)
+STAGE_CPU = Histogram(
+    'kirinuki_stage_cpu_seconds', '処理ステージのCPU時間（子プロセスを含む）', ['stage'], buckets=DURATION_BUCKETS
+)
+STAGE_PEAK_RSS = Histogram(
+    'kirinuki_stage_peak_rss_bytes', '処理ステージ終了時点のピークメモリ', ['stage'], buckets=BYTES_BUCKETS
+)
+STAGE_IO = Histogram(
+    'kirinuki_stage_io_bytes', '処理ステージのディスクI/O量', ['stage', 'direction'], buckets=BYTES_BUCKETS
+)
+STAGE_FAILURES = Counter(
+    'kirinuki_stage_failures_total', '処理ステージの失敗回数', ['stage']
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'kirinuki_http_request_duration_seconds', 'HTTPリクエストの処理時間', ['endpoint', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+)
+ADMISSION_DECISIONS = Counter(
+    'kirinuki_admission_decisions_total', 'ジョブ受付時のアドミッション制御の判定数', ['decision', 'reason']
+)
+ADMISSION_PROBE_DURATION = Histogram(
+    'kirinuki_admission_probe_duration_seconds', '受付時のメタデータ取得の所要時間',
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf'))
+)
+ADMISSION_BACKLOG_SECONDS = Gauge(
+    'kirinuki_admission_backlog_seconds', '受付時点の処理待ち時間の見積もり（秒）', multiprocess_mode='livemax'
+)
+WORKSPACE_USAGE_BYTES = Gauge(
+    'kirinuki_workspace_usage_bytes', '作業ファイルの種類ごとの合計サイズ', ['kind'], multiprocess_mode='livemax'
+)
+WORKSPACE_FREE_BYTES = Gauge(
+    'kirinuki_workspace_free_bytes', '作業ファイルを保存するディスクの空き容量', multiprocess_mode='livemin'
+)
+WORKSPACE_EVICTIONS = Counter(
+    'kirinuki_workspace_evictions_total', '容量を確保するために削除した作業ファイルの数', ['kind']
+)
+WORKSPACE_EVICTED_BYTES = Counter(
+    'kirinuki_workspace_evicted_bytes_total', '容量を確保するために削除した作業ファイルのサイズ', ['kind']
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'kirinuki_db_pool_checked_out', '貸し出し中のデータベース接続の数', ['process'], multiprocess_mode='livesum'
+)
+DB_POOL_OVERFLOW = Gauge(
+    'kirinuki_db_pool_overflow', 'pool_sizeを超えて作成したデータベース接続の数', ['process'], multiprocess_mode='livesum'
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'kirinuki_db_pool_connections', '開いているデータベース接続の数', ['process'], multiprocess_mode='livesum'
+)
+DB_POOL_WAIT = Histogram(
+    'kirinuki_db_pool_wait_seconds', 'データベース接続の取得にかかった時間（新しい接続の作成を含む）', ['process'],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, float('inf'))
+)
+DB_POOL_TIMEOUTS = Counter(
+    'kirinuki_db_pool_timeouts_total', '接続プールの空きを待ってタイムアウトした回数', ['process']
+)
+DB_READ_ROUTING = Counter(
+    'kirinuki_db_read_routing_total', '読み取り専用のリクエストの接続先（リードレプリカ / プライマリ）', ['target']
+)
+ASGI_OPEN_STREAMS = Gauge(
+    'kirinuki_asgi_open_streams', 'ASGIで待機中・配信中の接続（ロングポーリング・SSE・動画）の数', ['endpoint'],
+    multiprocess_mode='livesum'
+)
+
+# ru_maxrssの単位（LinuxはKB、macOSはバイト）
+_MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+# ru_inblock/ru_oublockの1ブロックのバイト数
+_BLOCK_SIZE = 512
+
+
+def _resource_snapshot() -> Dict[str, float]:
+    """自プロセスと終了済み子プロセス（ffmpegなど）のリソース使用量を取得する"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'cpu': own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+        'maxrss': max(own.ru_maxrss, children.ru_maxrss) * _MAXRSS_UNIT,
+        'read': (own.ru_inblock + children.ru_inblock) * _BLOCK_SIZE,
+        'write': (own.ru_oublock + children.ru_oublock) * _BLOCK_SIZE,
+    }
+
+
+@contextmanager
+def measure_stage(stage: str, timings: Optional[Dict] = None):
+    """
+    処理ステージの実時間・CPU時間・ピークメモリ・I/O量を計測する
+
+    Args:
+        stage: ステージ名（'download', 'extract_audio', 'transcribe', 'analyze', 'render' など）
+        timings: 計測結果を格納する辞書（stageをキーに追加される）
+
+    Yields:
+        このステージの計測結果の辞書（ブロックを抜けた時点で値が入る）
+
+    ピークメモリはプロセス起動からの最大値であり、I/O量はページキャッシュを除いた
+    ディスクへの読み書き（終了済みの子プロセス分を含む）である。
+    """
+    result = {}
+    if timings is not None:
+        timings[stage] = result
+
+    before = _resource_snapshot()
+    started = time.perf_counter()
+    status = 'success'
+    try:
+        yield result
+    except Exception:
+        status = 'failed'
+        STAGE_FAILURES.labels(stage=stage).inc()
+        raise
+    finally:
+        after = _resource_snapshot()
+        result.update({
+            'wall_seconds': round(time.perf_counter() - started, 3),
+            'cpu_seconds': round(after['cpu'] - before['cpu'], 3),
+            'peak_rss_bytes': int(after['maxrss']),
+            'bytes_read': int(after['read'] - before['read']),
+            'bytes_written': int(after['write'] - before['write']),
+            'status': status,
+        })
+
+        STAGE_DURATION.labels(stage=stage, status=status).observe(result['wall_seconds'])
+        STAGE_CPU.labels(stage=stage).observe(result['cpu_seconds'])
+        STAGE_PEAK_RSS.labels(stage=stage).observe(result['peak_rss_bytes'])
+        STAGE_IO.labels(stage=stage, direction='read').observe(result['bytes_read'])
+        STAGE_IO.labels(stage=stage, direction='write').observe(result['bytes_written'])
+
+
+def is_multiprocess_mode() -> bool:
+    """prometheus_clientのマルチプロセスモードが有効かどうか（メトリクスの記録と出力で同じモードを使用する）"""
+    return _MULTIPROCESS
+
+
+def metrics_registry():
+    """メトリクスの出力に使用するレジストリを返す"""
+    if is_multiprocess_mode():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    from prometheus_client import REGISTRY
+    return REGISTRY
+
+
+def metrics_response() -> Tuple[bytes, str]:
+    """Prometheus形式のメトリクスを (本文, Content-Type) で返す"""
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """終了したプロセスのマルチプロセス用ファイルを片付ける"""
+    if is_multiprocess_mode():
+        multiprocess.mark_process_dead(pid)
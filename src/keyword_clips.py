@@ -0,0 +1,161 @@
+"""文字起こしの語句から作成する切り抜き
+
+「配信者がXと言った場面をすべて」のような切り抜きは、これまで動画全体の再解析（ダウンロード・文字起こし・解析）が必要だった。
+このモジュールは処理済みの動画の文字起こしから語句を含むセグメントを探し、前後に余白を付けて重なる区間をまとめ、
+その区間をハイライトとする派生動画（Video.source_video_id で元動画を参照する）を作成する。
+
+派生動画は文字起こしと解析を行わず、書き出し（create_highlights_task）から処理する。
+元動画のファイルが作業ディレクトリに残っている場合はそれを使用し、削除されている場合は
+（2段階ダウンロードと同じく）切り抜きの区間だけを取得するため、元動画全体のダウンロードは行わない。
+"""
+import os
+import uuid
+from typing import Iterable, List, Optional, Sequence, Tuple
+from src.models import db, Video, Highlight, ProcessLog, ProcessStatus
+from src.transcript_store import load_segments
+
+# 語句を含むセグメントの前後に付ける余白（秒）
+PADDING_BEFORE = float(os.getenv('KEYWORD_CLIP_PADDING_BEFORE', '3'))
+PADDING_AFTER = float(os.getenv('KEYWORD_CLIP_PADDING_AFTER', '5'))
+
+# 間隔がこの長さ（秒）以下の区間は1つにまとめる
+MERGE_GAP = float(os.getenv('KEYWORD_CLIP_MERGE_GAP', '2'))
+
+# 切り抜き動画の長さの上限（秒、超えた分の区間は使用しない）
+MAX_DURATION = float(os.getenv('KEYWORD_CLIP_MAX_DURATION', '600'))
+
+# 余白に指定できる長さの上限（秒）
+MAX_PADDING = 60.0
+
+
+def find_keyword_segments(segments: Iterable, terms: Sequence[str]) -> List:
+    """
+    いずれかの語句を含むセグメントを返す（英字の大文字・小文字は区別しない）
+
+    Args:
+        segments: 開始時間順のセグメント（TranscriptSegment または PackedSegment）
+        terms: 検索語句（OR条件）
+    """
+    lowered = [term.casefold() for term in terms if term]
+    return [segment for segment in segments
+            if any(term in segment.text.casefold() for term in lowered)]
+
+
+def build_clip_intervals(hits: Iterable, duration: Optional[float] = None,
+                         padding_before: float = PADDING_BEFORE, padding_after: float = PADDING_AFTER,
+                         merge_gap: float = MERGE_GAP,
+                         max_duration: float = MAX_DURATION) -> Tuple[List[Tuple[float, float, int]], bool]:
+    """
+    語句を含むセグメントに余白を付け、重なる（または間隔が merge_gap 以下の）区間をまとめる
+
+    Args:
+        hits: 語句を含むセグメント
+        duration: 動画の長さ（秒、区間を動画の範囲内に収める。Noneの場合は末尾を制限しない）
+        padding_before: 前に付ける余白（秒）
+        padding_after: 後に付ける余白（秒）
+        merge_gap: まとめる区間の間隔（秒）
+        max_duration: 区間の合計の長さの上限（秒、0の場合は無制限。時間順に上限まで使用する）
+
+    Returns:
+        (開始時間, 終了時間, 含まれるセグメント数) の時間順のリストと、上限により区間を省略したかどうか
+    """
+    intervals = []
+    for segment in sorted(hits, key=lambda segment: segment.start_time):
+        start = max(0.0, segment.start_time - padding_before)
+        end = segment.end_time + padding_after
+        if duration:
+            end = min(end, duration)
+        if end <= start:
+            continue
+        if intervals and start - intervals[-1][1] <= merge_gap:
+            previous_start, previous_end, count = intervals[-1]
+            intervals[-1] = (previous_start, max(previous_end, end), count + 1)
+        else:
+            intervals.append((start, end, 1))
+
+    if max_duration <= 0:
+        return intervals, False
+    selected = []
+    remaining = max_duration
+    for start, end, count in intervals:
+        if remaining <= 0:
+            return selected, True
+        if end - start > remaining:
+            # 上限を超える区間は上限までの長さに切り詰める
+            selected.append((start, start + remaining, count))
+            return selected, True
+        selected.append((start, end, count))
+        remaining -= end - start
+    return selected, False
+
+
+def find_keyword_intervals(source: Video, terms: Sequence[str], padding_before: float = PADDING_BEFORE,
+                           padding_after: float = PADDING_AFTER) -> Tuple[List, List[Tuple[float, float, int]], bool]:
+    """
+    元動画の文字起こしから語句を含むセグメントを探し、切り抜きに使用する区間を求める
+
+    Args:
+        source: 文字起こしが完了した元動画
+        terms: 検索語句（OR条件）
+        padding_before: 前に付ける余白（秒）
+        padding_after: 後に付ける余白（秒）
+
+    Returns:
+        (語句を含むセグメント, 区間のリスト, 区間を省略したかどうか)
+    """
+    hits = find_keyword_segments(load_segments(source), terms)
+    intervals, truncated = build_clip_intervals(hits, source.duration, padding_before, padding_after)
+    return hits, intervals, truncated
+
+
+def create_keyword_clip(source: Video, terms: Sequence[str], hits: Sequence,
+                        intervals: Sequence[Tuple[float, float, int]], truncated: bool,
+                        client_id: Optional[str] = None, estimated_cost: Optional[float] = None) -> Video:
+    """
+    find_keyword_intervals で求めた区間をハイライトとする派生動画を作成する
+
+    Args:
+        source: 文字起こしが完了した元動画
+        terms: 検索語句（OR条件）
+        hits, intervals, truncated: find_keyword_intervals の戻り値（intervals は空でないこと）
+        client_id: リクエスト元のクライアント
+        estimated_cost: 受付時に見積もった処理時間（秒、アドミッション制御の処理待ち時間の集計に使用）
+
+    コミットは呼び出し側で行う。書き出しのタスクは呼び出し側でキューに投入する。
+    """
+    video = Video(
+        youtube_url=source.youtube_url,
+        session_id=str(uuid.uuid4()),
+        title=source.title,
+        description=source.description,
+        duration=source.duration,
+        thumbnail_url=source.thumbnail_url,
+        source_video_id=source.id,
+        clip_keywords=' '.join(terms)[:255],
+        # 2段階ダウンロードの元動画は低画質版のため、派生動画も区間だけを高画質で取得する
+        two_phase_download=source.two_phase_download,
+        profile_enabled=source.profile_enabled,
+        client_id=client_id,
+        estimated_cost=estimated_cost,
+        status=ProcessStatus.PENDING,
+        progress=0
+    )
+    db.session.add(video)
+    db.session.flush()
+    for start_time, end_time, count in intervals:
+        db.session.add(Highlight(video_id=video.id, start_time=start_time, end_time=end_time,
+                                 importance_score=float(count)))
+    log = ProcessLog(
+        video_id=video.id,
+        status=ProcessStatus.PENDING,
+        message=f"キーワード「{video.clip_keywords}」から{len(intervals)}件の区間を作成しました"
+    )
+    log.set_details({'keyword_clip': {
+        'source_session_id': source.session_id,
+        'terms': list(terms),
+        'matched_segments': len(hits),
+        'intervals': [[round(start, 3), round(end, 3)] for start, end, _ in intervals],
+        'truncated': truncated,
+    }})
+    db.session.add(log)
+    return video
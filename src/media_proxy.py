@@ -0,0 +1,106 @@
+"""解析用の低解像度プロキシ動画
+
+文字起こし・スコアリング・シーン検出はフル解像度のフレームを必要としないため、
+元動画を縮小・低フレームレート化したプロキシ動画を一度だけ作成して解析に使用する。
+プロキシは元動画と同じ場所にキャッシュされ、再解析時にはそのまま再利用される。
+切り抜き動画の書き出しには引き続き元動画を使用する。
+"""
+import os
+import re
+import subprocess
+from typing import Optional
+
+# プロキシ動画の設定（環境変数で上書き可能）
+PROXY_HEIGHT = int(os.getenv('ANALYSIS_PROXY_HEIGHT', '360'))
+PROXY_FPS = int(os.getenv('ANALYSIS_PROXY_FPS', '10'))
+
+# Whisperの入力と同じサンプリングレートにしておくことで、音声抽出時の再サンプリングを省く
+PROXY_AUDIO_SAMPLE_RATE = 16000
+
+PROXY_SUFFIX = '.proxy.mp4'
+
+
+def is_proxy_enabled() -> bool:
+    """解析用プロキシを使用するかどうか（USE_ANALYSIS_PROXY）"""
+    return os.getenv('USE_ANALYSIS_PROXY', 'True').lower() in ('true', '1', 't')
+
+
+def proxy_path_for(video_path: str) -> str:
+    """元動画に対応するプロキシ動画のパスを返す"""
+    root, _ = os.path.splitext(video_path)
+    return root + PROXY_SUFFIX
+
+
+def _run_ffmpeg(command):
+    """FFmpegを実行し、失敗時は例外を送出する"""
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise Exception("FFmpegがインストールされていないか、パスが通っていません。インストール方法はREADMEを参照してください。")
+    if result.returncode != 0:
+        raise Exception(result.stderr.decode('utf-8', errors='ignore').strip())
+    return result
+
+
+def probe_duration(media_path: str) -> Optional[float]:
+    """
+    動画の長さ（秒）を取得する（デコードせずにヘッダーだけを読む）
+
+    Args:
+        media_path: 動画または音声ファイルのパス
+
+    Returns:
+        長さ（秒）。取得できない場合はNone
+    """
+    try:
+        result = subprocess.run(['ffmpeg', '-nostdin', '-hide_banner', '-i', media_path],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise Exception("FFmpegがインストールされていないか、パスが通っていません。インストール方法はREADMEを参照してください。")
+
+    # 出力ファイルを指定していないため終了コードは常にエラーになるが、ヘッダー情報は出力される
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', result.stderr.decode('utf-8', errors='ignore'))
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def ensure_analysis_proxy(video_path: str) -> str:
+    """
+    解析用のプロキシ動画を作成する（作成済みで元動画より新しければ再利用）
+
+    Args:
+        video_path: 元動画のパス
+
+    Returns:
+        プロキシ動画のパス（プロキシが無効な場合は元動画のパス）
+    """
+    if not is_proxy_enabled():
+        return video_path
+
+    proxy_path = proxy_path_for(video_path)
+    if os.path.exists(proxy_path) and os.path.getmtime(proxy_path) >= os.path.getmtime(video_path):
+        return proxy_path
+
+    # 書き込み途中のファイルを再利用しないよう、一時ファイルに書き出してから置き換える
+    temp_path = proxy_path + '.tmp.mp4'
+    command = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-y',
+        # 解析には画質が不要なため、Bフレームとデブロッキングフィルタのデコードを省略する
+        '-skip_frame', 'bidir', '-skip_loop_filter', 'all',
+        '-i', video_path,
+        '-vf', f"fps={PROXY_FPS},scale=-2:'min({PROXY_HEIGHT},ih)':flags=fast_bilinear",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-crf', '30', '-g', str(PROXY_FPS * 2),
+        '-c:a', 'aac', '-ac', '1', '-ar', str(PROXY_AUDIO_SAMPLE_RATE), '-b:a', '64k',
+        temp_path
+    ]
+
+    try:
+        _run_ffmpeg(command)
+        os.replace(temp_path, proxy_path)
+        return proxy_path
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise Exception(f"解析用プロキシの作成中にエラーが発生しました: {str(e)}")
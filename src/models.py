@@ -1,11 +1,13 @@
 from datetime import datetime
 from enum import Enum
 import json
-from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, ForeignKey, Enum as SQLAEnum
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Boolean, ForeignKey, Index, LargeBinary, Enum as SQLAEnum
 from sqlalchemy.orm import relationship
 from flask_sqlalchemy import SQLAlchemy
+from src.db_routing import RoutingSession
 
-db = SQLAlchemy()
+# read_only のビューの読み取りをリードレプリカに振り分ける（src.db_routing を参照）
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class ProcessStatus(str, Enum):
     PENDING = "pending"
@@ -25,23 +27,77 @@ class Video(db.Model):
     title = Column(String(255), nullable=True)
     description = Column(Text, nullable=True)
     duration = Column(Float, nullable=True)  # 秒単位での動画の長さ
+    target_duration = Column(Float, nullable=True)  # 切り抜き動画の目標の長さ（秒、未指定なら割合で選択）
     thumbnail_url = Column(String(255), nullable=True)
     original_path = Column(String(255), nullable=True)  # ダウンロードされた元動画のパス
+    proxy_path = Column(String(255), nullable=True)  # 解析用の低解像度プロキシ動画のパス
     output_path = Column(String(255), nullable=True)  # 生成された切り抜き動画のパス
     transcript = Column(Text, nullable=True)  # 文字起こし結果
+    transcribed_until = Column(Float, nullable=True)  # 文字起こしのチェックポイント（この時刻までのセグメントは保存済み）
+    scene_index = Column(Text, nullable=True)  # シーン境界・文の区切りのインデックス（JSON形式）
+    profile_enabled = Column(Boolean, default=False, nullable=False)  # 各ステージをプロファイラの下で実行するかどうか
     status = Column(SQLAEnum(ProcessStatus), default=ProcessStatus.PENDING)
     error_message = Column(Text, nullable=True)
     progress = Column(Integer, default=0)  # 処理進捗を0-100で表す
     current_task_id = Column(String(255), nullable=True)  # 現在実行中のタスクID
+    retry_count = Column(Integer, default=0, nullable=False)  # 自動リカバリーで再開した回数
+    heartbeat_at = Column(DateTime, nullable=True)  # タスク実行中にワーカーが定期的に更新する時刻
+    client_id = Column(String(64), nullable=True)  # リクエスト元のクライアント（アドミッション制御用）
+    estimated_cost = Column(Float, nullable=True)  # 受付時に見積もった処理時間（秒）
+    batch_id = Column(String(36), nullable=True, index=True)  # 一括登録（/api/batch）で登録した場合のバッチID
+    two_phase_download = Column(Boolean, default=False, nullable=False)  # 低画質版で解析し、ハイライトの区間だけを高画質で取得したかどうか
+    source_video_id = Column(Integer, ForeignKey('videos.id'), nullable=True, index=True)  # キーワードから作成した切り抜きの元動画
+    clip_keywords = Column(String(255), nullable=True)  # キーワードから作成した切り抜きの検索語句
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # 監視タスクで停止・失敗したジョブ、アドミッション制御でクライアントごとの処理中のジョブを検索するためのインデックス
+    __table_args__ = (
+        Index('ix_videos_status_heartbeat_at', 'status', 'heartbeat_at'),
+        Index('ix_videos_client_id_status', 'client_id', 'status'),
+        # 履歴一覧をキーセット方式でページ分割するためのインデックス（ステータスでの絞り込みにも対応）
+        Index('ix_videos_created_at_id', 'created_at', 'id'),
+        Index('ix_videos_status_created_at_id', 'status', 'created_at', 'id'),
+    )
+    
     # リレーションシップ
     highlights = relationship("Highlight", back_populates="video", cascade="all, delete-orphan")
     process_logs = relationship("ProcessLog", back_populates="video", cascade="all, delete-orphan")
     transcript_segments = relationship("TranscriptSegment", back_populates="video", cascade="all, delete-orphan")
+    transcript_pack = relationship("TranscriptPack", back_populates="video", uselist=False, cascade="all, delete-orphan")
+    source_video = relationship("Video", remote_side=[id])
+    
+    def set_scene_index(self, index_dict):
+        self.scene_index = json.dumps(index_dict)
+    
+    def get_scene_index(self):
+        if self.scene_index:
+            return json.loads(self.scene_index)
+        return {}
+    
+    @classmethod
+    def summary_columns(cls):
+        """一覧の表示に使用するカラム（文字起こしの全文などの大きなカラムは読み込まない）"""
+        return (cls.id, cls.session_id, cls.youtube_url, cls.title, cls.thumbnail_url, cls.duration,
+                cls.status, cls.progress, cls.source_video_id, cls.clip_keywords, cls.created_at)
+    
+    def to_summary_dict(self):
+        """一覧用のシリアライズ（summary_columns のカラムだけを参照する）"""
+        return {
+            'session_id': self.session_id,
+            'youtube_url': self.youtube_url,
+            'title': self.title,
+            'thumbnail_url': self.thumbnail_url,
+            'duration': self.duration,
+            'status': self.status.value,
+            'progress': self.progress,
+            'source_video_id': self.source_video_id,
+            'clip_keywords': self.clip_keywords,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
     
     def to_dict(self):
+        # リレーションシップ（ハイライト・ログ・文字起こしセグメント）は読み込まない
         return {
             'id': self.id,
             'youtube_url': self.youtube_url,
@@ -49,6 +105,13 @@ class Video(db.Model):
             'title': self.title,
             'description': self.description,
             'duration': self.duration,
+            'target_duration': self.target_duration,
+            'profile_enabled': self.profile_enabled,
+            'estimated_cost': self.estimated_cost,
+            'batch_id': self.batch_id,
+            'two_phase_download': self.two_phase_download,
+            'source_video_id': self.source_video_id,
+            'clip_keywords': self.clip_keywords,
             'thumbnail_url': self.thumbnail_url,
             'transcript': self.transcript,
             'status': self.status.value,
@@ -71,6 +134,11 @@ class Highlight(db.Model):
     # リレーションシップ
     video = relationship("Video", back_populates="highlights")
     
+    # 動画ごとに時間順で取得するためのインデックス
+    __table_args__ = (
+        Index('ix_highlights_video_id_start_time', 'video_id', 'start_time'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -95,6 +163,11 @@ class ProcessLog(db.Model):
     # リレーションシップ
     video = relationship("Video", back_populates="process_logs")
     
+    # 動画ごとのログをキーセット方式でページ分割するためのインデックス（最新のログの取得にも使用する）
+    __table_args__ = (
+        Index('ix_process_logs_video_id_created_at_id', 'video_id', 'created_at', 'id'),
+    )
+    
     def set_details(self, details_dict):
         self.details = json.dumps(details_dict)
     
@@ -127,6 +200,11 @@ class TranscriptSegment(db.Model):
     # リレーションシップ
     video = relationship("Video", back_populates="transcript_segments")
     
+    # 動画ごとに時間範囲で取得するためのインデックス
+    __table_args__ = (
+        Index('ix_transcript_segments_video_id_start_time', 'video_id', 'start_time'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -135,4 +213,20 @@ class TranscriptSegment(db.Model):
             'end_time': self.end_time,
             'text': self.text,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
+
+class TranscriptPack(db.Model):
+    """文字起こしセグメントを動画ごとに1行へまとめたもの（src.transcript_store を参照）"""
+    __tablename__ = 'transcript_packs'
+    
+    id = Column(Integer, primary_key=True)
+    video_id = Column(Integer, ForeignKey('videos.id'), nullable=False, unique=True)
+    segment_count = Column(Integer, nullable=False)
+    start_times = Column(LargeBinary, nullable=False)   # 開始時間（秒、float32の配列）
+    end_times = Column(LargeBinary, nullable=False)     # 終了時間（秒、float32の配列）
+    text_offsets = Column(LargeBinary, nullable=False)  # 各セグメントのテキストの開始位置（バイト、uint32の配列。末尾に全体の長さ）
+    text_blob = Column(LargeBinary, nullable=False)     # 全セグメントのテキストを連結したUTF-8のバイト列
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # リレーションシップ
+    video = relationship("Video", back_populates="transcript_pack")
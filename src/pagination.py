@@ -0,0 +1,85 @@
+"""キーセット方式のページ分割
+
+OFFSETによるページ分割は読み飛ばす行数だけ遅くなり、テーブルが大きくなるほど後ろのページの応答が遅くなる。
+このモジュールは (created_at, id) の組を前のページの最後の行から続けて取得するキーセット方式でページを分割する。
+(created_at, id) の複合インデックスを使用するため、テーブルの大きさやページの位置によらず1ページの取得時間は一定になる。
+
+カーソルは最後の行の created_at と id をURLに含められる形式にエンコードした文字列で、
+クライアントはレスポンスの next_cursor をそのまま次のリクエストに指定する。
+"""
+import base64
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import tuple_
+
+# 履歴一覧の1ページの件数
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '20'))
+
+# 詳細ページの処理ログの1ページの件数
+LOG_PAGE_SIZE = int(os.getenv('DETAIL_LOG_PAGE_SIZE', '50'))
+
+# 1ページに指定できる件数の上限
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """カーソルの形式が正しくない"""
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """行の (created_at, id) をカーソルの文字列にする"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """カーソルの文字列を (created_at, id) に戻す"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        created_at, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f"カーソルの形式が正しくありません: {cursor}") from e
+
+
+def page_size(value: Optional[int], default: int) -> int:
+    """リクエストで指定された件数を 1〜MAX_PAGE_SIZE の範囲に収める"""
+    if value is None:
+        return default
+    return max(1, min(value, MAX_PAGE_SIZE))
+
+
+def keyset_page(query, model, cursor: Optional[str] = None, limit: int = HISTORY_PAGE_SIZE,
+                descending: bool = True) -> Tuple[List, Optional[str]]:
+    """
+    (created_at, id) の順で1ページ分の行を取得する
+
+    Args:
+        query: 絞り込み済みのクエリ（並び順は指定しない）
+        model: created_at と id のカラムを持つモデル
+        cursor: 前のページの next_cursor（Noneの場合は先頭のページ）
+        limit: 1ページの件数
+        descending: 新しい順に並べるかどうか
+
+    Returns:
+        (行のリスト, 次のページのカーソル（最後のページの場合はNone）)
+
+    Raises:
+        InvalidCursor: カーソルの形式が正しくない場合
+    """
+    key = tuple_(model.created_at, model.id)
+    if cursor:
+        position = decode_cursor(cursor)
+        query = query.filter(key < position if descending else key > position)
+    if descending:
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        query = query.order_by(model.created_at, model.id)
+
+    # 次のページがあるかどうかを判定するため、1件多く取得する
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,115 @@
+"""ジョブ単位のプロファイリング
+
+特定のジョブが遅い原因（moviepyやWhisperの内部のどこで時間がかかっているか）を
+調べるため、Video.profile_enabled が有効なジョブだけ各ステージをプロファイラの下で実行し、
+結果をStorageManager経由で保存する。保存したファイル名は ProcessLog.details の
+'profile_artifacts' に記録され、詳細ページからリンクされる。
+
+pyinstrument（サンプリングプロファイラ、requirements.txt に含まれる）でHTML形式のコールツリーを出力する。
+cProfileは決定論的に全呼び出しを計測するため、moviepyやWhisperの内部ループでは計測自体で時間が歪む。
+pyinstrumentを読み込めない環境でのフォールバックとしてのみ使用し、pstats形式のファイルを出力する。
+無効なジョブでは何もしないコンテキストマネージャを返すだけで、プロファイラは読み込まない。
+"""
+import logging
+import os
+import re
+import tempfile
+from contextlib import contextmanager, nullcontext
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# pyinstrumentのサンプリング間隔（秒）
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+
+# プロファイル結果のファイル名（セッションID_ステージ名.profile.拡張子）
+ARTIFACT_PATTERN = r'^{session_id}_[a-z_]+\.profile\.(html|pstats)$'
+
+_DISABLED = nullcontext()
+
+
+def is_profile_artifact(session_id: str, filename: str) -> bool:
+    """ファイル名が指定セッションのプロファイル結果かどうかを判定する"""
+    return re.match(ARTIFACT_PATTERN.format(session_id=re.escape(session_id)), filename) is not None
+
+
+def _storage_manager():
+    """保存に使用するStorageManager（Flaskアプリのコンテキスト内ではアプリの設定を使用）"""
+    from flask import current_app, has_app_context
+    if has_app_context() and hasattr(current_app, 'storage_manager'):
+        return current_app.storage_manager
+    from src.storage_utils import StorageManager
+    return StorageManager(use_s3=False)
+
+
+class JobProfiler:
+    """1つのジョブ（Video）のステージごとのプロファイラ"""
+
+    def __init__(self, session_id: str, enabled: bool = False):
+        self.session_id = session_id
+        self.enabled = enabled
+        self.artifacts = {}  # ステージ名 -> 保存したファイル名
+
+    @classmethod
+    def for_video(cls, video) -> 'JobProfiler':
+        return cls(video.session_id, bool(video.profile_enabled))
+
+    def stage(self, stage: str):
+        """
+        ステージをプロファイラの下で実行するコンテキストマネージャを返す
+
+        Args:
+            stage: ステージ名（'transcribe', 'render' など）
+        """
+        if not self.enabled:
+            return _DISABLED
+        return self._profile(stage)
+
+    @contextmanager
+    def _profile(self, stage: str):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("pyinstrumentを読み込めないため、cProfileで計測します（時間の内訳は歪む場合があります）")
+            Profiler = None
+
+        if Profiler is not None:
+            profiler = Profiler(interval=PROFILE_INTERVAL)
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                self._save(stage, 'html', lambda path: self._write_text(path, profiler.output_html()))
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                self._save(stage, 'pstats', profiler.dump_stats)
+
+    @staticmethod
+    def _write_text(path: str, text: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def _save(self, stage: str, extension: str, write):
+        """プロファイル結果を一時ファイルに書き出してから保存する（失敗してもジョブは継続する）"""
+        filename = f"{self.session_id}_{stage}.profile.{extension}"
+        fd, temp_path = tempfile.mkstemp(suffix=f'.{extension}')
+        os.close(fd)
+        try:
+            write(temp_path)
+            _storage_manager().save_output_file(temp_path, filename)
+            self.artifacts[stage] = filename
+        except Exception as e:
+            logger.error(f"プロファイル結果の保存中にエラーが発生しました: {str(e)}")
+        finally:
+            os.remove(temp_path)
+
+    def details(self) -> Dict:
+        """ProcessLog.details に追加する情報（プロファイル結果がなければ空）"""
+        return {'profile_artifacts': dict(self.artifacts)} if self.artifacts else {}
@@ -0,0 +1,261 @@
+"""処理中のステージの細かな進捗の通知
+
+文字起こし・解析・動画の書き出しは1つのステージが数十分かかることがあるため、
+ステージ内部の進捗（Whisperのデコード位置、解析済みの音声、書き出したフレーム数）を
+Redisに書き込む。DBへのコミットは行わず、書き込みは PROGRESS_INTERVAL 秒に1回までに間引く。
+
+進捗は kirinuki:progress:<session_id> キーに有効期限付きで保存し（/status が参照する）、
+同じ内容を kirinuki:progress チャンネルにPUBLISHする。Redisに接続できない場合は何もしない。
+ASGIのWeb（src/asgi.py）はチャンネルを購読し（ProgressNotifier）、待機中の /status に通知する。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# 進捗の書き込み先（未設定の場合はCeleryのブローカーと同じRedisを使用）
+PROGRESS_REDIS_URL = os.getenv('PROGRESS_REDIS_URL') or os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+
+# 書き込みの最小間隔（秒）
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', '2'))
+
+# 進捗のキーの有効期限（秒）
+PROGRESS_TTL = 3600
+
+PROGRESS_KEY = 'kirinuki:progress:{session_id}'
+PROGRESS_CHANNEL = 'kirinuki:progress'
+
+_client = None
+
+
+def _redis():
+    """Redisクライアント（プロセス内で再利用する）"""
+    global _client
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(PROGRESS_REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+    return _client
+
+
+class ProgressReporter:
+    """
+    ステージ内部の進捗（0〜1）を全体の進捗（%）に換算してRedisに通知する
+
+    Args:
+        session_id: セッションID
+        start: このステージの開始時点の全体の進捗（%）
+        end: このステージの終了時点の全体の進捗（%）
+        message: 進捗とあわせて表示するメッセージ
+        interval: 書き込みの最小間隔（秒）
+    """
+
+    def __init__(self, session_id: str, start: int, end: int, message: Optional[str] = None,
+                 interval: float = PROGRESS_INTERVAL):
+        self.session_id = session_id
+        self.start = start
+        self.end = end
+        self.message = message
+        self.interval = interval
+        self._last_sent = 0.0
+        self._last_progress = None
+        self._disabled = False
+
+    def update(self, fraction: float, message: Optional[str] = None):
+        """ステージ内部の進捗を通知する（前回の書き込みから interval 秒以内の場合は何もしない）"""
+        if self._disabled:
+            return
+
+        now = time.monotonic()
+        if now - self._last_sent < self.interval and fraction < 1.0:
+            return
+
+        progress = int(self.start + (self.end - self.start) * min(max(fraction, 0.0), 1.0))
+        if progress == self._last_progress and message is None:
+            return
+
+        self._last_sent = now
+        self._last_progress = progress
+        payload = json.dumps({
+            'session_id': self.session_id,
+            'progress': progress,
+            'message': message or self.message,
+            'updated_at': time.time(),
+        }, ensure_ascii=False)
+
+        try:
+            client = _redis()
+            pipeline = client.pipeline(transaction=False)
+            pipeline.setex(PROGRESS_KEY.format(session_id=self.session_id), PROGRESS_TTL, payload)
+            pipeline.publish(PROGRESS_CHANNEL, payload)
+            pipeline.execute()
+        except Exception as e:
+            # 進捗の通知に失敗しても処理は継続する（以降の通知は行わない）
+            logger.warning(f"進捗の通知に失敗しました: {str(e)}")
+            self._disabled = True
+
+
+def get_progress(session_id: str) -> Optional[Dict]:
+    """Redisに保存されている最新の進捗を取得する（ない場合や接続できない場合はNone）"""
+    try:
+        value = _redis().get(PROGRESS_KEY.format(session_id=session_id))
+    except Exception:
+        return None
+    return json.loads(value) if value else None
+
+
+_async_client = None
+
+
+def _async_redis():
+    """非同期のRedisクライアント（ASGIのイベントループ内で再利用する）"""
+    global _async_client
+    if _async_client is None:
+        import redis.asyncio
+        _async_client = redis.asyncio.Redis.from_url(PROGRESS_REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+    return _async_client
+
+
+async def get_progress_async(session_id: str) -> Optional[Dict]:
+    """get_progress の非同期版（ASGIの /status で使用する）"""
+    try:
+        value = await _async_redis().get(PROGRESS_KEY.format(session_id=session_id))
+    except Exception:
+        return None
+    return json.loads(value) if value else None
+
+
+class ProgressNotifier:
+    """
+    進捗のチャンネルを1プロセスで1接続だけ購読し、セッションごとの待機中のリクエストに通知する
+
+    ロングポーリングやSSEの接続が数千あっても、Redisへの接続は購読の1本と読み取り用のプールだけになる。
+    Redisに接続できない間は再接続を繰り返し、待機中のリクエストはタイムアウトでDBを確認する。
+    """
+
+    def __init__(self, retry_interval: float = 5.0):
+        self.retry_interval = retry_interval
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+        self._task = None
+
+    def start(self):
+        """購読を開始する（イベントループ内で呼び出す）"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self):
+        """購読を停止する"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def wait(self, session_id: str, timeout: float) -> bool:
+        """
+        セッションの進捗が通知されるまで待つ
+
+        Returns:
+            timeout 秒以内に通知されたかどうか
+        """
+        event = asyncio.Event()
+        self._waiters.setdefault(session_id, set()).add(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters = self._waiters.get(session_id)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[session_id]
+
+    def _notify(self, data):
+        try:
+            session_id = json.loads(data).get('session_id')
+        except (TypeError, ValueError):
+            return
+        for event in self._waiters.get(session_id, ()):
+            event.set()
+
+    async def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = _async_redis().pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(PROGRESS_CHANNEL)
+                while True:
+                    message = await pubsub.get_message(timeout=30.0)
+                    if message is not None:
+                        self._notify(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"進捗のチャンネルを購読できません（{self.retry_interval}秒後に再接続します）: {str(e)}")
+                await asyncio.sleep(self.retry_interval)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+
+def whisper_progress(callback):
+    """
+    Whisperのデコード中の進捗を callback(0〜1) で受け取るコンテキストマネージャを返す
+
+    Whisperは進捗をtqdmで表示するため、whisper.transcribe モジュールが参照する
+    tqdm を一時的に差し替える（他のモジュールのtqdmには影響しない）。
+    """
+    from contextlib import contextmanager
+    import tqdm
+    import whisper.transcribe
+
+    class ProgressTqdm(tqdm.tqdm):
+        def update(self, n=1):
+            super().update(n)
+            if self.total:
+                callback(self.n / self.total)
+
+    class TqdmModule:
+        pass
+
+    @contextmanager
+    def patched():
+        original = whisper.transcribe.tqdm
+        shim = TqdmModule()
+        shim.tqdm = ProgressTqdm
+        whisper.transcribe.tqdm = shim
+        try:
+            yield
+        finally:
+            whisper.transcribe.tqdm = original
+
+    return patched()
+
+
+def moviepy_progress_logger(callback):
+    """
+    moviepyの書き出し中の進捗（書き出したフレーム数）を callback(0〜1) で受け取るロガーを返す
+
+    write_videofile(logger=...) に渡す。
+    """
+    from proglog import ProgressBarLogger
+
+    class FrameProgressLogger(ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            # 't' は書き出したフレームのバー（音声は 'chunk'）
+            if bar == 't' and attr == 'index':
+                total = self.bars[bar].get('total')
+                if total:
+                    callback(min((value + 1) / total, 1.0))
+
+    return FrameProgressLogger()
@@ -0,0 +1,174 @@
+"""停止・失敗したジョブの検出と再開
+
+タスクの実行中はワーカーが一定間隔で Video.heartbeat_at を更新し、監視タスクは
+ハートビートが途絶えたジョブを数十秒で検出する。再開回数は Video.retry_count で管理し、
+候補の抽出は1回のクエリ、Celeryの結果バックエンドの参照は一括（Redisの場合はMGET）で行う。
+各ステージはチェックポイントから再開できるため、再開時に完了済みの処理はやり直さない。
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from sqlalchemy import update
+from src.models import Video, ProcessStatus
+
+logger = logging.getLogger(__name__)
+
+# ハートビートの更新間隔（秒）
+HEARTBEAT_INTERVAL = float(os.getenv('HEARTBEAT_INTERVAL', '10'))
+
+# この時間（秒）ハートビートがなければ、実行中のタスクが停止したとみなす
+HEARTBEAT_TIMEOUT = float(os.getenv('HEARTBEAT_TIMEOUT', '60'))
+
+# キューで待機中のタスクを停止とみなすまでの時間（秒）
+QUEUED_TIMEOUT = float(os.getenv('RECOVERY_QUEUED_TIMEOUT', '900'))
+
+# キューが処理されるおおよその速さ（1秒あたりのタスク数）と、キューの長さから見積もる待機時間の上限（秒）
+# 待機中のタスクは、キューの長さから見積もった待機時間が過ぎるまで停止とみなさない
+QUEUE_THROUGHPUT = float(os.getenv('RECOVERY_QUEUE_THROUGHPUT', '0.1'))
+MAX_QUEUE_WAIT = float(os.getenv('RECOVERY_MAX_QUEUE_WAIT', '21600'))
+
+# 失敗したジョブを再開するまでの待機時間（秒）
+FAILED_RETRY_DELAY = float(os.getenv('RECOVERY_FAILED_DELAY', '900'))
+
+# ジョブごとの最大再開回数
+MAX_RECOVERY_ATTEMPTS = int(os.getenv('RECOVERY_MAX_ATTEMPTS', '5'))
+
+# 監視タスクの実行間隔（秒）と、1回の監視で処理する最大件数
+MONITOR_INTERVAL = float(os.getenv('RECOVERY_MONITOR_INTERVAL', '30'))
+MONITOR_BATCH_SIZE = int(os.getenv('RECOVERY_BATCH_SIZE', '100'))
+
+# 処理中（ワーカーがハートビートを記録する）ステータス
+ACTIVE_STATUSES = (
+    ProcessStatus.PENDING,
+    ProcessStatus.DOWNLOADING,
+    ProcessStatus.TRANSCRIBING,
+    ProcessStatus.ANALYZING,
+    ProcessStatus.PROCESSING,
+)
+
+# 結果バックエンドでキューに入っている（まだ実行されていない）ことを表す状態
+QUEUED_STATES = ('PENDING', 'RECEIVED', 'RETRY')
+
+_videos = Video.__table__
+
+
+def _beat(engine, video_id: int):
+    """ハートビートを記録する（タスクのセッションとは別の接続を使用し、updated_atは変更しない）"""
+    with engine.begin() as connection:
+        connection.execute(
+            update(_videos)
+            .where(_videos.c.id == video_id)
+            .values(heartbeat_at=datetime.utcnow(), updated_at=_videos.c.updated_at)
+        )
+
+
+@contextmanager
+def _heartbeat_thread(engine, video_id: int, interval: float):
+    stopped = threading.Event()
+
+    def run():
+        while not stopped.wait(interval):
+            try:
+                _beat(engine, video_id)
+            except Exception as e:
+                logger.warning(f"ハートビートの記録に失敗しました (video_id={video_id}): {str(e)}")
+
+    _beat(engine, video_id)
+    thread = threading.Thread(target=run, name=f'heartbeat-{video_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join(timeout=interval)
+
+
+def task_heartbeat(engine, video_id: Optional[int], interval: float = HEARTBEAT_INTERVAL):
+    """
+    タスクの実行中、バックグラウンドのスレッドで定期的にハートビートを記録する
+
+    Args:
+        engine: SQLAlchemyのエンジン（スレッドから使用するため、セッションではなくエンジンを渡す）
+        video_id: 処理中のビデオID（Noneの場合は何もしない）
+        interval: 更新間隔（秒）
+    """
+    if video_id is None:
+        return nullcontext()
+    return _heartbeat_thread(engine, video_id, interval)
+
+
+def fetch_task_states(celery_app, task_ids: Iterable[str]) -> Dict[str, str]:
+    """
+    複数のタスクの状態を結果バックエンドから一括で取得する
+
+    Redisなどのキー・バリュー型のバックエンドでは1回のMGETで取得し、
+    それ以外のバックエンドではタスクごとに取得する。
+
+    Returns:
+        タスクID -> 状態（'PENDING', 'STARTED', 'SUCCESS' など）
+    """
+    task_ids = [task_id for task_id in dict.fromkeys(task_ids) if task_id]
+    if not task_ids:
+        return {}
+
+    backend = celery_app.backend
+    if hasattr(backend, 'mget') and hasattr(backend, 'get_key_for_task'):
+        try:
+            values = backend.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+            return {
+                task_id: backend.decode_result(value)['status'] if value else 'PENDING'
+                for task_id, value in zip(task_ids, values)
+            }
+        except Exception as e:
+            logger.warning(f"結果バックエンドからの一括取得に失敗したため、個別に取得します: {str(e)}")
+
+    from celery.result import AsyncResult
+    return {task_id: AsyncResult(task_id, app=celery_app).state for task_id in task_ids}
+
+
+def broker_queue_length(celery_app, queues: Optional[Iterable[str]] = None) -> int:
+    """
+    ブローカーのキューに残っているメッセージ数の合計を取得する（取得できない場合は0）
+
+    一括登録などでキューが長い間は、待機中のタスクを停止とみなすまでの時間をキューの長さに応じて延ばすために使用する。
+    """
+    queues = queues or [celery_app.conf.task_default_queue]
+    try:
+        with celery_app.connection_for_read() as connection:
+            channel = connection.default_channel
+            return sum(channel.queue_declare(queue=queue, passive=True).message_count for queue in queues)
+    except Exception as e:
+        logger.warning(f"キューの長さの取得に失敗しました: {str(e)}")
+        return 0
+
+
+def queue_wait_estimate(queue_length: int) -> float:
+    """キューに残っているメッセージがすべて処理されるまでのおおよその時間（秒、MAX_QUEUE_WAITまで）"""
+    if queue_length <= 0:
+        return 0.0
+    if QUEUE_THROUGHPUT <= 0:
+        return MAX_QUEUE_WAIT
+    return min(queue_length / QUEUE_THROUGHPUT, MAX_QUEUE_WAIT)
+
+
+def needs_recovery(video, task_state: Optional[str], now: datetime, queue_length: int = 0) -> bool:
+    """
+    候補のジョブを再開すべきかどうかを、タスクの状態から判定する
+
+    - 実行中（STARTED）だがハートビートが途絶えている: ワーカーが停止した
+    - タスクIDが未記録: キューに投入されていない（投入前に失敗した）ため、最終更新からQUEUED_TIMEOUTが経過したら再開する
+    - 待機中（PENDING/RECEIVED/RETRY）: キューが混んでいるだけの可能性があるため、最終更新から
+      QUEUED_TIMEOUTとキューの長さから見積もった待機時間（queue_wait_estimate）が経過するまで待つ
+    - 終了済み（SUCCESS/FAILURE/REVOKED）なのにジョブが進んでいない: タスクチェーンが途切れた
+    """
+    if task_state is None or task_state in QUEUED_STATES:
+        if video.updated_at is None:
+            return True
+        timeout = QUEUED_TIMEOUT
+        if video.current_task_id:
+            timeout += queue_wait_estimate(queue_length)
+        return (now - video.updated_at).total_seconds() >= timeout
+    return True
@@ -0,0 +1,261 @@
+"""シーン境界と文の区切りのインデックス
+
+動画を一度だけ縮小デコードしてシーンチェンジを検出し、文字起こしの文の区切りと
+合わせて境界インデックスとして保存する。ハイライトの切り出し位置はこの
+インデックスの近くの境界にスナップされるため、カットがショットや文の途中に入らない。
+インデックスはVideoに保存されるので、パラメータを変えた再生成では再デコード不要。
+"""
+import subprocess
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# インデックス形式のバージョン（形式を変えたら上げる）
+INDEX_VERSION = 1
+
+# シーン検出用の縮小デコード設定
+SCENE_SAMPLE_FPS = 4
+SCENE_FRAME_WIDTH = 64
+SCENE_FRAME_HEIGHT = 36
+HISTOGRAM_BINS = 32
+
+# 一度に処理するフレーム数
+FRAMES_PER_BLOCK = 512
+
+# シーンチェンジとみなすヒストグラム差分の下限と、平均からの標準偏差の倍数
+MIN_SCENE_DIFF = 0.25
+SCENE_DIFF_SIGMA = 3.0
+
+# シーンの最小長（秒）。これより短い間隔のカットは間引く
+MIN_SCENE_LENGTH = 1.0
+
+# 文末とみなす文字
+SENTENCE_END_CHARS = ('。', '！', '？', '!', '?', '…')
+
+
+def _histograms(frames: np.ndarray, bins: int = HISTOGRAM_BINS) -> np.ndarray:
+    """グレースケールフレームの輝度ヒストグラムをまとめて計算する（正規化済み）"""
+    n_frames, n_pixels = frames.shape
+    shift = 8 - int(np.log2(bins))
+    indices = (frames >> shift).astype(np.int64) + (np.arange(n_frames, dtype=np.int64) * bins)[:, None]
+    counts = np.bincount(indices.ravel(), minlength=n_frames * bins).reshape(n_frames, bins)
+    return counts.astype(np.float32) / n_pixels
+
+
+def detect_scene_changes(video_path: str, sample_fps: int = SCENE_SAMPLE_FPS,
+                         min_scene_length: float = MIN_SCENE_LENGTH) -> List[float]:
+    """
+    縮小したフレームの輝度ヒストグラム差分からシーンチェンジの時刻を検出する
+
+    FFmpegで低解像度・低フレームレートのグレースケール映像を一度だけデコードし、
+    ブロック単位でヒストグラムを計算する。
+
+    Args:
+        video_path: 動画ファイルのパス
+        sample_fps: 解析に使用するフレームレート
+        min_scene_length: シーンの最小長（秒）
+
+    Returns:
+        シーンチェンジの時刻（秒）のリスト
+    """
+    frame_bytes = SCENE_FRAME_WIDTH * SCENE_FRAME_HEIGHT
+    command = [
+        'ffmpeg', '-nostdin', '-v', 'error',
+        '-i', video_path,
+        '-an', '-sn',
+        '-vf', f'fps={sample_fps},scale={SCENE_FRAME_WIDTH}:{SCENE_FRAME_HEIGHT},format=gray',
+        '-f', 'rawvideo', '-'
+    ]
+
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise Exception("FFmpegがインストールされていないか、パスが通っていません。インストール方法はREADMEを参照してください。")
+
+    diff_blocks = []
+    previous_histogram = None
+
+    try:
+        while True:
+            chunk = process.stdout.read(frame_bytes * FRAMES_PER_BLOCK)
+            if not chunk:
+                break
+
+            usable = (len(chunk) // frame_bytes) * frame_bytes
+            if usable == 0:
+                continue
+
+            frames = np.frombuffer(chunk[:usable], dtype=np.uint8).reshape(-1, frame_bytes)
+            histograms = _histograms(frames)
+
+            if previous_histogram is None:
+                previous = np.vstack([histograms[:1], histograms[:-1]])
+            else:
+                previous = np.vstack([previous_histogram, histograms[:-1]])
+
+            # L1距離を0〜1に正規化
+            diff_blocks.append(np.abs(histograms - previous).sum(axis=1) / 2.0)
+            previous_histogram = histograms[-1:]
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read().decode('utf-8', errors='ignore')
+        process.stderr.close()
+        process.wait()
+
+    if process.returncode != 0 and not diff_blocks:
+        raise Exception(f"シーン検出用のデコード中にエラーが発生しました: {stderr.strip()}")
+
+    if not diff_blocks:
+        return []
+
+    diffs = np.concatenate(diff_blocks)
+    threshold = max(MIN_SCENE_DIFF, float(diffs.mean() + SCENE_DIFF_SIGMA * diffs.std()))
+    candidates = np.flatnonzero(diffs > threshold)
+
+    # 短すぎるシーンを間引く
+    cuts = []
+    last_cut = -min_scene_length
+    for index in candidates:
+        time = index / sample_fps
+        if time - last_cut >= min_scene_length:
+            cuts.append(round(float(time), 3))
+            last_cut = time
+
+    return cuts
+
+
+def sentence_boundaries(transcript_segments: Iterable) -> List[float]:
+    """
+    文字起こしセグメントから文の区切りの時刻を抽出する
+
+    文末記号で終わるセグメントの終了時刻と、発話の間（前のセグメントの終了から
+    次のセグメントの開始まで空いている箇所）の開始時刻を区切りとみなす。
+
+    Args:
+        transcript_segments: 文字起こしセグメント（辞書またはTranscriptSegment）
+
+    Returns:
+        文の区切りの時刻（秒）のリスト
+    """
+    rows = []
+    for segment in transcript_segments or []:
+        if isinstance(segment, dict):
+            rows.append((segment.get('start_time', 0.0), segment.get('end_time', 0.0), segment.get('text', '')))
+        else:
+            rows.append((segment.start_time, segment.end_time, segment.text))
+    rows.sort(key=lambda row: row[0])
+
+    boundaries = set()
+    previous_end = None
+    for start_time, end_time, text in rows:
+        if previous_end is None or start_time > previous_end:
+            boundaries.add(round(float(start_time), 3))
+        if (text or '').strip().endswith(SENTENCE_END_CHARS):
+            boundaries.add(round(float(end_time), 3))
+        previous_end = end_time if previous_end is None else max(previous_end, end_time)
+
+    if previous_end is not None:
+        boundaries.add(round(float(previous_end), 3))
+
+    return sorted(boundaries)
+
+
+def build_boundary_index(video_path: str, transcript_segments: Optional[Iterable] = None) -> Dict:
+    """
+    動画の境界インデックスを作成する
+
+    Args:
+        video_path: 動画ファイルのパス
+        transcript_segments: 文字起こしセグメント
+
+    Returns:
+        境界インデックス（JSONとして保存可能な辞書）
+    """
+    try:
+        return {
+            'version': INDEX_VERSION,
+            'scene_cuts': detect_scene_changes(video_path),
+            'sentence_boundaries': sentence_boundaries(transcript_segments),
+        }
+    except Exception as e:
+        raise Exception(f"境界インデックスの作成中にエラーが発生しました: {str(e)}")
+
+
+def is_index_current(index: Optional[Dict]) -> bool:
+    """保存済みのインデックスが現在の形式かどうかを判定する"""
+    return bool(index) and index.get('version') == INDEX_VERSION
+
+
+def _nearest(boundaries: np.ndarray, value: float, max_shift: float) -> Optional[float]:
+    """max_shift以内で最も近い境界を返す（なければNone）"""
+    if boundaries.size == 0:
+        return None
+    position = np.searchsorted(boundaries, value)
+    candidates = boundaries[max(position - 1, 0):position + 1]
+    nearest = candidates[np.argmin(np.abs(candidates - value))]
+    return float(nearest) if abs(nearest - value) <= max_shift else None
+
+
+def snap_windows(starts: np.ndarray, ends: np.ndarray, index: Optional[Dict],
+                 max_shift: float = 1.5, min_length: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ウィンドウの開始・終了時刻を近くのシーン境界・文の区切りにスナップする
+
+    文の区切りを優先し、近くに文の区切りがない場合はシーン境界にスナップする。
+    スナップによってウィンドウが短くなりすぎる場合は元の時刻を使用する。
+
+    Args:
+        starts: ウィンドウの開始時間
+        ends: ウィンドウの終了時間
+        index: build_boundary_indexで作成した境界インデックス
+        max_shift: 境界に移動する最大距離（秒）
+        min_length: スナップ後のウィンドウの最小長（秒）
+
+    Returns:
+        スナップ後の (開始時間, 終了時間) の配列
+    """
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    if not index:
+        return starts, ends
+
+    sentences = np.asarray(index.get('sentence_boundaries', []), dtype=np.float64)
+    scenes = np.asarray(index.get('scene_cuts', []), dtype=np.float64)
+
+    def snap(value):
+        snapped = _nearest(sentences, value, max_shift)
+        if snapped is None:
+            snapped = _nearest(scenes, value, max_shift)
+        return value if snapped is None else snapped
+
+    snapped_starts = np.empty_like(starts)
+    snapped_ends = np.empty_like(ends)
+    for i, (start_time, end_time) in enumerate(zip(starts.tolist(), ends.tolist())):
+        new_start = snap(start_time)
+        new_end = snap(end_time)
+        if new_end - new_start < min_length:
+            new_start, new_end = start_time, end_time
+        snapped_starts[i] = max(0.0, new_start)
+        snapped_ends[i] = new_end
+    return snapped_starts, snapped_ends
+
+
+def snap_highlights(highlights: Sequence[Tuple[float, float, float]], index: Optional[Dict],
+                    max_shift: float = 1.5, min_length: float = 1.0) -> List[Tuple[float, float, float]]:
+    """
+    ハイライトの開始・終了時刻を近くのシーン境界・文の区切りにスナップする（snap_windows を参照）
+
+    Args:
+        highlights: (開始時間, 終了時間, スコア) のリスト
+        index: build_boundary_indexで作成した境界インデックス
+        max_shift: 境界に移動する最大距離（秒）
+        min_length: スナップ後のクリップの最小長（秒）
+
+    Returns:
+        スナップ後の (開始時間, 終了時間, スコア) のリスト
+    """
+    if not index or not highlights:
+        return list(highlights)
+
+    starts, ends, scores = zip(*highlights)
+    snapped_starts, snapped_ends = snap_windows(starts, ends, index, max_shift, min_length)
+    return list(zip(snapped_starts.tolist(), snapped_ends.tolist(), scores))
@@ -1,8 +1,7 @@
 import os
-import boto3
 import logging
-from botocore.exceptions import ClientError
 from typing import Optional, Union, BinaryIO
+from src.workspace import TMP_DIR
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +38,8 @@ class StorageManager:
         if self.use_s3:
             if not upload_bucket or not output_bucket:
                 raise ValueError("S3使用時はupload_bucketとoutput_bucketが必要です")
+            # boto3はS3使用時にのみ読み込む
+            import boto3
             self.s3_client = boto3.client('s3', region_name=self.region)
     
     def save_upload_file(self, file_data: Union[str, BinaryIO], filename: str) -> str:
@@ -158,7 +159,7 @@ class StorageManager:
                 self.s3_client.upload_fileobj(file_data, bucket, filename)
             
             return f"s3://{bucket}/{filename}"
-        except ClientError as e:
+        except Exception as e:
             logger.error(f"S3へのファイル保存中にエラーが発生しました: {str(e)}")
             raise
     
@@ -190,8 +191,8 @@ class StorageManager:
     def _get_from_s3(self, filename: str, bucket: str) -> str:
         """S3からファイルを取得して一時ファイルに保存"""
         try:
-            # 一時ディレクトリにダウンロード
-            tmp_dir = os.path.join('/tmp', 'ai-kirinuki')
+            # 一時ディレクトリにダウンロード（一定時間使用されなければ定期的な掃除で削除される）
+            tmp_dir = TMP_DIR
             if not os.path.exists(tmp_dir):
                 os.makedirs(tmp_dir)
             
@@ -199,6 +200,6 @@ class StorageManager:
             self.s3_client.download_file(bucket, filename, local_path)
             
             return local_path
-        except ClientError as e:
+        except Exception as e:
             logger.error(f"S3からのファイル取得中にエラーが発生しました: {str(e)}")
             raise
\ No newline at end of file
@@ -2,7 +2,7 @@
 
 from src.models import db, ProcessLog
 
-def update_log_with_task_id(video_id, status, message, task_id):
+def update_log_with_task_id(video_id, status, message, task_id, details=None):
     """タスクIDを含めて処理ログを記録する関数"""
     log = ProcessLog(
         video_id=video_id,
@@ -10,6 +10,8 @@ def update_log_with_task_id(video_id, status, message, task_id):
         message=message,
         task_id=task_id
     )
+    if details is not None:
+        log.set_details(details)
     db.session.add(log)
     db.session.commit()
     
@@ -3,13 +3,23 @@ import time
 from datetime import datetime, timedelta
 from celery import Celery
 from celery.signals import task_failure
-from moviepy.editor import VideoFileClip
-import yt_dlp
 from src.models import db, Video, Highlight, ProcessLog, ProcessStatus, TranscriptSegment
-from src.youtube_downloader import download_video
-from src.video_processor import get_video_highlights, process_video
+from src.youtube_downloader import download_video, download_highlight_sections
+from src.media_proxy import ensure_analysis_proxy
 from src.task_utils import update_log_with_task_id
-from src.transcription import transcribe_video
+from src.instrumentation import measure_stage
+from src.profiling import JobProfiler
+from src.recovery import task_heartbeat
+from src.progress import ProgressReporter
+from src.transcript_search import index_video_transcript_safely
+from src.transcript_store import (is_packed_storage, load_segments, pack_video_transcript, segment_count,
+                                  transcript_text)
+from src.download_engine import DOWNLOAD_QUEUE, TWO_PHASE_DOWNLOAD
+from src.workspace import (cleanup_job, cleanup_tmp, enforce_quota, estimate_download_bytes, job_scratch_dir,
+                           prepare_job, task_scratch)
+
+# 注意: 動画処理・AI関連のライブラリ（moviepy, whisper, torch, numpy, yt_dlp）は
+# Webプロセスの起動を遅くしないよう、モジュールの先頭ではなく各タスクの中で読み込む
 
 # Celeryの設定
 celery = Celery('ai_kirinuki_tasks')
@@ -31,6 +41,8 @@ def configure_celery(app):
         task_track_started=True,  # タスクの開始状態を追跡
         task_default_retry_delay=60,  # 失敗したタスクの再試行までの待機時間（秒）
         task_default_queue='default',  # デフォルトのキュー名
+        # ダウンロードはI/O待ちが中心のため、スレッドプールのワーカーが処理する専用のキューに振り分ける
+        task_routes={'src.tasks.download_task': {'queue': DOWNLOAD_QUEUE}},
         task_time_limit=3600,     # タスクの実行時間制限（秒）
         # データベース関連の設定
         task_ignore_result=False, # タスク結果を保存
@@ -48,7 +60,11 @@ def configure_celery(app):
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
             with app.app_context():
-                return self.run(*args, **kwargs)
+                # ビデオを処理するタスクの実行中はハートビートを記録し、停止を監視タスクで検出できるようにする
+                video_id = args[0] if args and isinstance(args[0], int) else None
+                # タスクの一時ファイルはジョブ専用の作業ディレクトリに作成し、終了時に削除する
+                with task_heartbeat(db.engine, video_id), task_scratch(video_id):
+                    return self.run(*args, **kwargs)
         
         # 自動リトライ設定
         autoretry_for = (Exception,)  # すべての例外でリトライを行う
@@ -159,6 +175,57 @@ def process_video_task(self, video_id):
         
         return {'status': 'error', 'message': str(e), 'video_id': video_id}
 
+def keyword_clip_stage(video):
+    """
+    キーワードから作成した切り抜き（派生動画）を処理するステージを決める
+    
+    常に書き出しから処理する（文字起こし・解析は行わない）。元動画のファイルが残っている場合はそれを使用し、
+    削除されている場合は（切り抜きの区間は決まっているため）元動画全体はダウンロードせず、
+    2段階ダウンロードと同じく書き出し時にハイライトの区間だけを取得する。
+    
+    Returns:
+        (ステータス, タスク)
+    """
+    source_path = video.source_video.original_path if video.source_video is not None else None
+    if source_path and (source_path.startswith('s3://') or os.path.exists(source_path)):
+        video.original_path = source_path
+    elif video.original_path and not (video.original_path.startswith('s3://') or os.path.exists(video.original_path)):
+        video.original_path = None
+    if not video.original_path:
+        video.two_phase_download = True
+    return ProcessStatus.PROCESSING, create_highlights_task
+
+def enqueue_keyword_clip(video):
+    """
+    キーワードから作成した切り抜きの処理をキューに投入する（コミットは呼び出し側で行う）
+    
+    Returns:
+        タスクID
+    """
+    video.status, task = keyword_clip_stage(video)
+    video.current_task_id = task.delay(video.id).id
+    db.session.add(ProcessLog(
+        video_id=video.id,
+        status=video.status,
+        message="元動画を書き出しに使用します" if video.original_path
+        else "元動画のファイルがないため、切り抜きの区間だけを取得して書き出します",
+        task_id=video.current_task_id
+    ))
+    return video.current_task_id
+
+def enqueue_videos(video_ids):
+    """
+    複数のビデオの処理をまとめてキューに投入する（一括登録用）
+
+    Celeryのgroupで送信するため、ブローカーへの接続は1回で済む。
+
+    Returns:
+        ビデオID -> タスクID
+    """
+    from celery import group
+    result = group(process_video_task.s(video_id) for video_id in video_ids).apply_async()
+    return {video_id: child.id for video_id, child in zip(video_ids, result.results)}
+
 # 直接実行する関数版（同期実行）
 def download_task_sync(video_id):
     """動画のダウンロードタスク（同期版）"""
@@ -181,12 +248,29 @@ def download_task_sync(video_id):
         db.session.add(log)
         db.session.commit()
         
+        # ディスクの容量を確保（不足している場合は処理中でないジョブの作業ファイルを古い順に削除する）
+        prepare_job(video, estimate_download_bytes(video.duration))
+        
         # 動画のダウンロード
         upload_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
-        file_path = download_video(video.youtube_url, upload_dir, video.session_id)
+        timings = {}
+        profiler = JobProfiler.for_video(video)
+        with measure_stage('download', timings) as download_timing, profiler.stage('download'):
+            if video.original_path and (video.original_path.startswith('s3://') or os.path.exists(video.original_path)):
+                # 再試行・リカバリー時はダウンロード済みのファイルを再利用
+                file_path = video.original_path
+            else:
+                # 2段階ダウンロードでは解析用の低画質版だけを取得する（ハイライトの区間は書き出し時に取得）
+                video.two_phase_download = TWO_PHASE_DOWNLOAD
+                file_path = download_video(video.youtube_url, upload_dir, video.session_id,
+                                           preview=video.two_phase_download)
+        if os.path.exists(file_path):
+            # 2段階ダウンロードの効果を確認できるよう、ダウンロードしたファイルのサイズを記録する
+            download_timing['download_bytes'] = os.path.getsize(file_path)
         
         # メタデータの抽出
-        extract_metadata(video, video.youtube_url)
+        with measure_stage('metadata', timings), profiler.stage('metadata'):
+            extract_metadata(video, video.youtube_url)
         
         # ビデオレコードの更新
         video.original_path = file_path
@@ -198,6 +282,7 @@ def download_task_sync(video_id):
             status=ProcessStatus.DOWNLOADING,
             message="動画のダウンロードが完了しました"
         )
+        log.set_details({'timings': timings, **profiler.details()})
         db.session.add(log)
         db.session.commit()
         
@@ -242,16 +327,52 @@ def analyze_task_sync(video_id):
         db.session.add(log)
         db.session.commit()
         
-        # 動画の解析
-        highlights_data = get_video_highlights(video.original_path)
-        
-        # ハイライトの保存
-        for start_time, end_time in highlights_data:
+        # 解析用のライブラリはワーカーでのみ必要なため、ここで読み込む
+        from src.video_processor import get_video_highlights
+        from src.scene_index import build_boundary_index, is_index_current
+        from src.highlight_selection import POLICY_DURATION
+        
+        # ディスクの容量を確保
+        prepare_job(video)
+        
+        # 解析用プロキシの取得（キャッシュが失われている場合は再作成）
+        timings = {}
+        profiler = JobProfiler.for_video(video)
+        with measure_stage('proxy', timings), profiler.stage('proxy'):
+            analysis_path = ensure_analysis_proxy(video.original_path)
+        video.proxy_path = analysis_path
+        
+        # 文字起こしセグメントの取得（保存形式によらない）
+        transcript_segments = load_segments(video)
+        
+        # 境界インデックスの取得（未作成の場合のみ動画をデコードして作成）
+        boundary_index = video.get_scene_index()
+        if not is_index_current(boundary_index):
+            with measure_stage('scene_index', timings), profiler.stage('scene_index'):
+                boundary_index = build_boundary_index(analysis_path, transcript_segments)
+            video.set_scene_index(boundary_index)
+        
+        # 動画の解析（音声特徴と文字起こしからスコアを計算）
+        # 目標の長さが指定されている場合は、その長さ以内で重要度が最大になるように選択
+        policy, policy_value = (POLICY_DURATION, video.target_duration) if video.target_duration else (None, None)
+        # 音声の解析の進捗をRedisに通知する
+        reporter = ProgressReporter(video.session_id, 40, 70, "動画を解析中です")
+        with measure_stage('analyze', timings), profiler.stage('analyze'):
+            highlights_data = get_video_highlights(analysis_path,
+                                                   transcript_segments=transcript_segments,
+                                                   boundary_index=boundary_index,
+                                                   policy=policy,
+                                                   policy_value=policy_value,
+                                                   progress_callback=reporter.update)
+        
+        # ハイライトの保存（再試行時に重複しないよう、前回の結果を削除してから登録する）
+        Highlight.query.filter_by(video_id=video_id).delete(synchronize_session=False)
+        for start_time, end_time, score in highlights_data:
             highlight = Highlight(
                 video_id=video_id,
                 start_time=start_time,
                 end_time=end_time,
-                importance_score=0.8  # 実際の実装ではスコアを計算
+                importance_score=score
             )
             db.session.add(highlight)
         
@@ -264,6 +385,7 @@ def analyze_task_sync(video_id):
             status=ProcessStatus.ANALYZING,
             message="動画の解析が完了しました"
         )
+        log.set_details({'timings': timings, **profiler.details()})
         db.session.add(log)
         db.session.commit()
         
@@ -308,14 +430,35 @@ def create_highlights_task_sync(video_id):
         db.session.add(log)
         db.session.commit()
         
-        # ハイライト情報の取得
-        highlights = [(h.start_time, h.end_time) for h in video.highlights]
+        # ディスクの容量を確保
+        prepare_job(video)
+        
+        # ハイライト情報の取得（時間順）
+        highlights = [(h.start_time, h.end_time) for h in
+                      Highlight.query.filter_by(video_id=video_id).order_by(Highlight.start_time).all()]
         
         # 出力ディレクトリの設定
         output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'outputs')
         
-        # 切り抜き動画の作成
-        output_path = process_video(video.original_path, highlights, output_dir, video.session_id)
+        # 切り抜き動画の作成（moviepyはワーカーでのみ読み込む）
+        from src.video_processor import process_video
+        timings = {}
+        profiler = JobProfiler.for_video(video)
+        # 書き出したフレーム数から進捗をRedisに通知する
+        reporter = ProgressReporter(video.session_id, 80, 99, "切り抜き動画を書き出し中です")
+        clip_sources = None
+        if video.two_phase_download:
+            # 2段階ダウンロードの場合は、ハイライトの区間だけを高画質で取得して書き出す
+            upload_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+            with measure_stage('download_sections', timings) as section_timing, profiler.stage('download_sections'):
+                clip_sources = download_highlight_sections(video.youtube_url, highlights, upload_dir, video.session_id)
+            section_timing['download_bytes'] = sum(os.path.getsize(path) for path in clip_sources)
+        with measure_stage('render', timings), profiler.stage('render'):
+            output_path = process_video(video.original_path, highlights, output_dir, video.session_id,
+                                        progress_callback=reporter.update, clip_sources=clip_sources)
+        
+        # 書き出しが完了したら、元動画と中間ファイル（プロキシ・取得した区間など）を削除する
+        removed_bytes = cleanup_job(video)
         
         # ビデオレコードの更新
         video.output_path = output_path
@@ -328,6 +471,7 @@ def create_highlights_task_sync(video_id):
             status=ProcessStatus.COMPLETED,
             message="切り抜き動画の作成が完了しました"
         )
+        log.set_details({'timings': timings, 'removed_bytes': removed_bytes, **profiler.details()})
         db.session.add(log)
         db.session.commit()
         
@@ -375,12 +519,29 @@ def download_task(self, video_id):
         db.session.add(log)
         db.session.commit()
         
+        # ディスクの容量を確保（不足している場合は処理中でないジョブの作業ファイルを古い順に削除する）
+        prepare_job(video, estimate_download_bytes(video.duration))
+        
         # 動画のダウンロード
         upload_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
-        file_path = download_video(video.youtube_url, upload_dir, video.session_id)
+        timings = {}
+        profiler = JobProfiler.for_video(video)
+        with measure_stage('download', timings) as download_timing, profiler.stage('download'):
+            if video.original_path and (video.original_path.startswith('s3://') or os.path.exists(video.original_path)):
+                # 再試行・リカバリー時はダウンロード済みのファイルを再利用
+                file_path = video.original_path
+            else:
+                # 2段階ダウンロードでは解析用の低画質版だけを取得する（ハイライトの区間は書き出し時に取得）
+                video.two_phase_download = TWO_PHASE_DOWNLOAD
+                file_path = download_video(video.youtube_url, upload_dir, video.session_id,
+                                           preview=video.two_phase_download)
+        if os.path.exists(file_path):
+            # 2段階ダウンロードの効果を確認できるよう、ダウンロードしたファイルのサイズを記録する
+            download_timing['download_bytes'] = os.path.getsize(file_path)
         
         # メタデータの抽出
-        extract_metadata(video, video.youtube_url)
+        with measure_stage('metadata', timings), profiler.stage('metadata'):
+            extract_metadata(video, video.youtube_url)
         
         # ビデオレコードの更新
         video.original_path = file_path
@@ -392,11 +553,13 @@ def download_task(self, video_id):
             status=ProcessStatus.DOWNLOADING,
             message="動画のダウンロードが完了しました"
         )
+        log.set_details({'timings': timings, **profiler.details()})
         db.session.add(log)
         db.session.commit()
         
         # 次のタスク（文字起こしタスク）を自動的に実行
-        task = transcribe_task.delay(video_id)
+        # キーワードから作成した切り抜きは元動画の文字起こしから区間を作成済みのため、書き出しに進む
+        task = (create_highlights_task if video.source_video_id is not None else transcribe_task).delay(video_id)
         
         # 次のタスクIDをデータベースに記録
         video.current_task_id = task.id
@@ -447,24 +610,71 @@ def transcribe_task(self, video_id):
         db.session.add(log)
         db.session.commit()
         
-        # 文字起こしの実行
-        full_text, segments = transcribe_video(video.original_path)
+        # ディスクの容量を確保
+        prepare_job(video)
         
-        # 文字起こし結果の保存
-        video.transcript = full_text
+        # 解析用プロキシの作成（以降の文字起こし・解析はプロキシを使用）
+        timings = {}
+        profiler = JobProfiler.for_video(video)
+        with measure_stage('proxy', timings), profiler.stage('proxy'):
+            video.proxy_path = ensure_analysis_proxy(video.original_path)
+        db.session.commit()
         
-        # セグメント情報の保存
-        for segment in segments:
-            transcript_segment = TranscriptSegment(
-                video_id=video_id,
-                start_time=segment["start_time"],
-                end_time=segment["end_time"],
-                text=segment["text"]
-            )
-            db.session.add(transcript_segment)
+        # 文字起こしの実行（音声抽出と文字起こしを個別に計測する。whisper/torchはワーカーでのみ読み込む）
+        # 一定の長さのチャンクごとにセグメントとチェックポイント（transcribed_until）を保存するため、
+        # 再試行・リカバリー時は保存済みの位置から再開する
+        if video.transcript is None:
+            from src.transcription import extract_audio, transcribe_audio_chunks
+            resume_from = video.transcribed_until or 0.0
+            
+            # チェックポイントより後のセグメントを削除して重複登録を防ぐ
+            # （SQLiteでは書き込みのトランザクションを開いたままにするとハートビートが書き込めないため、すぐにコミットする）
+            TranscriptSegment.query.filter(
+                TranscriptSegment.video_id == video_id,
+                TranscriptSegment.start_time >= resume_from
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            
+            # 再開時は保存済みの文字起こしの末尾を文脈として渡す
+            last_segment = TranscriptSegment.query.filter_by(video_id=video_id).order_by(
+                TranscriptSegment.start_time.desc()).first()
+            
+            with measure_stage('extract_audio', timings), profiler.stage('extract_audio'):
+                audio_path = extract_audio(video.proxy_path, start_time=resume_from,
+                                           temp_dir=job_scratch_dir(video_id))
+            with measure_stage('transcribe', timings), profiler.stage('transcribe'):
+                # デコード中の進捗はRedisに通知する（DBには書き込まない）
+                reporter = ProgressReporter(video.session_id, 35, 60, "文字起こし中です")
+                chunks = transcribe_audio_chunks(audio_path, offset=resume_from,
+                                                 initial_prompt=last_segment.text if last_segment else None,
+                                                 progress_callback=reporter.update)
+                for transcribed_until, segments in chunks:
+                    # セグメント情報の保存
+                    for segment in segments:
+                        db.session.add(TranscriptSegment(
+                            video_id=video_id,
+                            start_time=segment["start_time"],
+                            end_time=segment["end_time"],
+                            text=segment["text"]
+                        ))
+                    video.transcribed_until = transcribed_until
+                    db.session.commit()
+            
+            # 文字起こし結果の保存
+            saved_segments = TranscriptSegment.query.filter_by(video_id=video_id).order_by(
+                TranscriptSegment.start_time).all()
+            video.transcript = "".join(segment.text for segment in saved_segments)
+            # 全動画を横断して検索できるよう、検索用のインデックスに登録する
+            index_video_transcript_safely(video_id, saved_segments)
+            if is_packed_storage():
+                # セグメントの行を動画ごとの配列にまとめる（全文も配列から復元する）
+                pack_video_transcript(video, saved_segments)
+        
+        full_text = transcript_text(video)
+        segments_count = segment_count(video)
         
         # ビデオレコードの更新
-        video.progress = 40
+        video.progress = 60
         
         # ログ記録
         log = ProcessLog(
@@ -473,6 +683,7 @@ def transcribe_task(self, video_id):
             message="動画の文字起こしが完了しました",
             task_id=self.request.id
         )
+        log.set_details({'timings': timings, **profiler.details()})
         db.session.add(log)
         db.session.commit()
         
@@ -487,7 +698,7 @@ def transcribe_task(self, video_id):
             'status': 'success', 
             'video_id': video_id, 
             'transcript_length': len(full_text), 
-            'segments_count': len(segments),
+            'segments_count': segments_count,
             'task_id': self.request.id
         }
     
@@ -522,7 +733,7 @@ def analyze_task(self, video_id):
         
         # ステータス更新
         video.status = ProcessStatus.ANALYZING
-        video.progress = 50
+        video.progress = 60
         video.current_task_id = self.request.id  # 現在のタスクIDを保存
         
         # ログ記録 - タスクIDを含める
@@ -533,16 +744,55 @@ def analyze_task(self, video_id):
             task_id=self.request.id
         )
         
-        # 動画の解析
-        highlights_data = get_video_highlights(video.original_path)
+        # 解析用のライブラリはワーカーでのみ必要なため、ここで読み込む
+        from src.video_processor import get_video_highlights
+        from src.scene_index import build_boundary_index, is_index_current
+        from src.highlight_selection import POLICY_DURATION
+        
+        # ディスクの容量を確保
+        prepare_job(video)
+        
+        # 解析用プロキシの取得（キャッシュが失われている場合は再作成）
+        timings = {}
+        profiler = JobProfiler.for_video(video)
+        with measure_stage('proxy', timings), profiler.stage('proxy'):
+            analysis_path = ensure_analysis_proxy(video.original_path)
+        video.proxy_path = analysis_path
+        # 時間のかかる解析の前にコミットする（SQLiteでは書き込みのトランザクションを開いたままにするとハートビートが書き込めない）
+        db.session.commit()
+        
+        # 文字起こしセグメントの取得（保存形式によらない）
+        transcript_segments = load_segments(video)
         
-        # ハイライトの保存
-        for start_time, end_time in highlights_data:
+        # 境界インデックスの取得（未作成の場合のみ動画をデコードして作成）
+        boundary_index = video.get_scene_index()
+        if not is_index_current(boundary_index):
+            with measure_stage('scene_index', timings), profiler.stage('scene_index'):
+                boundary_index = build_boundary_index(analysis_path, transcript_segments)
+            video.set_scene_index(boundary_index)
+            db.session.commit()
+        
+        # 動画の解析（音声特徴と文字起こしからスコアを計算）
+        # 目標の長さが指定されている場合は、その長さ以内で重要度が最大になるように選択
+        policy, policy_value = (POLICY_DURATION, video.target_duration) if video.target_duration else (None, None)
+        # 音声の解析の進捗をRedisに通知する
+        reporter = ProgressReporter(video.session_id, 60, 70, "動画を解析中です")
+        with measure_stage('analyze', timings), profiler.stage('analyze'):
+            highlights_data = get_video_highlights(analysis_path,
+                                                   transcript_segments=transcript_segments,
+                                                   boundary_index=boundary_index,
+                                                   policy=policy,
+                                                   policy_value=policy_value,
+                                                   progress_callback=reporter.update)
+        
+        # ハイライトの保存（再試行時に重複しないよう、前回の結果を削除してから登録する）
+        Highlight.query.filter_by(video_id=video_id).delete(synchronize_session=False)
+        for start_time, end_time, score in highlights_data:
             highlight = Highlight(
                 video_id=video_id,
                 start_time=start_time,
                 end_time=end_time,
-                importance_score=0.8  # 実際の実装ではスコアを計算
+                importance_score=score
             )
             db.session.add(highlight)
         
@@ -554,7 +804,8 @@ def analyze_task(self, video_id):
             video_id=video_id,
             status=ProcessStatus.ANALYZING,
             message="動画の解析が完了しました",
-            task_id=self.request.id
+            task_id=self.request.id,
+            details={'timings': timings, **profiler.details()}
         )
         
         # 次のタスク（動画作成タスク）を実行
@@ -595,7 +846,7 @@ def create_highlights_task(self, video_id):
         
         # ステータス更新
         video.status = ProcessStatus.PROCESSING
-        video.progress = 80
+        video.progress = 70
         video.current_task_id = self.request.id  # 現在のタスクIDを保存
         
         # ログ記録
@@ -608,14 +859,35 @@ def create_highlights_task(self, video_id):
         db.session.add(log)
         db.session.commit()
         
-        # ハイライト情報の取得
-        highlights = [(h.start_time, h.end_time) for h in video.highlights]
+        # ディスクの容量を確保
+        prepare_job(video)
+        
+        # ハイライト情報の取得（時間順）
+        highlights = [(h.start_time, h.end_time) for h in
+                      Highlight.query.filter_by(video_id=video_id).order_by(Highlight.start_time).all()]
         
         # 出力ディレクトリの設定
         output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'outputs')
         
-        # 切り抜き動画の作成
-        output_path = process_video(video.original_path, highlights, output_dir, video.session_id)
+        # 切り抜き動画の作成（moviepyはワーカーでのみ読み込む）
+        from src.video_processor import process_video
+        timings = {}
+        profiler = JobProfiler.for_video(video)
+        # 書き出したフレーム数から進捗をRedisに通知する
+        reporter = ProgressReporter(video.session_id, 70, 99, "切り抜き動画を書き出し中です")
+        clip_sources = None
+        if video.two_phase_download:
+            # 2段階ダウンロードの場合は、ハイライトの区間だけを高画質で取得して書き出す
+            upload_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+            with measure_stage('download_sections', timings) as section_timing, profiler.stage('download_sections'):
+                clip_sources = download_highlight_sections(video.youtube_url, highlights, upload_dir, video.session_id)
+            section_timing['download_bytes'] = sum(os.path.getsize(path) for path in clip_sources)
+        with measure_stage('render', timings), profiler.stage('render'):
+            output_path = process_video(video.original_path, highlights, output_dir, video.session_id,
+                                        progress_callback=reporter.update, clip_sources=clip_sources)
+        
+        # 書き出しが完了したら、元動画と中間ファイル（プロキシ・取得した区間など）を削除する
+        removed_bytes = cleanup_job(video)
         
         # ビデオレコードの更新
         video.output_path = output_path
@@ -629,6 +901,7 @@ def create_highlights_task(self, video_id):
             message="切り抜き動画の作成が完了しました",
             task_id=self.request.id
         )
+        log.set_details({'timings': timings, 'removed_bytes': removed_bytes, **profiler.details()})
         db.session.add(log)
         db.session.commit()
         
@@ -656,6 +929,8 @@ def create_highlights_task(self, video_id):
 def extract_metadata(video, youtube_url):
     """動画のメタデータを抽出する"""
     try:
+        import yt_dlp
+        
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
@@ -689,158 +964,144 @@ def extract_metadata(video, youtube_url):
 # タスク失敗検出とリカバリ用の定期タスク
 @celery.task
 def monitor_failed_tasks():
-    """失敗したタスクを検出し、必要に応じて再起動するタスク"""
+    """停止・失敗したジョブを検出し、チェックポイントから再開するタスク"""
     try:
-        from src.models import db, Video, ProcessLog, ProcessStatus
-        
-        # FAILEDステータスのビデオを取得（最終更新から一定時間経過したもののみ）
-        # 監視間隔を長めに設定し、頻繁なリカバリーを避ける
-        recovery_threshold = datetime.utcnow() - timedelta(minutes=15)  # 15分前までに失敗したタスク
-        
-        # 失敗したビデオとステータスが中途半端なビデオを検索
-        failed_videos = db.session.query(Video).filter(
-            (Video.status == ProcessStatus.FAILED) &
-            (Video.updated_at <= recovery_threshold) &
-            (Video.progress < 100)  # 完了していないものを対象に
-        ).all()
-        
-        # 中断したビデオ（タイムアウトや不正終了など）
-        # 直近5分間に更新されていないものを「停止している」と判断
-        stalled_videos = db.session.query(Video).filter(
-            Video.status.in_([
-                ProcessStatus.DOWNLOADING,
-                ProcessStatus.TRANSCRIBING,
-                ProcessStatus.ANALYZING,
-                ProcessStatus.PROCESSING
-            ]) &
-            (Video.updated_at <= recovery_threshold) &
-            (Video.progress < 100) &
-            (Video.status != ProcessStatus.COMPLETED)  # 完了したものは除外
-        ).all()
+        from sqlalchemy import and_, exists, func, or_
+        from src.recovery import (ACTIVE_STATUSES, FAILED_RETRY_DELAY, HEARTBEAT_TIMEOUT, MAX_RECOVERY_ATTEMPTS,
+                                  MONITOR_BATCH_SIZE, broker_queue_length, fetch_task_states, needs_recovery)
+        
+        now = datetime.utcnow()
+        
+        # 候補を1回のクエリで取得する
+        # - 失敗してから一定時間が経過したもの
+        # - 処理中だがハートビート（未記録の場合は最終更新）が途絶えているもの
+        # 再開先のステージの判定に使うため、ハイライトの有無も同じクエリで取得する
+        has_highlights = exists().where(Highlight.video_id == Video.id)
+        candidates = db.session.query(Video, has_highlights.label('has_highlights')).filter(
+            Video.progress < 100,
+            Video.retry_count <= MAX_RECOVERY_ATTEMPTS,
+            or_(
+                and_(Video.status == ProcessStatus.FAILED,
+                     Video.updated_at <= now - timedelta(seconds=FAILED_RETRY_DELAY)),
+                and_(Video.status.in_(ACTIVE_STATUSES),
+                     func.coalesce(Video.heartbeat_at, Video.updated_at) <= now - timedelta(seconds=HEARTBEAT_TIMEOUT)),
+            )
+        ).order_by(Video.updated_at).limit(MONITOR_BATCH_SIZE).with_for_update(skip_locked=True, of=Video).all()
         
-        recovery_count = 0
+        # 処理中のジョブのタスクの状態を一括で取得
+        task_states = fetch_task_states(celery, [video.current_task_id for video, _ in candidates
+                                                 if video.status != ProcessStatus.FAILED])
         
-        # 失敗したタスクのリカバリ
-        for video in failed_videos:
-            # 最新のプロセスログを取得して失敗したステップを特定
-            last_log = db.session.query(ProcessLog).filter(
-                ProcessLog.video_id == video.id
-            ).order_by(ProcessLog.created_at.desc()).first()
-            
-            if not last_log:
+        # キューに残っているメッセージ数（一括登録などで長い間待機しているタスクを、見積もった待機時間までは停止とみなさないため）
+        queue_length = broker_queue_length(celery, [celery.conf.task_default_queue, DOWNLOAD_QUEUE]) if candidates else 0
+        
+        recovery_count = 0
+        exhausted_count = 0
+        restarts = []
+        for video, video_has_highlights in candidates:
+            task_state = task_states.get(video.current_task_id)
+            if video.status != ProcessStatus.FAILED and not needs_recovery(video, task_state, now, queue_length):
                 continue
             
-            # ステータスに応じて適切なタスクを開始
-            restart_task(video, last_log)
-            recovery_count += 1
-        
-        # 中断したタスクのリカバリ
-        for video in stalled_videos:
-            # 最新のプロセスログを取得
-            last_log = db.session.query(ProcessLog).filter(
-                ProcessLog.video_id == video.id
-            ).order_by(ProcessLog.created_at.desc()).first()
-            
-            if not last_log:
+            # 最大再開回数に達した場合は失敗として確定させる（以降は候補にならない）
+            if video.retry_count >= MAX_RECOVERY_ATTEMPTS:
+                video.status = ProcessStatus.FAILED
+                video.retry_count = MAX_RECOVERY_ATTEMPTS + 1
+                db.session.add(ProcessLog(
+                    video_id=video.id,
+                    status=ProcessStatus.FAILED,
+                    message="最大リカバリー試行回数に達したため、自動リカバリーを停止します。"
+                ))
+                # 再開しないジョブの作業ファイルは不要
+                cleanup_job(video, keep_original=False)
+                exhausted_count += 1
                 continue
             
-            # ステータスに応じて適切なタスクを開始
-            restart_task(video, last_log)
-            recovery_count += 1
+            task = restart_task(video, video_has_highlights)
+            if task is not None:
+                restarts.append((task, video.id, video.current_task_id))
+                recovery_count += 1
+        
+        db.session.commit()
+        
+        # コミットに成功してからタスクを投入する（コミットに失敗して再開回数が記録されないまま、
+        # 次の監視で同じジョブのタスクを重複して投入しないため。投入に失敗したジョブは
+        # 記録したタスクIDが待機中のまま残るため、待機時間の経過後に再開される）
+        for task, video_id, task_id in restarts:
+            task.apply_async((video_id,), task_id=task_id)
         
         return {
             'status': 'success',
+            'candidates': len(candidates),
             'recovered_tasks': recovery_count,
-            'failed_videos': len(failed_videos),
-            'stalled_videos': len(stalled_videos)
+            'exhausted': exhausted_count
         }
         
     except Exception as e:
+        db.session.rollback()
         print(f"タスクモニタリング中にエラーが発生しました: {str(e)}")
         return {'status': 'error', 'message': str(e)}
 
 
-def restart_task(video, last_log):
-    """失敗または中断したタスクを再開する"""
+def restart_task(video, has_highlights=False):
+    """
+    失敗または停止したジョブを、完了済みのチェックポイントの次のステージから再開する
+    
+    失敗時はステータスがFAILEDに上書きされているため、どのステージまで完了しているかは
+    保存済みのデータ（元動画・文字起こし・ハイライト）から判定する。
+    タスクIDは先に生成して記録し、コミットとタスクの投入は呼び出し側で行う。
+    
+    Returns:
+        投入するタスク（video.current_task_id をタスクIDとして投入する。再開できない場合はNone）
+    """
+    from celery.utils import uuid
+    from src.recovery import MAX_RECOVERY_ATTEMPTS
+    
     try:
-        # 既に完了している場合は何もしない
-        if video.status == ProcessStatus.COMPLETED or video.progress >= 100:
-            return False
-            
-        # 進行中のタスクが存在し、有効な場合は何もしない
-        if video.current_task_id:
-            from celery.result import AsyncResult
-            result = AsyncResult(video.current_task_id)
-            if result.state in ['PENDING', 'STARTED', 'RETRY']:
-                # タスクが進行中の場合、リカバリーは不要
-                return False
-        
-        # リカバリー試行回数を確認（同じビデオに対する過去のリカバリーログ）
-        # 過度なリカバリーを防止
-        recovery_logs = db.session.query(ProcessLog).filter(
-            (ProcessLog.video_id == video.id) &
-            (ProcessLog.message.like('%自動リカバリー%'))
-        ).all()
-        
-        # 最大リカバリー回数 (5回) に達した場合は処理しない
-        if len(recovery_logs) >= 5:
-            # 最終ログを追加
-            final_log = ProcessLog(
-                video_id=video.id,
-                status=ProcessStatus.FAILED,
-                message=f"最大リカバリー試行回数に達したため、自動リカバリーを停止します。"
-            )
-            db.session.add(final_log)
-            db.session.commit()
-            return False
-        
-        # リカバリーログを追加
-        recovery_log = ProcessLog(
-            video_id=video.id,
-            status=ProcessStatus.PENDING,
-            message=f"タスクの自動リカバリーを開始します。前回のステータス: {video.status.value}, リカバリー試行: {len(recovery_logs)+1}/5"
-        )
-        db.session.add(recovery_log)
-        
-        # ビデオのステータスをリセット
-        video.status = ProcessStatus.PENDING
+        previous_status = video.status
+        video.retry_count = (video.retry_count or 0) + 1
         video.error_message = None
         
-        # タスクの状態に応じて、適切なポイントからタスクを再開
-        if not video.original_path:
-            # ダウンロードから失敗した場合
-            video.status = ProcessStatus.DOWNLOADING
-            new_task = download_task.delay(video.id)
-            video.current_task_id = new_task.id
-        elif video.status == ProcessStatus.DOWNLOADING:
-            # ダウンロード中に失敗した場合
-            video.status = ProcessStatus.DOWNLOADING
-            new_task = download_task.delay(video.id)
-            video.current_task_id = new_task.id
-        elif video.status == ProcessStatus.TRANSCRIBING:
-            # 文字起こし中に失敗した場合
-            video.status = ProcessStatus.TRANSCRIBING
-            new_task = transcribe_task.delay(video.id)
-            video.current_task_id = new_task.id
-        elif video.status == ProcessStatus.ANALYZING:
-            # 解析中に失敗した場合
-            video.status = ProcessStatus.ANALYZING
-            new_task = analyze_task.delay(video.id)
-            video.current_task_id = new_task.id
-        elif video.status == ProcessStatus.PROCESSING:
-            # ハイライト作成中に失敗した場合
-            video.status = ProcessStatus.PROCESSING
-            new_task = create_highlights_task.delay(video.id)
-            video.current_task_id = new_task.id
+        if video.source_video_id is not None:
+            # キーワードから作成した切り抜きは文字起こし・解析を行わない
+            video.status, task = keyword_clip_stage(video)
+        elif not video.original_path:
+            video.status, task = ProcessStatus.DOWNLOADING, download_task
+        elif video.transcript is None:
+            video.status, task = ProcessStatus.TRANSCRIBING, transcribe_task
+        elif not has_highlights:
+            video.status, task = ProcessStatus.ANALYZING, analyze_task
         else:
-            # その他の状態では最初からやり直し
-            video.status = ProcessStatus.PENDING
-            new_task = process_video_task.delay(video.id)
-            video.current_task_id = new_task.id
+            video.status, task = ProcessStatus.PROCESSING, create_highlights_task
         
-        db.session.commit()
+        # 再開したタスクのハートビートが届くまでは停止とみなさない
+        video.heartbeat_at = datetime.utcnow()
+        video.current_task_id = uuid()
+        
+        db.session.add(ProcessLog(
+            video_id=video.id,
+            status=video.status,
+            message=f"タスクの自動リカバリーを開始します。前回のステータス: {previous_status.value}, "
+                    f"リカバリー試行: {video.retry_count}/{MAX_RECOVERY_ATTEMPTS}",
+            task_id=video.current_task_id
+        ))
         
-        return True
+        return task
     except Exception as e:
         print(f"タスク再開中にエラーが発生しました (video_id={video.id}): {str(e)}")
-        return False
\ No newline at end of file
+        return None
+
+
+# 作業ファイルの定期的な掃除
+@celery.task
+def cleanup_workspace():
+    """古い一時ファイルを削除し、ディスク容量の上限を超えていれば作業ファイルを古い順に削除するタスク"""
+    try:
+        removed_tmp_bytes = cleanup_tmp()
+        usage = enforce_quota()
+        db.session.commit()
+        return {'status': 'success', 'removed_tmp_bytes': removed_tmp_bytes, **usage}
+    except Exception as e:
+        db.session.rollback()
+        print(f"作業ファイルの掃除中にエラーが発生しました: {str(e)}")
+        return {'status': 'error', 'message': str(e)}
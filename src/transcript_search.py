@@ -0,0 +1,219 @@
+"""文字起こしの全文検索
+
+全動画の文字起こしセグメントを検索用のインデックスに登録し、語句と時間範囲で検索する。
+日本語は単語の区切りがないため、どちらのデータベースでも3文字単位のn-gram（トライグラム）で索引を作る。
+
+- SQLite（ローカル）: FTS5の仮想テーブル transcript_fts（tokenize='trigram'）。
+  rowid を video_id * ROWID_STRIDE + セグメントの番号 とし、動画単位の削除・絞り込みを rowid の範囲で行う
+- PostgreSQL（本番）: transcript_search テーブルと pg_trgm のGINインデックス（ILIKEの部分一致に使用される）
+
+トライグラムは3文字未満の語句に使えないが、日本語の単語は2文字（配信、世界、最高）が多い。
+2文字の語句のため、セグメントに含まれる2文字の組（バイグラム）の索引も作る。
+
+- SQLite: FTS5の仮想テーブル transcript_bigram_fts（空白区切りのバイグラムを unicode61 で索引する。rowid は transcript_fts と同じ）
+- PostgreSQL: transcript_search.bigrams（text[]）のGINインデックス（@> で検索する）
+
+1文字の語句（と記号を含む2文字の語句）はどちらの索引も使えないため、ほかの語句や動画で絞り込んだ結果に対して
+部分一致で判定する。絞り込む条件がない場合は全セグメントの走査になるため、SearchTooBroad で拒否する。
+
+検索用のインデックスは文字起こしの保存形式（TRANSCRIPT_STORAGE）とは独立しており、文字起こしの完了時に登録する。
+"""
+import logging
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import text
+from src.models import db
+
+logger = logging.getLogger(__name__)
+
+# SQLiteのrowidの動画ごとの間隔（1本の動画のセグメント数の上限）
+ROWID_STRIDE = 1000000
+
+# n-gramのインデックスで検索できる語句の最小文字数
+MIN_INDEXED_TERM_LENGTH = 3
+
+# バイグラムのインデックスで検索する語句の文字数
+BIGRAM_LENGTH = 2
+
+# 1回の検索で返す件数の上限
+MAX_SEARCH_RESULTS = 200
+
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transcript_fts USING fts5("
+    "text, video_id UNINDEXED, start_time UNINDEXED, end_time UNINDEXED, tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transcript_bigram_fts USING fts5("
+    "bigrams, tokenize='unicode61 remove_diacritics 0')",
+]
+
+
+class SearchTooBroad(ValueError):
+    """インデックスを使える条件がなく、全セグメントの走査になる検索"""
+
+
+def text_bigrams(text: str) -> List[str]:
+    """テキストに含まれる2文字の組（英字は小文字、記号・空白を含むものは除く）"""
+    folded = text.casefold()
+    return list(dict.fromkeys(folded[i:i + BIGRAM_LENGTH] for i in range(len(folded) - 1)
+                              if folded[i:i + BIGRAM_LENGTH].isalnum()))
+
+
+def _is_bigram_term(term: str) -> bool:
+    return len(term) == BIGRAM_LENGTH and term.isalnum()
+
+
+def ensure_search_index():
+    """
+    検索用のインデックスがなければ作成する（SQLiteのみ。db.create_all は仮想テーブルを作成しないため）
+
+    PostgreSQLでは拡張機能の作成に権限が必要なため、マイグレーション（add_transcript_search）で作成する。
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return
+    try:
+        with db.engine.begin() as connection:
+            for statement in _SQLITE_DDL:
+                connection.execute(text(statement))
+    except Exception as e:
+        # FTS5（trigram）に対応していないSQLite（3.34未満）では検索を無効にする
+        logger.warning(f"文字起こしの検索インデックスを作成できませんでした: {str(e)}")
+
+
+def index_video_transcript(video_id: int, segments: Iterable):
+    """
+    動画の文字起こしセグメントを検索用のインデックスに登録する（登録済みのものは置き換える）
+
+    Args:
+        video_id: ビデオID
+        segments: 開始時間順のセグメント（TranscriptSegment または PackedSegment）
+
+    コミットは呼び出し側で行う。
+    """
+    rows = [{'video_id': video_id, 'start_time': segment.start_time, 'end_time': segment.end_time,
+             'text': segment.text, 'bigrams': text_bigrams(segment.text)} for segment in segments]
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("DELETE FROM transcript_search WHERE video_id = :video_id"), {'video_id': video_id})
+        if rows:
+            db.session.execute(text(
+                "INSERT INTO transcript_search (video_id, start_time, end_time, text, bigrams) "
+                "VALUES (:video_id, :start_time, :end_time, :text, :bigrams)"
+            ), rows)
+        return
+
+    if len(rows) >= ROWID_STRIDE:
+        raise ValueError(f"1本の動画のセグメント数が検索インデックスの上限（{ROWID_STRIDE}）を超えています")
+    base = video_id * ROWID_STRIDE
+    for table in ('transcript_fts', 'transcript_bigram_fts'):
+        db.session.execute(text(f"DELETE FROM {table} WHERE rowid >= :low AND rowid < :high"),
+                           {'low': base, 'high': base + ROWID_STRIDE})
+    if rows:
+        for index, row in enumerate(rows):
+            row['rowid'] = base + index
+            row['bigrams'] = ' '.join(row['bigrams'])
+        db.session.execute(text(
+            "INSERT INTO transcript_fts (rowid, text, video_id, start_time, end_time) "
+            "VALUES (:rowid, :text, :video_id, :start_time, :end_time)"
+        ), rows)
+        db.session.execute(text(
+            "INSERT INTO transcript_bigram_fts (rowid, bigrams) VALUES (:rowid, :bigrams)"
+        ), rows)
+
+
+def index_video_transcript_safely(video_id: int, segments: Iterable) -> bool:
+    """
+    検索用のインデックスに登録する（失敗しても文字起こしの処理は続けられるよう、セーブポイント内で実行する）
+
+    Returns:
+        登録できたかどうか
+    """
+    try:
+        with db.session.begin_nested():
+            index_video_transcript(video_id, segments)
+        return True
+    except Exception as e:
+        logger.warning(f"文字起こしを検索インデックスに登録できませんでした (video_id={video_id}): {str(e)}")
+        return False
+
+
+def parse_terms(query: str) -> List[str]:
+    """検索語句を空白（全角を含む）で区切り、重複を除く"""
+    return list(dict.fromkeys(term for term in (query or '').split() if term))
+
+
+def _escape_like(term: str) -> str:
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_segments(terms: List[str], video_ids: Optional[List[int]] = None, start_time: Optional[float] = None,
+                    end_time: Optional[float] = None, limit: int = 50) -> List[Dict]:
+    """
+    すべての語句を含むセグメントを検索する
+
+    Args:
+        terms: 検索語句（AND条件）
+        video_ids: 対象の動画（Noneの場合はすべて）
+        start_time: 時間範囲の開始（秒、セグメントが範囲と重なるものを返す）
+        end_time: 時間範囲の終了（秒）
+        limit: 返す件数の上限
+
+    Returns:
+        'video_id', 'start_time', 'end_time', 'text' を含む辞書のリスト（新しい動画順、動画内は時間順）
+
+    Raises:
+        SearchTooBroad: すべての語句がインデックスを使えず（1文字など）、動画も指定されていない場合
+    """
+    if not terms:
+        return []
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS))
+    params = {'limit': limit}
+    conditions = []
+
+    indexed = [term for term in terms if len(term) >= MIN_INDEXED_TERM_LENGTH]
+    bigram_terms = [term.casefold() for term in terms if _is_bigram_term(term)]
+    if not indexed and not bigram_terms and video_ids is None:
+        raise SearchTooBroad("1文字の語句だけでは検索できません。2文字以上の語句を含めるか、動画を指定してください")
+
+    if db.engine.dialect.name == 'postgresql':
+        table = 'transcript_search'
+        for index, term in enumerate(terms):
+            conditions.append(f"text ILIKE :term{index} ESCAPE '\\'")
+            params[f'term{index}'] = f'%{_escape_like(term)}%'
+        if bigram_terms:
+            # pg_trgmのインデックスは3文字未満の語句に使えないため、バイグラムのGINインデックスで絞り込む
+            conditions.append("bigrams @> :bigrams")
+            params['bigrams'] = bigram_terms
+        if video_ids is not None:
+            conditions.append("video_id = ANY(:video_ids)")
+            params['video_ids'] = list(video_ids)
+    else:
+        table = 'transcript_fts'
+        if indexed:
+            conditions.append("transcript_fts MATCH :match")
+            params['match'] = ' AND '.join('"' + term.replace('"', '""') + '"' for term in indexed)
+        if bigram_terms:
+            conditions.append("rowid IN (SELECT rowid FROM transcript_bigram_fts WHERE transcript_bigram_fts MATCH :bigrams)")
+            params['bigrams'] = ' AND '.join(f'"{term}"' for term in bigram_terms)
+        unindexed = [term for term in terms if len(term) < MIN_INDEXED_TERM_LENGTH and not _is_bigram_term(term)]
+        for index, term in enumerate(unindexed):
+            # どちらのインデックスも使えない語句（1文字など）は、ほかの条件で絞り込んだ結果に対して instr で判定する
+            conditions.append(f"instr(text, :short{index}) > 0")
+            params[f'short{index}'] = term
+        if video_ids is not None:
+            ranges = []
+            for index, video_id in enumerate(video_ids):
+                ranges.append(f"(rowid >= :low{index} AND rowid < :high{index})")
+                params[f'low{index}'] = video_id * ROWID_STRIDE
+                params[f'high{index}'] = (video_id + 1) * ROWID_STRIDE
+            conditions.append('(' + (' OR '.join(ranges) or '0') + ')')
+
+    if start_time is not None:
+        conditions.append("end_time > :start_time")
+        params['start_time'] = start_time
+    if end_time is not None:
+        conditions.append("start_time < :end_time")
+        params['end_time'] = end_time
+
+    rows = db.session.execute(text(
+        f"SELECT video_id, start_time, end_time, text FROM {table} "
+        f"WHERE {' AND '.join(conditions)} ORDER BY video_id DESC, start_time LIMIT :limit"
+    ), params).all()
+    return [{'video_id': int(row.video_id), 'start_time': float(row.start_time), 'end_time': float(row.end_time),
+             'text': row.text} for row in rows]
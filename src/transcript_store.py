@@ -0,0 +1,176 @@
+"""文字起こしセグメントのコンパクトな保存形式
+
+Whisperのセグメントを1件ずつ TranscriptSegment の行として保存すると、数時間の動画では
+1本あたり数万行になり、/detail はそのすべてをORMのオブジェクトとして読み込んでいた。
+TRANSCRIPT_STORAGE=packed の場合、文字起こしの完了時にセグメントを動画ごとに1行（TranscriptPack）へまとめる。
+
+- 開始時間・終了時間: float32の配列
+- テキスト: 全セグメントを連結したUTF-8のバイト列と、各セグメントの開始位置（uint32の配列）
+
+時間範囲で取り出す場合は開始時間の配列を二分探索し、範囲内のセグメントのテキストだけをデコードする。
+連結したテキストは全文と一致するため、Video.transcript には全文を重複して保存しない（空文字列にする）。
+文字起こしの途中（チェックポイント）は従来どおり TranscriptSegment の行に保存し、完了後にまとめる。
+"""
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from typing import Iterable, List, Optional
+from src.models import db, TranscriptPack, TranscriptSegment
+
+# 文字起こしの保存形式（'rows': セグメントごとの行、'packed': 動画ごとにまとめた配列）
+TRANSCRIPT_STORAGE = os.getenv('TRANSCRIPT_STORAGE', 'rows')
+
+# /detail で1ページに表示する文字起こしの長さ（秒）
+TRANSCRIPT_PAGE_SECONDS = float(os.getenv('TRANSCRIPT_PAGE_SECONDS', '600'))
+
+# TranscriptSegment と同じ属性で参照できるセグメント
+PackedSegment = namedtuple('PackedSegment', ['start_time', 'end_time', 'text'])
+
+
+def is_packed_storage() -> bool:
+    """文字起こしの完了時にセグメントをまとめて保存するかどうか"""
+    return TRANSCRIPT_STORAGE == 'packed'
+
+
+class PackedTranscript:
+    """TranscriptPack の配列を読み込み、時間範囲でセグメントを取り出す"""
+
+    def __init__(self, pack: TranscriptPack):
+        self.starts = array('f')
+        self.starts.frombytes(pack.start_times)
+        self.ends = array('f')
+        self.ends.frombytes(pack.end_times)
+        self.offsets = array('I')
+        self.offsets.frombytes(pack.text_offsets)
+        self.text_blob = pack.text_blob
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def _segment(self, index: int) -> PackedSegment:
+        text = self.text_blob[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+        return PackedSegment(float(self.starts[index]), float(self.ends[index]), text)
+
+    def slice(self, start_time: Optional[float] = None, end_time: Optional[float] = None) -> List[PackedSegment]:
+        """
+        時間範囲 [start_time, end_time) と重なるセグメントを取り出す
+
+        Args:
+            start_time: 範囲の開始（秒、Noneの場合は先頭から）
+            end_time: 範囲の終了（秒、Noneの場合は末尾まで）
+        """
+        first = 0
+        if start_time is not None:
+            # 開始位置の直前のセグメントは範囲と重なっている可能性がある
+            first = max(0, bisect_right(self.starts, start_time) - 1)
+            while first < len(self) and self.ends[first] <= start_time:
+                first += 1
+        last = len(self) if end_time is None else bisect_left(self.starts, end_time)
+        return [self._segment(index) for index in range(first, last)]
+
+    def __iter__(self):
+        return (self._segment(index) for index in range(len(self)))
+
+    def full_text(self) -> str:
+        """全セグメントを連結したテキスト（文字起こしの全文）"""
+        return self.text_blob.decode('utf-8')
+
+
+def pack_segments(video_id: int, segments: Iterable) -> TranscriptPack:
+    """
+    セグメント（開始時間順）を1行にまとめた TranscriptPack を作成する
+
+    Args:
+        video_id: ビデオID
+        segments: TranscriptSegment または start_time, end_time, text を持つオブジェクト
+    """
+    starts, ends, offsets = array('f'), array('f'), array('I', [0])
+    chunks = []
+    position = 0
+    for segment in segments:
+        encoded = segment.text.encode('utf-8')
+        starts.append(segment.start_time)
+        ends.append(segment.end_time)
+        chunks.append(encoded)
+        position += len(encoded)
+        offsets.append(position)
+
+    return TranscriptPack(
+        video_id=video_id,
+        segment_count=len(starts),
+        start_times=starts.tobytes(),
+        end_times=ends.tobytes(),
+        text_offsets=offsets.tobytes(),
+        text_blob=b''.join(chunks),
+    )
+
+
+def pack_video_transcript(video, segments: Optional[List] = None) -> TranscriptPack:
+    """
+    保存済みの TranscriptSegment の行を TranscriptPack にまとめ、行と Video.transcript の全文を削除する
+
+    Args:
+        video: Video
+        segments: 読み込み済みのセグメントの行（開始時間順、省略時はDBから取得）
+
+    コミットは呼び出し側で行う。
+    """
+    if segments is None:
+        segments = TranscriptSegment.query.filter_by(video_id=video.id).order_by(TranscriptSegment.start_time).all()
+    TranscriptPack.query.filter_by(video_id=video.id).delete(synchronize_session=False)
+    pack = pack_segments(video.id, segments)
+    db.session.add(pack)
+    TranscriptSegment.query.filter_by(video_id=video.id).delete(synchronize_session=False)
+    # 全文はまとめたテキストから復元できるため、完了を示す空文字列だけを残す
+    video.transcript = ''
+    return pack
+
+
+def load_packed(video) -> Optional[PackedTranscript]:
+    """動画の TranscriptPack を読み込む（まとめていない場合はNone）"""
+    pack = TranscriptPack.query.filter_by(video_id=video.id).first()
+    return PackedTranscript(pack) if pack is not None else None
+
+
+def load_segments(video, start_time: Optional[float] = None, end_time: Optional[float] = None) -> List:
+    """
+    動画の文字起こしセグメントを開始時間順に取得する（保存形式によらない）
+
+    Args:
+        video: Video
+        start_time: 範囲の開始（秒、Noneの場合は先頭から）
+        end_time: 範囲の終了（秒、Noneの場合は末尾まで）
+
+    Returns:
+        TranscriptSegment または PackedSegment のリスト
+    """
+    packed = load_packed(video)
+    if packed is not None:
+        return packed.slice(start_time, end_time)
+
+    query = TranscriptSegment.query.filter(TranscriptSegment.video_id == video.id)
+    if start_time is not None:
+        query = query.filter(TranscriptSegment.end_time > start_time)
+    if end_time is not None:
+        query = query.filter(TranscriptSegment.start_time < end_time)
+    return query.order_by(TranscriptSegment.start_time).all()
+
+
+def segment_count(video) -> int:
+    """動画の文字起こしセグメントの数"""
+    pack = TranscriptPack.query.with_entities(TranscriptPack.segment_count).filter_by(video_id=video.id).first()
+    if pack is not None:
+        return pack.segment_count
+    return TranscriptSegment.query.filter_by(video_id=video.id).count()
+
+
+def transcript_text(video) -> Optional[str]:
+    """文字起こしの全文（まとめて保存している場合は TranscriptPack から復元する）"""
+    if video.transcript:
+        return video.transcript
+    if video.transcript is not None:
+        packed = load_packed(video)
+        if packed is not None:
+            return packed.full_text()
+    return video.transcript
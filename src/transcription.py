@@ -1,26 +1,61 @@
 import os
-import whisper
-import torch
-from typing import Dict, List, Tuple
+import subprocess
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import tempfile
-from moviepy.editor import VideoFileClip
 
 # 音声認識モデルのサイズ（'tiny', 'base', 'small', 'medium', 'large'）
-WHISPER_MODEL_SIZE = "small"
+WHISPER_MODEL_SIZE = os.getenv('WHISPER_MODEL_SIZE', 'small')
 
-def extract_audio(video_path: str) -> str:
+# Whisperの入力のサンプリングレート（Hz）
+WHISPER_SAMPLE_RATE = 16000
+
+# 文字起こしのチェックポイントの間隔（秒）。この長さごとに結果を保存し、再試行時は続きから再開する
+TRANSCRIBE_CHUNK_SECONDS = float(os.getenv('TRANSCRIBE_CHUNK_SECONDS', '300'))
+
+# 次のチャンクに文脈として渡す直前の文字起こしの最大文字数
+PROMPT_MAX_CHARS = 200
+
+# 読み込み済みのWhisperモデル（プロセス内で再利用する）
+_whisper_models = {}
+
+def load_whisper_model(model_size: Optional[str] = None):
+    """
+    Whisperモデルを読み込む（読み込み済みの場合はキャッシュを返す）
+
+    ワーカーの起動時に事前読み込みしておくことで、最初のジョブでの読み込み待ちをなくす。
+
+    Args:
+        model_size: モデルのサイズ（省略時はWHISPER_MODEL_SIZE）
+
+    Returns:
+        Whisperモデル
+    """
+    # whisper/torchは読み込みに時間がかかるため、必要になった時点で読み込む
+    import torch
+    import whisper
+    
+    model_size = model_size or WHISPER_MODEL_SIZE
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    
+    key = (model_size, device)
+    if key not in _whisper_models:
+        _whisper_models[key] = whisper.load_model(model_size, device=device)
+    return _whisper_models[key]
+
+def extract_audio(video_path: str, start_time: float = 0.0, temp_dir: Optional[str] = None) -> str:
     """
     動画ファイルから音声を抽出する
 
     Args:
         video_path: 動画ファイルのパス
+        start_time: 抽出を開始する時刻（秒）。文字起こしを途中から再開する場合に指定
+        temp_dir: 音声ファイルを作成するディレクトリ（ジョブの作業ディレクトリ。未指定の場合はシステムの一時ディレクトリ）
 
     Returns:
         抽出した音声ファイルの一時パス
     """
     # FFmpegの存在チェック
     try:
-        import subprocess
         result = subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         if result.returncode != 0:
             raise Exception("FFmpegの実行時にエラーが発生しました。FFmpegが正しくインストールされているか確認してください。")
@@ -28,27 +63,28 @@ def extract_audio(video_path: str) -> str:
         raise Exception("FFmpegがインストールされていないか、パスが通っていません。インストール方法はREADMEを参照してください。")
     
     # 一時ファイルを作成
-    temp_audio = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
+    temp_audio = tempfile.NamedTemporaryFile(suffix=".wav", delete=False, dir=temp_dir)
     temp_audio_path = temp_audio.name
     temp_audio.close()
     
     try:
-        # 動画を読み込み
-        video = VideoFileClip(video_path)
+        # 映像はデコードせず、音声トラックだけをWhisperの入力形式（16kHzモノラル）で書き出す
+        seek = ['-ss', f'{start_time:.3f}'] if start_time > 0 else []
+        result = subprocess.run([
+            'ffmpeg', '-nostdin', '-v', 'error', '-y',
+            *seek,
+            '-i', video_path,
+            '-vn', '-ac', '1', '-ar', '16000',
+            '-c:a', 'pcm_s16le',  # wav形式
+            temp_audio_path
+        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         
-        # 音声トラックが存在することを確認
-        if video.audio is None:
-            raise Exception("動画に音声トラックが含まれていません。")
-        
-        # 音声を抽出して保存
-        video.audio.write_audiofile(temp_audio_path, 
-                                   codec='pcm_s16le',  # wav形式
-                                   ffmpeg_params=['-ac', '1'],  # モノラル
-                                   verbose=False,
-                                   logger=None)
-        
-        # リソースを解放
-        video.close()
+        if result.returncode != 0:
+            stderr = result.stderr.decode('utf-8', errors='ignore').strip()
+            # 音声トラックが存在することを確認
+            if 'does not contain any stream' in stderr or 'matches no streams' in stderr:
+                raise Exception("動画に音声トラックが含まれていません。")
+            raise Exception(stderr)
         
         return temp_audio_path
     
@@ -69,11 +105,10 @@ def transcribe_audio(audio_path: str) -> Dict:
         文字起こし結果の辞書（Whisper APIの出力形式）
     """
     try:
-        # GPUが利用可能か確認
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+        import torch
         
-        # Whisperモデルのロード
-        model = whisper.load_model(WHISPER_MODEL_SIZE, device=device)
+        # Whisperモデルのロード（ワーカー起動時に読み込み済みであれば再利用）
+        model = load_whisper_model()
         
         # 文字起こしを実行
         result = model.transcribe(
@@ -93,6 +128,82 @@ def transcribe_audio(audio_path: str) -> Dict:
         if os.path.exists(audio_path):
             os.remove(audio_path)
 
+def transcribe_audio_chunks(audio_path: str, offset: float = 0.0, chunk_seconds: Optional[float] = None,
+                            initial_prompt: Optional[str] = None,
+                            progress_callback: Optional[Callable[[float], None]] = None) -> Iterator[Tuple[float, List[Dict]]]:
+    """
+    音声ファイルを一定の長さのチャンクに分けて順に文字起こしする
+
+    チャンクごとに結果を返すため、呼び出し側で結果を保存しておけば、処理が中断しても
+    保存済みの位置から再開できる。直前のチャンクの文字起こしを次のチャンクの
+    initial_promptとして渡し、チャンクの境界で文脈が途切れないようにする。
+
+    Args:
+        audio_path: extract_audioで抽出した音声ファイル（16kHzモノラルのwav）のパス
+        offset: 音声ファイルの先頭に対応する元動画の時刻（秒）
+        chunk_seconds: チャンクの長さ（秒、省略時はTRANSCRIBE_CHUNK_SECONDS）
+        initial_prompt: 最初のチャンクに渡す文脈（再開時は保存済みの文字起こしの末尾）
+        progress_callback: 元動画全体に対する進捗（0〜1）を受け取る関数（チャンク内のデコード位置も反映）
+
+    Yields:
+        (このチャンクの終了時刻（元動画の時刻）, 元動画の時刻に変換したセグメントのリスト)
+    """
+    try:
+        import wave
+        from contextlib import nullcontext
+        import numpy as np
+        import torch
+        from src.progress import whisper_progress
+        
+        model = load_whisper_model()
+        frames_per_chunk = int((chunk_seconds or TRANSCRIBE_CHUNK_SECONDS) * WHISPER_SAMPLE_RATE)
+        
+        with wave.open(audio_path, 'rb') as wav:
+            total_frames = wav.getnframes()
+            total_seconds = offset + total_frames / WHISPER_SAMPLE_RATE
+            position = 0
+            while position < total_frames:
+                data = wav.readframes(frames_per_chunk)
+                if not data:
+                    break
+                audio = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+                chunk_start = offset + position / WHISPER_SAMPLE_RATE
+                chunk_length = len(audio) / WHISPER_SAMPLE_RATE
+                
+                # チャンク内のデコード位置を元動画全体に対する進捗に換算して通知
+                if progress_callback and total_seconds > 0:
+                    progress = whisper_progress(lambda fraction: progress_callback(
+                        (chunk_start + fraction * chunk_length) / total_seconds))
+                else:
+                    progress = nullcontext()
+                
+                with progress:
+                    result = model.transcribe(
+                        audio,
+                        language="ja",
+                        fp16=torch.cuda.is_available(),
+                        verbose=False,
+                        initial_prompt=initial_prompt
+                    )
+                _, segments = process_transcript(result)
+                for segment in segments:
+                    segment["start_time"] += chunk_start
+                    segment["end_time"] += chunk_start
+                
+                position += len(audio)
+                if segments:
+                    initial_prompt = "".join(segment["text"] for segment in segments)[-PROMPT_MAX_CHARS:]
+                
+                yield offset + position / WHISPER_SAMPLE_RATE, segments
+    
+    except Exception as e:
+        raise Exception(f"文字起こし中にエラーが発生しました: {str(e)}")
+    
+    finally:
+        # 一時ファイルを削除
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+
 def process_transcript(transcript_result: Dict) -> Tuple[str, List[Dict]]:
     """
     Whisperの出力結果を処理し、テキストとセグメント情報を抽出する
@@ -1,81 +1,68 @@
 import os
-import torch
-from transformers import AutoProcessor, AutoModel
-from moviepy.editor import VideoFileClip, concatenate_videoclips
-import numpy as np
-from typing import List, Tuple
+import shutil
+import subprocess
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from src.highlight_scorer import make_windows, compute_window_scores
+from src.highlight_selection import POLICY_DURATION, load_selection_policy, select_highlights
+from src.scene_index import snap_highlights, snap_windows
+from src.media_proxy import probe_duration
 
-def get_video_highlights(video_path: str, segment_length: int = 5, overlap: int = 2) -> List[Tuple[float, float]]:
+def get_video_highlights(video_path: str, segment_length: int = 5, overlap: int = 2,
+                         transcript_segments: Optional[Iterable] = None,
+                         keywords: Optional[Sequence[str]] = None,
+                         boundary_index: Optional[Dict] = None,
+                         policy: Optional[str] = None,
+                         policy_value: Optional[float] = None,
+                         progress_callback: Optional[Callable[[float], None]] = None) -> List[Tuple[float, float, float]]:
     """
     動画を解析し、重要なハイライト部分のタイムスタンプを返す
     
     Args:
-        video_path: 動画ファイルのパス
+        video_path: 動画ファイルのパス（解析用プロキシを指定可能）
         segment_length: 分析する動画セグメントの長さ（秒）
         overlap: 連続するセグメント間のオーバーラップ（秒）
+        transcript_segments: 文字起こしセグメント（発話密度とキーワードの計算に使用）
+        keywords: 盛り上がりを示すキーワード
+        boundary_index: シーン境界・文の区切りのインデックス（指定時は境界にスナップ）
+        policy: 選択ポリシー（'percentage', 'duration', 'threshold'。省略時は環境変数から取得）
+        policy_value: ポリシーの値（割合%、目標秒数、スコア閾値）
+        progress_callback: 解析の進捗（0〜1）を受け取る関数
         
     Returns:
-        ハイライト部分の開始時間と終了時間のリスト [(start_time, end_time), ...]
+        ハイライト部分の開始時間・終了時間・重要度スコアのリスト [(start_time, end_time, score), ...]
     """
     try:
-        # 動画の読み込み
-        video = VideoFileClip(video_path)
-        video_duration = video.duration
-        
-        # 簡易実装として、セグメントの重要度をランダムに計算
-        # 実際の実装では、ここでビデオフレームを抽出し、AIモデルでコンテンツを分析します
-        
-        # 本番実装では以下のようなコードを使用します（現在はコメントアウト）
-        """
-        # モデルのロード
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        processor = AutoProcessor.from_pretrained("facebook/xclip-base-patch32")
-        model = AutoModel.from_pretrained("facebook/xclip-base-patch32").to(device)
-        
-        # 重要度スコアの計算
-        segments = []
-        current_time = 0
-        
-        while current_time < video_duration:
-            end_time = min(current_time + segment_length, video_duration)
-            segment = video.subclip(current_time, end_time)
-            
-            # フレームの抽出とモデルへの入力
-            frames = [segment.get_frame(t) for t in np.linspace(current_time, end_time, 8)]
-            inputs = processor(images=frames, return_tensors="pt").to(device)
-            
-            with torch.no_grad():
-                outputs = model(**inputs)
-                
-            # 重要度スコアの計算（この実装は単純化されています）
-            importance_score = outputs.last_hidden_state.mean().item()
-            segments.append((current_time, end_time, importance_score))
-            
-            current_time += segment_length - overlap
-            
-        # 重要度スコアでソート
-        segments.sort(key=lambda x: x[2], reverse=True)
-        
-        # 上位30%のセグメントを選択
-        highlights = [(start, end) for start, end, _ in segments[:int(len(segments) * 0.3)]]
-        """
-        
-        # デモ用の簡易実装：ランダムにハイライトを選択
-        segments = []
-        current_time = 0
-        
-        while current_time < video_duration:
-            end_time = min(current_time + segment_length, video_duration)
-            importance_score = np.random.random()  # ランダムな重要度スコア
-            segments.append((current_time, end_time, importance_score))
-            current_time += segment_length - overlap
-        
-        # 重要度スコアでソート
-        segments.sort(key=lambda x: x[2], reverse=True)
-        
-        # 上位30%のセグメントを選択
-        top_segment_count = max(1, int(len(segments) * 0.3))
-        highlights = [(start, end) for start, end, _ in segments[:top_segment_count]]
+        # 動画の長さを取得（ヘッダーのみ読み込み、フレームはデコードしない）
+        video_duration = probe_duration(video_path)
+        if not video_duration:
+            raise Exception("動画の長さを取得できませんでした")
+        
+        # ウィンドウの生成と音声・文字起こし特徴量によるスコア計算
+        starts, ends = make_windows(video_duration, segment_length, overlap)
+        scores = compute_window_scores(video_path, starts, ends,
+                                       transcript_segments=transcript_segments,
+                                       keywords=keywords,
+                                       progress_callback=progress_callback)
+        
+        if policy is None:
+            policy, default_value = load_selection_policy()
+            policy_value = default_value if policy_value is None else policy_value
+        
+        # durationポリシーは合計時間の上限とクリップ同士の最小間隔を守るため、スナップ後の範囲で選択する
+        # （選択後にスナップすると、1クリップあたり最大で両端の移動分だけ長くなり、隣のクリップに近づく）
+        snap_before_selection = policy == POLICY_DURATION and bool(boundary_index)
+        if snap_before_selection:
+            starts, ends = snap_windows(starts, ends, boundary_index)
+        
+        # 選択ポリシーに従ってハイライトを選択（配列のまま上位k件を抽出）
+        selected_starts, selected_ends, selected_scores = select_highlights(
+            starts, ends, scores, policy=policy, value=policy_value
+        )
+        highlights = list(zip(selected_starts.tolist(), selected_ends.tolist(), selected_scores.tolist()))
+        
+        # 切り出し位置をシーン境界・文の区切りにスナップ
+        if not snap_before_selection:
+            highlights = snap_highlights(highlights, boundary_index)
         
         # 時間順にソート
         highlights.sort(key=lambda x: x[0])
@@ -85,43 +72,122 @@ def get_video_highlights(video_path: str, segment_length: int = 5, overlap: int
     except Exception as e:
         raise Exception(f"動画の解析中にエラーが発生しました: {str(e)}")
 
-def process_video(video_path: str, highlights: List[Tuple[float, float]], output_dir: str, session_id: str) -> str:
+def _clip_filename(index: int, start_time: float, end_time: float) -> str:
+    """クリップのファイル名（切り出し範囲が変わった場合は別のファイルになる）"""
+    return f"clip_{index:03d}_{int(round(start_time * 1000))}_{int(round(end_time * 1000))}.mp4"
+
+def _concat_clips(clip_paths: List[str], output_path: str):
+    """FFmpegのconcatデマルチプレクサでクリップを再エンコードせずに結合する"""
+    list_path = output_path + '.txt'
+    with open(list_path, 'w') as f:
+        for clip_path in clip_paths:
+            escaped = os.path.abspath(clip_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    
+    try:
+        result = subprocess.run([
+            'ffmpeg', '-nostdin', '-v', 'error', '-y',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-c', 'copy', '-movflags', '+faststart',
+            output_path
+        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise Exception("FFmpegがインストールされていないか、パスが通っていません。インストール方法はREADMEを参照してください。")
+    finally:
+        os.remove(list_path)
+    
+    if result.returncode != 0:
+        raise Exception(f"クリップの結合中にエラーが発生しました: {result.stderr.decode('utf-8', errors='ignore').strip()}")
+
+def process_video(video_path: str, highlights: List[Tuple[float, float]], output_dir: str, session_id: str,
+                  progress_callback: Optional[Callable[[float], None]] = None,
+                  clip_sources: Optional[List[str]] = None) -> str:
     """
     ハイライト部分を結合して新しい動画を作成する
     
+    クリップは1つずつ書き出して作業ディレクトリに保存し、最後に再エンコードせずに結合する。
+    処理が中断して再試行された場合は、書き出し済みのクリップを再利用して残りだけを書き出す。
+    
     Args:
         video_path: 元の動画ファイルのパス
         highlights: ハイライト部分の開始時間と終了時間のリスト
         output_dir: 出力先ディレクトリ
         session_id: セッションID
+        progress_callback: 書き出しの進捗（0〜1、書き出したフレーム数から計算）を受け取る関数
+        clip_sources: ハイライトごとに切り出し済みの動画（2段階ダウンロードで取得した区間）。
+            指定した場合は video_path の代わりに各ファイル全体を使用する
         
     Returns:
         生成された動画ファイルのパス
     """
     try:
-        # 動画の読み込み
-        video = VideoFileClip(video_path)
-        
-        # ハイライト部分を切り出してクリップのリストを作成
-        highlight_clips = [video.subclip(start, end) for start, end in highlights]
-        
-        # クリップを結合
-        final_clip = concatenate_videoclips(highlight_clips)
+        # moviepyは読み込みに時間がかかるため、動画の書き出し時にのみ読み込む
+        from moviepy.editor import VideoFileClip
+        
+        if not highlights:
+            raise ValueError("ハイライトがありません")
+        
+        # 書き出したクリップの保存先（完了するまで残しておく）
+        clips_dir = os.path.join(output_dir, f"{session_id}_clips")
+        os.makedirs(clips_dir, exist_ok=True)
+        
+        # 進捗はクリップの長さで重み付けする（書き出し済みのクリップは完了として数える）
+        total_length = sum(end - start for start, end in highlights) or 1.0
+        done_length = 0.0
+        
+        clip_paths = []
+        video = None
+        try:
+            for index, (start, end) in enumerate(highlights):
+                clip_path = os.path.join(clips_dir, _clip_filename(index, start, end))
+                clip_paths.append(clip_path)
+                if os.path.exists(clip_path):
+                    done_length += end - start
+                    continue
+                
+                if clip_sources is not None:
+                    # 切り出し済みの区間はファイル全体を使用する
+                    source = VideoFileClip(clip_sources[index])
+                    clip = source
+                else:
+                    # 動画の読み込み（すべて書き出し済みの場合は読み込まない）
+                    if video is None:
+                        video = VideoFileClip(video_path)
+                    # サブクリップは元動画のリーダーを共有するため、個別にはcloseしない
+                    source = None
+                    clip = video.subclip(start, end)
+                
+                # 書き込み途中のファイルを再利用しないよう、一時ファイルに書き出してから置き換える
+                temp_path = clip_path + '.tmp.mp4'
+                progress_logger = None
+                if progress_callback:
+                    from src.progress import moviepy_progress_logger
+                    progress_logger = moviepy_progress_logger(
+                        lambda fraction, done=done_length, length=end - start:
+                            progress_callback((done + fraction * length) / total_length))
+                try:
+                    clip.write_videofile(temp_path, codec='libx264', audio_codec='aac', logger=progress_logger)
+                finally:
+                    if source is not None:
+                        source.close()
+                os.replace(temp_path, clip_path)
+                done_length += end - start
+        finally:
+            # リソースの解放
+            if video is not None:
+                video.close()
         
         # 出力ファイル名を生成
         output_filename = f"{session_id}.mp4"
         output_path = os.path.join(output_dir, output_filename)
         
-        # 動画を書き出し
-        final_clip.write_videofile(output_path, codec='libx264', audio_codec='aac')
+        # クリップを結合
+        _concat_clips(clip_paths, output_path)
         
-        # リソースの解放
-        video.close()
-        for clip in highlight_clips:
-            clip.close()
-        final_clip.close()
+        # 結合が完了したら作業ディレクトリを削除
+        shutil.rmtree(clips_dir, ignore_errors=True)
         
         return output_path
         
     except Exception as e:
-        raise Exception(f"動画の処理中にエラーが発生しました: {str(e)}")
\ No newline at end of file
+        raise Exception(f"動画の処理中にエラーが発生しました: {str(e)}")
@@ -0,0 +1,159 @@
+"""Celeryワーカーの起動時処理（モデルの事前読み込みとウォームアップ）
+
+プリフォークの子プロセスは最初のジョブが来るまで何も読み込まず、
+worker_max_tasks_per_childで再起動されるたびに読み込みをやり直していた。
+このモジュールはワーカーのシグナルに処理を登録し、子プロセスの起動時に
+Whisperモデルと解析用ライブラリを読み込んでウォームアップしてから準備完了を通知する。
+
+WORKER_PRELOAD_IN_PARENT を有効にすると、フォーク前の親プロセスで読み込み、
+コピーオンライトで子プロセス間のメモリを共有する（CPU推論時のみ。CUDAはフォーク後に使えない）。
+
+celery_worker.py からインポートされたときだけシグナルが登録されるため、
+Webプロセスには影響しない。
+"""
+import gc
+import logging
+import os
+import time
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_ready, worker_shutdown
+from src.tasks import celery
+from src.instrumentation import mark_process_dead, metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('true', '1', 't')
+
+
+# 起動時にモデルを読み込むかどうか
+PRELOAD_MODELS = _env_flag('WORKER_PRELOAD_MODELS', 'True')
+
+# フォーク前の親プロセスで読み込むかどうか
+PRELOAD_IN_PARENT = _env_flag('WORKER_PRELOAD_IN_PARENT', 'False')
+
+# ウォームアップ完了を示すファイル（コンテナのヘルスチェック用）
+READY_FILE = os.getenv('WORKER_READY_FILE', '/tmp/ai-kirinuki-worker.ready')
+
+# ワーカーのメトリクスを公開するポート（未設定の場合は公開しない）
+METRICS_PORT = os.getenv('WORKER_METRICS_PORT')
+
+# 子プロセスの起動を待つ時間（秒）。既定の4秒ではモデルの読み込みが間に合わない
+WARMUP_TIMEOUT = float(os.getenv('WORKER_WARMUP_TIMEOUT', '300'))
+
+celery.conf.worker_proc_alive_timeout = WARMUP_TIMEOUT
+
+# このプロセスで読み込みが完了しているかどうか
+_preloaded = False
+
+
+def preload_worker_resources() -> dict:
+    """
+    ワーカーで使用するライブラリとモデルを読み込み、ウォームアップする
+
+    Returns:
+        各処理にかかった時間（秒）
+    """
+    global _preloaded
+    timings = {}
+    if _preloaded:
+        return timings
+
+    # 動画処理・解析用のライブラリ
+    started = time.perf_counter()
+    import numpy as np
+    import moviepy.editor  # noqa: F401
+    from src.highlight_scorer import score_windows
+    from src.highlight_selection import select_highlights
+    timings['libraries'] = time.perf_counter() - started
+
+    # 解析処理のウォームアップ（小さな入力で一度実行しておく）
+    started = time.perf_counter()
+    starts = np.arange(0.0, 60.0, 3.0)
+    ends = starts + 5.0
+    scores = score_windows({'rms': np.random.random(len(starts)), 'flux': np.random.random(len(starts))})
+    select_highlights(starts, ends, scores, policy='percentage', value=30)
+    timings['analysis_warmup'] = time.perf_counter() - started
+
+    # Whisperモデル
+    started = time.perf_counter()
+    from src.transcription import load_whisper_model
+    load_whisper_model()
+    timings['whisper_model'] = time.perf_counter() - started
+
+    _preloaded = True
+    return timings
+
+
+def mark_ready():
+    """ウォームアップ完了を通知する"""
+    with open(READY_FILE, 'w') as f:
+        f.write(str(os.getpid()))
+
+
+def clear_ready():
+    """準備完了の通知を取り消す"""
+    if os.path.exists(READY_FILE):
+        os.remove(READY_FILE)
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """ワーカーのメトリクスをHTTPで公開する（子プロセス分はマルチプロセスモードで集計）"""
+    if not METRICS_PORT:
+        return
+    from prometheus_client import start_http_server
+    start_http_server(int(METRICS_PORT), registry=metrics_registry())
+    logger.info(f"ワーカーのメトリクスをポート {METRICS_PORT} で公開しました")
+
+
+@worker_init.connect
+def preload_in_parent(**kwargs):
+    """フォーク前の親プロセスでの読み込み（WORKER_PRELOAD_IN_PARENT有効時）"""
+    clear_ready()
+    if not (PRELOAD_MODELS and PRELOAD_IN_PARENT):
+        return
+
+    timings = preload_worker_resources()
+    # 以降のGCで読み込み済みオブジェクトに触れてページがコピーされないよう、GC対象から外す
+    gc.collect()
+    gc.freeze()
+    logger.info(f"親プロセスでモデルを読み込みました: {timings}")
+
+
+@worker_process_init.connect
+def warm_up_child(**kwargs):
+    """子プロセスの起動時のウォームアップ"""
+    if not PRELOAD_MODELS:
+        mark_ready()
+        return
+
+    try:
+        # 親プロセスで読み込み済みの場合は何もしない
+        timings = preload_worker_resources()
+        logger.info(f"ワーカープロセス(pid={os.getpid()})のウォームアップが完了しました: {timings}")
+        mark_ready()
+    except Exception as e:
+        # 読み込みに失敗しても、最初のジョブで改めて読み込まれるため起動は継続する
+        logger.error(f"ワーカープロセスのウォームアップ中にエラーが発生しました: {str(e)}")
+
+
+@worker_ready.connect
+def report_ready(**kwargs):
+    """親プロセスの起動完了（子プロセスのウォームアップ完了は READY_FILE で通知される）"""
+    if not PRELOAD_MODELS:
+        # スレッドプール（ダウンロード用のワーカー）では子プロセスが起動しないため、ここで通知する
+        mark_ready()
+        logger.info("ワーカーが起動しました")
+        return
+    logger.info(f"ワーカーが起動しました。子プロセスのウォームアップ完了後に {READY_FILE} が作成されます")
+
+
+@worker_process_shutdown.connect
+def on_process_shutdown(pid=None, **kwargs):
+    mark_process_dead(pid or os.getpid())
+
+
+@worker_shutdown.connect
+def on_shutdown(**kwargs):
+    clear_ready()
@@ -0,0 +1,360 @@
+"""作業ファイルの管理とディスク容量の上限
+
+uploads/ の元動画・プロキシ・特徴量のキャッシュ、outputs/ の書き出し途中のクリップ、
+/tmp/ai-kirinuki の一時ファイルはどこからも削除されず、ディスクを使い切ってワーカーが停止する原因になっていた。
+このモジュールはジョブ（セッションID）ごとの作業ファイルを次のように管理する。
+
+- タスクごとの一時ファイル（抽出した音声など）はジョブ専用の作業ディレクトリに作成し、タスクの終了時に削除する
+- 切り抜き動画の完成時は、元動画と中間ファイルを削除する（WORKSPACE_KEEP_ORIGINALS で元動画は残せる）
+- 各ステージの開始時に使用量が上限（WORKSPACE_QUOTA_GB）または空き容量の下限（WORKSPACE_MIN_FREE_GB）を
+  超えていれば、処理中でないジョブのファイルを最後に使用した時刻の古い順（中間ファイル→元動画の順）に削除する
+  （上限の対象は削除できる元動画と中間ファイルの合計。完成した切り抜き動画と一時ファイルは含めない）
+
+最後に使用した時刻は、キャッシュの鮮度の判定に使う更新時刻を変えないよう、アクセス時刻で記録する。
+元動画を削除したジョブは Video.original_path を消去するため、再開時はダウンロードからやり直す。
+完成した切り抜き動画（outputs/<session_id>.mp4）は削除しない。
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set
+from src.instrumentation import (WORKSPACE_USAGE_BYTES, WORKSPACE_FREE_BYTES, WORKSPACE_EVICTIONS,
+                                 WORKSPACE_EVICTED_BYTES)
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))
+UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+OUTPUT_DIR = os.path.join(BASE_DIR, 'outputs')
+
+# 一時ファイルの保存先（S3から取得したファイルとジョブごとの作業ディレクトリ）
+TMP_DIR = os.getenv('WORKSPACE_TMP_DIR', os.path.join('/tmp', 'ai-kirinuki'))
+SCRATCH_ROOT = os.path.join(TMP_DIR, 'jobs')
+
+# 作業ファイル（元動画と中間ファイル）の合計サイズの上限（GB、0の場合は無制限）
+QUOTA_BYTES = int(float(os.getenv('WORKSPACE_QUOTA_GB', '0')) * 1024 ** 3)
+
+# ディスクの空き容量の下限（GB）
+MIN_FREE_BYTES = int(float(os.getenv('WORKSPACE_MIN_FREE_GB', '1')) * 1024 ** 3)
+
+# 切り抜き動画の完成後も元動画を残すかどうか（残した場合も容量が不足すれば古い順に削除する）
+KEEP_ORIGINALS = os.getenv('WORKSPACE_KEEP_ORIGINALS', 'False').lower() in ('true', '1', 't')
+
+# ダウンロード前に確保する容量の見積もり（動画1秒あたりのバイト数）
+DOWNLOAD_BYTES_PER_SECOND = float(os.getenv('WORKSPACE_DOWNLOAD_BYTES_PER_SECOND', '500000'))
+
+# この時間（秒）更新されていない一時ファイルは、定期的な掃除で削除する
+TMP_MAX_AGE = float(os.getenv('WORKSPACE_TMP_MAX_AGE', '21600'))
+
+# 定期的な掃除の実行間隔（秒）
+CLEANUP_INTERVAL = float(os.getenv('WORKSPACE_CLEANUP_INTERVAL', '300'))
+
+# ファイル名の先頭のセッションID（uuid4）
+_SESSION_PREFIX = re.compile(r'^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})')
+
+# 削除する順（中間ファイルは元動画から作り直せるため先に削除する）
+EVICTION_ORDER = ('intermediate', 'original')
+
+# 同じプロセス内（スレッドプールのワーカー）で同時に削除しないためのロック
+_lock = threading.Lock()
+
+
+class WorkspaceFullError(Exception):
+    """処理中でないジョブのファイルを削除しても、必要な容量を確保できない"""
+
+
+def job_scratch_dir(video_id: int) -> str:
+    """ジョブ専用の作業ディレクトリ（タスクの終了時に削除される）"""
+    path = os.path.join(SCRATCH_ROOT, f'job-{video_id}')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@contextmanager
+def task_scratch(video_id: Optional[int]):
+    """タスクの実行中だけジョブ専用の作業ディレクトリを使用し、終了時（失敗時を含む）に削除する"""
+    try:
+        yield
+    finally:
+        if video_id is not None:
+            shutil.rmtree(os.path.join(SCRATCH_ROOT, f'job-{video_id}'), ignore_errors=True)
+
+
+def _path_size(path: str) -> int:
+    """ファイルまたはディレクトリの合計サイズ（途中で削除されたファイルは数えない）"""
+    try:
+        if not os.path.isdir(path):
+            return os.stat(path).st_size
+    except OSError:
+        return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _last_used(path: str) -> float:
+    """最後に使用した時刻（アクセス時刻と更新時刻の新しい方）"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 0.0
+    return max(stat.st_atime, stat.st_mtime)
+
+
+def _classify(directory: str, name: str) -> Optional[str]:
+    """作業ファイルの種類（'original', 'intermediate', 'output'。管理対象外はNone）"""
+    match = _SESSION_PREFIX.match(name)
+    if not match:
+        return None
+    session_id = match.group(1)
+    if directory == OUTPUT_DIR:
+        return 'output' if name == f'{session_id}.mp4' else 'intermediate'
+    # 2段階ダウンロードでは低画質版が元動画にあたる
+    if name in (f'{session_id}.mp4', f'{session_id}.preview.mp4'):
+        return 'original'
+    return 'intermediate'
+
+
+def list_job_files(session_ids: Optional[Iterable[str]] = None) -> List[Dict]:
+    """
+    uploads/ と outputs/ にあるジョブの作業ファイルを列挙する
+
+    Args:
+        session_ids: 対象のセッションID（Noneの場合はすべて）
+
+    Returns:
+        'path', 'session_id', 'kind', 'size', 'last_used' を含む辞書のリスト
+    """
+    wanted = set(session_ids) if session_ids is not None else None
+    entries = []
+    for directory in (UPLOAD_DIR, OUTPUT_DIR):
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            continue
+        for name in names:
+            kind = _classify(directory, name)
+            if kind is None:
+                continue
+            session_id = _SESSION_PREFIX.match(name).group(1)
+            if wanted is not None and session_id not in wanted:
+                continue
+            path = os.path.join(directory, name)
+            entries.append({
+                'path': path,
+                'session_id': session_id,
+                'kind': kind,
+                'size': _path_size(path),
+                'last_used': _last_used(path),
+            })
+    return entries
+
+
+def mark_used(session_id: str):
+    """ジョブのファイルを使用したことを記録する（更新時刻は変えずにアクセス時刻だけを更新する）"""
+    now = time.time()
+    for entry in list_job_files([session_id]):
+        try:
+            os.utime(entry['path'], (now, os.stat(entry['path']).st_mtime))
+        except OSError:
+            pass
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def disk_usage() -> Dict:
+    """作業ファイルの種類ごとの合計サイズとディスクの空き容量（メトリクスも更新する）"""
+    usage = {kind: 0 for kind in ('original', 'intermediate', 'output')}
+    for entry in list_job_files():
+        usage[entry['kind']] += entry['size']
+    usage['tmp'] = _path_size(TMP_DIR) if os.path.isdir(TMP_DIR) else 0
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    free = shutil.disk_usage(UPLOAD_DIR).free
+    for kind, size in usage.items():
+        WORKSPACE_USAGE_BYTES.labels(kind=kind).set(size)
+    WORKSPACE_FREE_BYTES.set(free)
+
+    return {
+        'usage_bytes': usage,
+        'total_bytes': sum(usage.values()),
+        # 上限の対象（削除できる種類のファイルの合計）
+        'quota_usage_bytes': sum(usage[kind] for kind in EVICTION_ORDER),
+        'free_bytes': free,
+        'quota_bytes': QUOTA_BYTES,
+        'min_free_bytes': MIN_FREE_BYTES,
+    }
+
+
+def _active_session_ids() -> Set[str]:
+    """処理中・処理待ちのジョブのセッションID（これらのファイルは削除しない）"""
+    from src.models import Video
+    from src.recovery import ACTIVE_STATUSES
+    return {session_id for (session_id,) in
+            Video.query.with_entities(Video.session_id).filter(Video.status.in_(ACTIVE_STATUSES)).all()}
+
+
+def _forget_files(session_id: str, kinds: Set[str]):
+    """削除したファイルを参照しているVideoのパスを消去する（呼び出し側でコミットする）"""
+    from src.models import Video
+    values = {}
+    if 'original' in kinds:
+        values['original_path'] = None
+    if kinds & {'original', 'intermediate'}:
+        values['proxy_path'] = None
+    if values:
+        Video.query.filter(Video.session_id == session_id).update(values, synchronize_session=False)
+
+
+def enforce_quota(required_bytes: int = 0, protect: Iterable[str] = ()) -> Dict:
+    """
+    使用量の上限と空き容量の下限を満たすまで、処理中でないジョブのファイルを古い順に削除する
+
+    Args:
+        required_bytes: これから書き込む見込みのサイズ（バイト）
+        protect: 処理中のジョブのほかに削除しないセッションID
+
+    Returns:
+        削除後のディスク使用量（disk_usage の戻り値に 'evicted_bytes' を加えたもの）
+
+    Raises:
+        WorkspaceFullError: 削除できるファイルをすべて削除しても容量が足りない場合
+    """
+    with _lock:
+        usage = disk_usage()
+        excess = max(usage['quota_usage_bytes'] + required_bytes - QUOTA_BYTES if QUOTA_BYTES > 0 else 0,
+                     MIN_FREE_BYTES + required_bytes - usage['free_bytes'])
+        evicted = 0
+        if excess > 0:
+            protected = _active_session_ids() | set(protect)
+            candidates = sorted(
+                (entry for entry in list_job_files()
+                 if entry['kind'] in EVICTION_ORDER and entry['session_id'] not in protected),
+                key=lambda entry: (EVICTION_ORDER.index(entry['kind']), entry['last_used'])
+            )
+            evicted_kinds = {}
+            for entry in candidates:
+                if evicted >= excess:
+                    break
+                try:
+                    _remove(entry['path'])
+                except OSError as e:
+                    logger.warning(f"作業ファイルの削除に失敗しました: {entry['path']}: {str(e)}")
+                    continue
+                evicted += entry['size']
+                evicted_kinds.setdefault(entry['session_id'], set()).add(entry['kind'])
+                WORKSPACE_EVICTIONS.labels(kind=entry['kind']).inc()
+                WORKSPACE_EVICTED_BYTES.labels(kind=entry['kind']).inc(entry['size'])
+                logger.info(f"容量を確保するため作業ファイルを削除しました: {entry['path']} ({entry['size']} bytes)")
+
+            for session_id, kinds in evicted_kinds.items():
+                _forget_files(session_id, kinds)
+            usage = disk_usage()
+
+        usage['evicted_bytes'] = evicted
+        if evicted < excess:
+            raise WorkspaceFullError(
+                f"作業ファイルの容量を確保できません（必要: {required_bytes} bytes, 空き: {usage['free_bytes']} bytes, "
+                f"使用量: {usage['quota_usage_bytes']} / {QUOTA_BYTES or '無制限'} bytes）"
+            )
+        return usage
+
+
+def prepare_job(video, required_bytes: int = 0) -> Dict:
+    """
+    ステージの開始前に、このジョブのファイルを使用中として記録し、必要な容量を確保する
+
+    キーワードから作成した切り抜き（派生動画）は元動画のファイルから書き出すため、元動画のファイルも保護する。
+
+    Args:
+        video: 処理するVideo
+        required_bytes: このステージで書き込む見込みのサイズ（バイト）
+    """
+    session_ids = [video.session_id]
+    if video.source_video is not None:
+        session_ids.append(video.source_video.session_id)
+    for session_id in session_ids:
+        mark_used(session_id)
+    return enforce_quota(required_bytes, protect=session_ids)
+
+
+def estimate_download_bytes(duration: Optional[float]) -> int:
+    """ダウンロードする動画のサイズの見積もり（長さが不明な場合は0）"""
+    return int((duration or 0) * DOWNLOAD_BYTES_PER_SECOND)
+
+
+def cleanup_job(video, keep_original: bool = KEEP_ORIGINALS) -> int:
+    """
+    ジョブの作業ファイル（中間ファイルと、keep_original がFalseの場合は元動画）を削除する
+
+    完成した切り抜き動画は削除しない。コミットは呼び出し側で行う。
+
+    Returns:
+        削除したバイト数
+    """
+    kinds = {'intermediate'} if keep_original else {'intermediate', 'original'}
+    removed = 0
+    removed_kinds = set()
+    for entry in list_job_files([video.session_id]):
+        if entry['kind'] not in kinds:
+            continue
+        try:
+            _remove(entry['path'])
+        except OSError as e:
+            logger.warning(f"作業ファイルの削除に失敗しました: {entry['path']}: {str(e)}")
+            continue
+        removed += entry['size']
+        removed_kinds.add(entry['kind'])
+
+    if 'original' in removed_kinds:
+        video.original_path = None
+    if removed_kinds:
+        video.proxy_path = None
+    return removed
+
+
+def cleanup_tmp(max_age: float = TMP_MAX_AGE) -> int:
+    """
+    一時ファイルの保存先から、一定時間更新されていないファイルを削除する
+
+    処理中のタスクの作業ディレクトリは、タスクの終了時に削除されるため対象外とする
+    （停止したワーカーが残したものだけが古くなる）。
+
+    Returns:
+        削除したバイト数
+    """
+    if not os.path.isdir(TMP_DIR):
+        return 0
+    threshold = time.time() - max_age
+    removed = 0
+    for root, dirs, files in os.walk(TMP_DIR, topdown=False):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+                if max(stat.st_atime, stat.st_mtime) < threshold:
+                    os.remove(path)
+                    removed += stat.st_size
+            except OSError:
+                pass
+        if root not in (TMP_DIR, SCRATCH_ROOT):
+            try:
+                if not os.listdir(root) and os.stat(root).st_mtime < threshold:
+                    os.rmdir(root)
+            except OSError:
+                pass
+    return removed
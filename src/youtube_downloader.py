@@ -1,18 +1,100 @@
 import os
 import re
-import yt_dlp
 import tempfile
 import logging
-from typing import Optional
+from typing import Dict, List, Optional
+from src.download_engine import download_media, download_sections, PREVIEW_FORMAT
 
 logger = logging.getLogger(__name__)
 
+# 動画IDを含むURL（watch?v=, youtu.be/, embed/, shorts/, live/）
+VIDEO_ID_REGEX = r'(?:https?://)?(?:www\.|m\.)?(?:youtube\.com|youtu\.be|youtube-nocookie\.com)/(?:watch\?(?:.*&)?v=|embed/|v/|shorts/|live/)?([A-Za-z0-9_-]{11})(?:[?&#]|$)'
+
+# プレイリスト・チャンネルのURL
+PLAYLIST_REGEX = r'(?:https?://)?(?:www\.|m\.)?youtube\.com/(?:playlist\?(?:.*&)?list=|channel/|c/|user/|@)'
+
 def is_valid_youtube_url(url: str) -> bool:
     """YouTubeのURLが有効かチェックする"""
     youtube_regex = r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})'
     return bool(re.match(youtube_regex, url))
 
-def download_video(youtube_url: str, download_dir: str, session_id: str, storage_manager=None) -> str:
+def extract_video_id(url: str) -> Optional[str]:
+    """URLから動画ID（11文字）を取り出す（動画のURLでない場合はNone）"""
+    match = re.match(VIDEO_ID_REGEX, url.strip())
+    return match.group(1) if match else None
+
+def is_playlist_url(url: str) -> bool:
+    """プレイリストまたはチャンネルのURLかどうか"""
+    return bool(re.match(PLAYLIST_REGEX, url.strip()))
+
+def canonical_video_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def expand_video_urls(urls: List[str], limit: int) -> List[Dict]:
+    """
+    動画・プレイリスト・チャンネルのURLを動画の一覧に展開し、動画IDで重複を除く
+
+    プレイリストとチャンネルは各動画のページを取得せず、一覧（extract_flat）だけを取得する。
+    チャンネルはタブ（動画・ライブ・ショートなど）ごとのプレイリストとして返されるため、もう1段展開する。
+
+    Args:
+        urls: 動画・プレイリスト・チャンネルのURL
+        limit: 展開する動画の最大数（超えた分は無視する）
+
+    Returns:
+        'video_id', 'youtube_url', 'title', 'duration' を含む辞書のリスト（指定順）
+    """
+    videos = {}
+
+    def add(video_id: str, title: Optional[str] = None, duration: Optional[float] = None):
+        if video_id not in videos and len(videos) < limit:
+            videos[video_id] = {
+                'video_id': video_id,
+                'youtube_url': canonical_video_url(video_id),
+                'title': title,
+                'duration': duration,
+            }
+
+    def add_entries(ydl, info: Dict, depth: int):
+        for entry in info.get('entries') or []:
+            if len(videos) >= limit:
+                return
+            if not entry:
+                continue
+            video_id = entry.get('id') if entry.get('ie_key') in (None, 'Youtube') else None
+            if video_id and re.fullmatch(r'[A-Za-z0-9_-]{11}', video_id):
+                add(video_id, entry.get('title'), entry.get('duration'))
+            elif depth > 0 and entry.get('url'):
+                add_entries(ydl, ydl.extract_info(entry['url'], download=False), depth - 1)
+
+    ydl = None
+    for url in urls:
+        if len(videos) >= limit:
+            break
+        video_id = extract_video_id(url)
+        if video_id:
+            add(video_id)
+            continue
+        if not is_playlist_url(url):
+            raise ValueError(f"無効なYouTube URLです: {url}")
+
+        if ydl is None:
+            # yt_dlpはプレイリストを展開するときにのみ読み込む
+            import yt_dlp
+            ydl = yt_dlp.YoutubeDL({
+                'quiet': True,
+                'no_warnings': True,
+                'skip_download': True,
+                'extract_flat': 'in_playlist',  # 各動画のページは取得しない
+                'playlistend': limit,
+            })
+        logger.info(f"プレイリストを展開: {url}")
+        add_entries(ydl, ydl.extract_info(url, download=False), depth=1)
+
+    return list(videos.values())
+
+def download_video(youtube_url: str, download_dir: str, session_id: str, storage_manager=None,
+                   preview: bool = False) -> str:
     """
     YouTubeの動画をダウンロードする
     
@@ -21,6 +103,7 @@ def download_video(youtube_url: str, download_dir: str, session_id: str, storage
         download_dir: ダウンロード先ディレクトリ（ローカルモード時のみ使用）
         session_id: セッションID（ファイル名生成用）
         storage_manager: ストレージマネージャー（S3対応時に使用）
+        preview: 2段階ダウンロードの1段目として、解析用の低画質版をダウンロードする
         
     Returns:
         ダウンロードしたファイルのパス
@@ -30,7 +113,7 @@ def download_video(youtube_url: str, download_dir: str, session_id: str, storage
     
     try:
         # セッションIDを使用してファイル名を生成
-        file_name = f"{session_id}.mp4"
+        file_name = f"{session_id}.preview.mp4" if preview else f"{session_id}.mp4"
         
         # S3モードかローカルモードかを判断
         use_s3 = storage_manager is not None and storage_manager.use_s3
@@ -44,22 +127,12 @@ def download_video(youtube_url: str, download_dir: str, session_id: str, storage
             # ローカルモードの場合は直接指定のディレクトリにダウンロード
             download_path = os.path.join(download_dir, file_name)
         
-        # yt-dlpのオプション設定
-        ydl_opts = {
-            'format': 'best[ext=mp4]/best',  # 最高品質のmp4を選択、なければ最高品質
-            'outtmpl': download_path,        # 出力ファイルパス
-            'quiet': False,                  # 進捗情報を表示
-            'no_warnings': False,            # 警告を表示
-            'ignoreerrors': False,           # エラーを無視しない
-            'noplaylist': True,              # プレイリストをダウンロードしない
-            'geo_bypass': True,              # 地域制限をバイパス
-            'nocheckcertificate': True,      # SSL証明書チェックを無効化
-        }
-        
-        # 動画をダウンロード
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            logger.info(f"動画のダウンロードを開始: {youtube_url}")
-            ydl.download([youtube_url])
+        # 動画をダウンロード（フラグメントの並列ダウンロード・再試行と帯域の制御はダウンロードエンジンで行う。
+        # 再試行時にダウンロード済みであればスキップ）
+        if preview:
+            download_media(youtube_url, download_path, format=PREVIEW_FORMAT)
+        else:
+            download_media(youtube_url, download_path)
         
         # ファイルが正常に作成されたか確認
         if not os.path.exists(download_path):
@@ -77,4 +150,28 @@ def download_video(youtube_url: str, download_dir: str, session_id: str, storage
     
     except Exception as e:
         logger.error(f"動画のダウンロード中にエラーが発生しました: {str(e)}")
-        raise Exception(f"動画のダウンロード中にエラーが発生しました: {str(e)}")
\ No newline at end of file
+        raise Exception(f"動画のダウンロード中にエラーが発生しました: {str(e)}")
+
+def highlight_sections_dir(download_dir: str, session_id: str) -> str:
+    """2段階ダウンロードでハイライトの区間を保存するディレクトリ"""
+    return os.path.join(download_dir, f"{session_id}_sections")
+
+def download_highlight_sections(youtube_url: str, highlights: List, download_dir: str, session_id: str) -> List[str]:
+    """
+    2段階ダウンロードの2段目として、ハイライトの区間だけを高画質でダウンロードする
+    
+    Args:
+        youtube_url: YouTubeのURL
+        highlights: ハイライト部分の開始時間と終了時間のリスト
+        download_dir: ダウンロード先ディレクトリ
+        session_id: セッションID
+        
+    Returns:
+        ハイライトごとの動画ファイルのパス（highlights と同じ順）
+    """
+    try:
+        return download_sections(youtube_url, [(start, end) for start, end in highlights],
+                                 highlight_sections_dir(download_dir, session_id))
+    except Exception as e:
+        logger.error(f"ハイライト区間のダウンロード中にエラーが発生しました: {str(e)}")
+        raise Exception(f"ハイライト区間のダウンロード中にエラーが発生しました: {str(e)}")
\ No newline at end of file